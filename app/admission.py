@@ -0,0 +1,121 @@
+"""
+This module sheds low priority requests while the database pool is saturated
+
+When checkouts have been waiting longer than a threshold, requests to the
+routes marked low priority (admin listings, diagnostics) are answered with
+503 and Retry-After before they reach the pool, leaving the connections to
+/token and /users/me instead of letting every request time out together.
+"""
+
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.responses import ORJSONResponse
+
+# (method or None for any, path, whether path is a prefix)
+Rule = Tuple[Optional[str], str, bool]
+
+
+def parse_routes(routes: Sequence[str]) -> List[Rule]:
+    """
+    This function parses route patterns such as "GET /users" or "/debug/*"
+
+    :param routes: an optional method, then a path; a trailing * makes it a prefix
+    :return: the rules
+    """
+    rules: List[Rule] = []
+    for route in routes:
+        method, _, path = route.strip().rpartition(" ")
+        prefix = path.endswith("*")
+        rules.append((method.upper() or None, path.rstrip("*"), prefix))
+    return rules
+
+
+def match_route(rules: Sequence[Rule], method: str, path: str) -> bool:
+    """
+    This function checks a request against parsed route patterns
+
+    :param rules: the rules returned by parse_routes
+    :param method:
+    :param path:
+    :return: True if any rule matches
+    """
+    return any(
+        (rule_method is None or rule_method == method)
+        and (path.startswith(rule_path) if prefix else path == rule_path)
+        for rule_method, rule_path, prefix in rules
+    )
+
+
+class AdmissionController:
+    """
+    This class decides which requests are shed
+    """
+
+    def __init__(
+        self,
+        routes: Sequence[str],
+        threshold: float,
+        pressure: Callable[[], float],
+        retry_after: int = 5,
+    ) -> None:
+        self.rules = parse_routes(routes)
+        self.threshold = threshold
+        self.pressure = pressure
+        self.retry_after = retry_after
+        self.shed = 0
+
+    def is_low_priority(self, method: str, path: str) -> bool:
+        """
+        This function checks whether a request may be shed
+
+        :param method:
+        :param path:
+        :return:
+        """
+        return match_route(self.rules, method, path)
+
+    def should_shed(self, method: str, path: str) -> bool:
+        """
+        This function checks whether a request is shed now
+
+        The pool is only looked at for low priority requests, and never
+        when shedding is disabled with a threshold of 0.
+
+        :param method:
+        :param path:
+        :return:
+        """
+        if self.threshold <= 0 or not self.is_low_priority(method, path):
+            return False
+
+        if self.pressure() <= self.threshold:
+            return False
+
+        self.shed += 1
+        return True
+
+
+class AdmissionMiddleware:  # pylint: disable=too-few-public-methods
+    """
+    This class answers shed requests with 503 and Retry-After
+    """
+
+    def __init__(self, app: ASGIApp, controller: AdmissionController) -> None:
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and self.controller.should_shed(
+            scope["method"], scope["path"]
+        ):
+            response = ORJSONResponse(
+                {"detail": "Server busy, retry later"},
+                status_code=503,
+                headers={"Retry-After": str(self.controller.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
@@ -0,0 +1,185 @@
+"""
+This module contains the audit log
+
+Routes record events into a bounded in-memory queue, which costs an append;
+a scheduled job drains the queue in batches into a sink, either the
+audit_events table or a rotating JSON lines file. When the sink falls behind
+and the queue is full, new events are dropped and counted rather than
+slowing requests down.
+"""
+
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import asdict
+from threading import Lock
+from typing import Deque, Dict, List, Optional, Sequence
+
+import orjson
+from sqlalchemy.engine import Engine
+
+from app.models.audit import AuditEvent, DBAuditEvent
+
+logger = logging.getLogger(__name__)
+
+SUCCESS = "success"
+FAILURE = "failure"
+
+
+class AuditSink(ABC):
+    """
+    This class is the interface of the places audit events are written to
+    """
+
+    @abstractmethod
+    def write(self, events: Sequence[AuditEvent]) -> None:
+        """
+        Write a batch of events
+
+        :param events: the events, oldest first
+        """
+
+
+class DatabaseAuditSink(AuditSink):
+    """
+    This class writes audit events to the audit_events table
+    """
+
+    def __init__(self, engine: Engine) -> None:
+        self.engine = engine
+
+    def write(self, events: Sequence[AuditEvent]) -> None:
+        """
+        Write a batch of events with a single multi-row INSERT
+
+        :param events: the events, oldest first
+        """
+        table = DBAuditEvent.__table__  # type: ignore[attr-defined]
+        with self.engine.begin() as connection:
+            connection.execute(table.insert(), [asdict(event) for event in events])
+
+
+class JSONLinesAuditSink(AuditSink):
+    """
+    This class appends audit events to a JSON lines file
+
+    The file is rotated to path.1, path.2, ... once it reaches max_bytes.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 100_000_000, backups: int = 5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+
+    def _rotate(self) -> None:
+        """
+        Shift the backups up by one and start a new file
+        """
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def write(self, events: Sequence[AuditEvent]) -> None:
+        """
+        Append a batch of events, one JSON document per line
+
+        :param events: the events, oldest first
+        """
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            self._rotate()
+
+        lines = b"".join(orjson.dumps(event) + b"\n" for event in events)
+        with open(self.path, "ab") as file:
+            file.write(lines)
+
+
+class AuditLog:  # pylint: disable=too-many-instance-attributes
+    """
+    This class queues audit events and flushes them to a sink in batches
+    """
+
+    def __init__(
+        self, sink: AuditSink, maxsize: int = 10_000, batch_size: int = 500
+    ) -> None:
+        self.sink = sink
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self._queue: Deque[AuditEvent] = deque()
+        self._flush_lock = Lock()
+        self.recorded = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def record(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        action: str,
+        outcome: str = SUCCESS,
+        actor: Optional[str] = None,
+        target: Optional[str] = None,
+        detail: Optional[str] = None,
+    ) -> None:
+        """
+        Queue an audit event, dropping it if the queue is full
+
+        :param action: what happened, e.g. "token.issue"
+        :param outcome: success or failure
+        :param actor: the username acting
+        :param target: what was acted on, e.g. the user id
+        :param detail: anything else worth keeping
+        """
+        if len(self._queue) >= self.maxsize:
+            self.dropped += 1
+            return
+
+        self._queue.append(
+            AuditEvent(time.time(), action, outcome, actor, target, detail)
+        )
+        self.recorded += 1
+
+    def flush(self) -> int:
+        """
+        Write every queued event to the sink, batch_size at a time
+
+        A batch the sink rejects is lost and counted as failed, so a broken
+        sink cannot fill the queue and start dropping new events.
+
+        :return: the number of events written
+        """
+        written = 0
+        with self._flush_lock:
+            while self._queue:
+                batch: List[AuditEvent] = []
+                while self._queue and len(batch) < self.batch_size:
+                    batch.append(self._queue.popleft())
+                try:
+                    self.sink.write(batch)
+                except Exception:  # pylint: disable=broad-exception-caught
+                    self.failed += len(batch)
+                    logger.exception("Writing %d audit events failed", len(batch))
+                else:
+                    written += len(batch)
+
+        self.written += written
+        return written
+
+    def metrics(self) -> Dict[str, int]:
+        """
+        Report the counters of the audit log
+
+        :return:
+        """
+        return {
+            "queued": len(self._queue),
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+        }
@@ -1,17 +1,320 @@
 """
 This module loads the application settings
+
+The settings are read from the environment and .env once, validated into an
+immutable Settings object, and exported as module constants for the code
+that reads them at import time. Those are structural: changing them needs a
+restart. The RELOADABLE ones are read through get_settings() instead and
+pick up a new value when the process receives SIGHUP.
 """
 
-import os
+import logging
+from datetime import timedelta
+from functools import cached_property
+from typing import Any, Dict, FrozenSet, List, Literal, Optional
+
+from pydantic import Field, SecretStr, field_validator
+from pydantic_settings import BaseSettings, NoDecode, SettingsConfigDict
+from sqlalchemy.engine import make_url
+from typing_extensions import Annotated
+
+from app.exceptions import ConfigurationError
+
+logger = logging.getLogger(__name__)
+
+Algorithm = Literal[
+    "HS256", "HS384", "HS512", "RS256", "RS384", "RS512", "ES256", "ES384", "ES512"
+]
+
+
+class Settings(BaseSettings):  # pylint: disable=too-many-instance-attributes
+    """
+    The validated settings of the application
+    """
+
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore", frozen=True)
+
+    # > openssl rand -hex 32
+    secret_key: SecretStr = SecretStr("")
+    algorithm: Algorithm = "HS256"
+    access_token_expire_minutes: float = Field(default=30, gt=0)
+    echo_sql: bool = False
+    database_url: str = ""
+    base_url: Optional[str] = None
+    authorization_code_expire_seconds: float = Field(default=60, gt=0)
+    # memory (single node) or database (shared between nodes)
+    authorization_code_store: Literal["memory", "database"] = "memory"
+    # Number of verified access tokens kept per realm in each worker
+    token_cache_size: int = Field(default=10000, ge=0)
+    # Connections kept open per engine, extra ones opened under load and
+    # seconds a request waits for a connection before failing
+    database_pool_size: int = Field(default=5, ge=1)
+    database_max_overflow: int = Field(default=10, ge=0)
+    database_pool_timeout: float = Field(default=30, gt=0)
+    # Milliseconds checkouts may wait before the SHED_ROUTES ("METHOD /path",
+    # a trailing * matches a prefix) get 503 and Retry-After (0 disables it)
+    shed_wait_ms: float = Field(default=250, ge=0)
+    shed_routes: Annotated[List[str], NoDecode] = [
+        "GET /users",
+        "GET /clients",
+        "/debug/*",
+    ]
+    shed_retry_after_seconds: int = Field(default=5, ge=1)
+    # Threads and pooled connections reserved for the auth lane (token,
+    # authorize, register, userinfo) and the admin lane (/users, /clients);
+    # a lane pool size of 0 shares the main pool
+    auth_lane_workers: int = Field(default=16, ge=1)
+    auth_lane_pool_size: int = Field(default=5, ge=0)
+    admin_lane_workers: int = Field(default=4, ge=1)
+    admin_lane_pool_size: int = Field(default=2, ge=0)
+    # Comma separated read replica URLs, reads fall back to DATABASE_URL
+    database_read_urls: Annotated[List[str], NoDecode] = []
+    # Seconds a failed replica is skipped before it is tried again
+    replica_retry_seconds: float = 30
+    # Trust the user claims embedded in access tokens instead of loading the user
+    stateless_tokens: bool = False
+    # Seconds a user's security stamp is trusted before it is re-read
+    security_stamp_cache_seconds: float = Field(default=30, ge=0)
+    # JWT implementation used to issue tokens: "builtin" (cached signer) or "jose"
+    jwt_backend: Literal["builtin", "jose"] = "builtin"
+    # Expected iss and aud claims of access tokens, checked when set
+    token_issuer: Optional[str] = None
+    token_audience: Optional[str] = None
+    # Seconds of clock skew tolerated when checking exp and nbf
+    token_leeway_seconds: float = Field(default=0, ge=0)
+    # Seconds a user snapshot is served from the per-worker cache (0 disables it)
+    user_cache_seconds: float = Field(default=0, ge=0)
+    # Seconds a client snapshot is served from the per-worker cache, bounding
+    # how long other workers use a changed or deleted client without the
+    # change feed (0 disables it)
+    client_cache_seconds: float = Field(default=30, ge=0)
+    # Snapshot cache shared by the workers: "memory" (per worker) or "redis"
+    cache_backend: Literal["memory", "redis"] = "memory"
+    cache_url: str = "redis://localhost:6379/0"
+    # Write committed changes to the change_events table and poll it, so
+    # caches on other nodes drop what changed
+    change_feed: bool = False
+    change_feed_poll_seconds: float = Field(default=1, gt=0)
+    # Serve /debug/profile (admin scope) to sample the stacks of a running worker
+    profiling_enabled: bool = False
+    profile_max_seconds: float = Field(default=60, gt=0)
+    # Access token format issued by /token: "jwt" or "opaque" (server side record)
+    token_format: Literal["jwt", "opaque"] = "jwt"
+    # Number of opaque tokens kept per realm in the in-memory tier of each worker
+    opaque_token_cache_size: int = Field(default=100000, ge=0)
+    # Background purge of expired tokens, codes and change events: seconds
+    # between runs, rows per batch, pause between batches and batches per run
+    sweep_interval_seconds: float = Field(default=60, gt=0)
+    sweep_batch_size: int = Field(default=500, gt=0)
+    sweep_batch_pause_seconds: float = Field(default=0.05, ge=0)
+    sweep_max_batches: int = Field(default=100, gt=0)
+    # Seconds change events are kept for the change feed
+    change_event_retention_seconds: float = Field(default=3600, gt=0)
+    # Audit log: "database" (audit_events table) or "jsonl" (rotating AUDIT_FILE)
+    audit_sink: Literal["database", "jsonl"] = "database"
+    audit_file: str = "audit.jsonl"
+    audit_file_max_bytes: int = Field(default=100000000, gt=0)
+    # Events queued per worker before new ones are dropped, and the flush cadence
+    audit_queue_size: int = Field(default=10000, gt=0)
+    audit_batch_size: int = Field(default=500, gt=0)
+    audit_flush_seconds: float = Field(default=1, gt=0)
+    # Realms (tenants) served, selected per request by the X-Realm header
+    realms: Annotated[List[str], NoDecode] = ["default"]
+    # Comma separated realm:key pairs; other realms derive their HMAC key
+    # from SECRET_KEY
+    realm_secret_keys: Annotated[Dict[str, str], NoDecode] = {}
+    # Seconds clients may cache the OpenID discovery document and the JWKS
+    discovery_max_age_seconds: int = Field(default=86400, ge=0)
+    # Seconds clients may cache the public metadata of /clients/{id} before
+    # revalidating it with its ETag
+    client_metadata_max_age_seconds: int = Field(default=60, ge=0)
+    # Production mode: no Swagger UI or ReDoc, and /openapi.json only serves the
+    # schema exported at build time to OPENAPI_FILE (disabled when it is unset)
+    production: bool = False
+    openapi_file: Optional[str] = None
+
+    @field_validator("database_read_urls", "realms", "shed_routes", mode="before")
+    @classmethod
+    def _split(cls, value: Any) -> Any:
+        """
+        Split a comma separated list, dropping blanks
+        """
+        if isinstance(value, str):
+            return [item.strip() for item in value.split(",") if item.strip()]
+        return value
+
+    @field_validator("realm_secret_keys", mode="before")
+    @classmethod
+    def _split_pairs(cls, value: Any) -> Any:
+        """
+        Split comma separated name:value pairs
+        """
+        if isinstance(value, str):
+            return dict(
+                pair.strip().split(":", 1) for pair in value.split(",") if ":" in pair
+            )
+        return value
+
+    @field_validator("base_url", "token_issuer", "token_audience", "openapi_file")
+    @classmethod
+    def _blank_is_unset(cls, value: Optional[str]) -> Optional[str]:
+        """
+        Treat an empty value as unset
+        """
+        return value or None
+
+    @cached_property
+    def access_token_expires(self) -> timedelta:
+        """
+        The lifetime of access and ID tokens
+        """
+        return timedelta(minutes=self.access_token_expire_minutes)
+
+    @cached_property
+    def engine_options(self) -> Dict[str, Any]:
+        """
+        The keyword arguments of create_engine for DATABASE_URL
+
+        In-memory SQLite keeps a single connection and takes no pool sizes.
+        """
+        options: Dict[str, Any] = {"echo": self.echo_sql}
+        if not self.database_url:
+            return options
+
+        url = make_url(self.database_url)
+        if url.get_backend_name() == "sqlite" and url.database in (
+            None,
+            "",
+            ":memory:",
+        ):
+            return options
+
+        options.update(
+            pool_size=self.database_pool_size,
+            max_overflow=self.database_max_overflow,
+            pool_timeout=self.database_pool_timeout,
+        )
+        return options
+
+    def check(self) -> None:
+        """
+        Fail unless the settings a server needs are present
+
+        :raises ConfigurationError: naming every missing setting
+        """
+        missing = [
+            name.upper()
+            for name, value in (
+                ("secret_key", self.secret_key.get_secret_value()),
+                ("database_url", self.database_url),
+            )
+            if not value
+        ]
+        if missing:
+            raise ConfigurationError(f"Missing settings: {', '.join(missing)}")
+
+
+# Settings applied by reload_settings() without a restart
+RELOADABLE: FrozenSet[str] = frozenset(
+    {
+        "access_token_expire_minutes",
+        "authorization_code_expire_seconds",
+        "security_stamp_cache_seconds",
+        "token_leeway_seconds",
+        "discovery_max_age_seconds",
+        "client_metadata_max_age_seconds",
+    }
+)
+
+_settings = Settings()
+
+
+def get_settings() -> Settings:
+    """
+    This function returns the current settings
+
+    :return:
+    """
+    return _settings
+
+
+def reload_settings() -> Settings:
+    """
+    This function re-reads the environment and .env and applies the
+    reloadable settings
+
+    Other changes are logged and left for the next restart, and invalid
+    settings are logged and ignored, so a bad edit cannot take a running
+    server down.
+
+    :return: the settings now in effect
+    """
+    global _settings  # pylint: disable=global-statement
+    try:
+        loaded = Settings()
+    except ValueError:
+        logger.exception("Settings not reloaded")
+        return _settings
+
+    current = _settings.model_dump()
+    changed = {
+        name: value
+        for name, value in loaded.model_dump().items()
+        if value != current[name]
+    }
+    ignored = sorted(changed.keys() - RELOADABLE)
+    if ignored:
+        logger.warning("Restart to apply: %s", ", ".join(ignored).upper())
 
-from dotenv import load_dotenv
+    applied = {name: changed[name] for name in changed.keys() & RELOADABLE}
+    if applied:
+        _settings = Settings(**{**current, **applied})
+        logger.info("Settings reloaded: %s", ", ".join(sorted(applied)).upper())
+    return _settings
 
-load_dotenv()
 
-# > openssl rand -hex 32
-SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = os.getenv("ALGORITHM")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
-ECHO_SQL = os.getenv("ECHO_SQL", "false").lower() == "true"
-DATABASE_URL = os.getenv("DATABASE_URL")
-BASE_URL = os.getenv("BASE_URL")
+SECRET_KEY = _settings.secret_key.get_secret_value()
+ALGORITHM: str = _settings.algorithm
+ECHO_SQL = _settings.echo_sql
+DATABASE_URL = _settings.database_url
+BASE_URL = _settings.base_url
+AUTHORIZATION_CODE_STORE = _settings.authorization_code_store
+TOKEN_CACHE_SIZE = _settings.token_cache_size
+DATABASE_READ_URLS = _settings.database_read_urls
+SHED_WAIT_MS = _settings.shed_wait_ms
+SHED_ROUTES = _settings.shed_routes
+SHED_RETRY_AFTER_SECONDS = _settings.shed_retry_after_seconds
+AUTH_LANE_WORKERS = _settings.auth_lane_workers
+AUTH_LANE_POOL_SIZE = _settings.auth_lane_pool_size
+ADMIN_LANE_WORKERS = _settings.admin_lane_workers
+ADMIN_LANE_POOL_SIZE = _settings.admin_lane_pool_size
+REPLICA_RETRY_SECONDS = _settings.replica_retry_seconds
+STATELESS_TOKENS = _settings.stateless_tokens
+JWT_BACKEND = _settings.jwt_backend
+TOKEN_ISSUER = _settings.token_issuer
+TOKEN_AUDIENCE = _settings.token_audience
+USER_CACHE_SECONDS = _settings.user_cache_seconds
+CLIENT_CACHE_SECONDS = _settings.client_cache_seconds
+CACHE_BACKEND = _settings.cache_backend
+CACHE_URL = _settings.cache_url
+CHANGE_FEED = _settings.change_feed
+CHANGE_FEED_POLL_SECONDS = _settings.change_feed_poll_seconds
+PROFILING_ENABLED = _settings.profiling_enabled
+PROFILE_MAX_SECONDS = _settings.profile_max_seconds
+TOKEN_FORMAT = _settings.token_format
+OPAQUE_TOKEN_CACHE_SIZE = _settings.opaque_token_cache_size
+SWEEP_INTERVAL_SECONDS = _settings.sweep_interval_seconds
+SWEEP_BATCH_SIZE = _settings.sweep_batch_size
+SWEEP_BATCH_PAUSE_SECONDS = _settings.sweep_batch_pause_seconds
+SWEEP_MAX_BATCHES = _settings.sweep_max_batches
+CHANGE_EVENT_RETENTION_SECONDS = _settings.change_event_retention_seconds
+AUDIT_SINK = _settings.audit_sink
+AUDIT_FILE = _settings.audit_file
+AUDIT_FILE_MAX_BYTES = _settings.audit_file_max_bytes
+AUDIT_QUEUE_SIZE = _settings.audit_queue_size
+AUDIT_BATCH_SIZE = _settings.audit_batch_size
+AUDIT_FLUSH_SECONDS = _settings.audit_flush_seconds
+REALMS = _settings.realms
+REALM_SECRET_KEYS = _settings.realm_secret_keys
+PRODUCTION = _settings.production
+OPENAPI_FILE = _settings.openapi_file
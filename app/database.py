@@ -4,9 +4,9 @@ This module contains the database configuration
 
 from fastapi import FastAPI
 from sqlalchemy.ext.declarative import declarative_base
-from sqlmodel import SQLModel
 
 from app.dependencies import get_engine
+from app.migrations import upgrade_schema
 
 HPW = "$2b$12$MsIdruNFD1BNSED.xG7K1OZTMyg7jNqqGE1T6BxDQwkIv3KhkSGLO"
 
@@ -14,4 +14,4 @@ Base = declarative_base()
 
 
 def init_db(api_app: FastAPI) -> None:  # noqa: C901
-    SQLModel.metadata.create_all(get_engine(), checkfirst=True)
+    upgrade_schema(get_engine())
@@ -2,68 +2,275 @@
 This file contains the dependencies for the FastAPI application.
 """
 
-from typing import Generator
+import time
+from functools import lru_cache
+from typing import Any, Callable, Dict, Generator, List, Optional
 
-from fastapi import Depends, HTTPException, status
-from jose import JWTError, jwt
+from fastapi import Depends, Header, HTTPException, Security, status
+from fastapi.security import SecurityScopes
 from sqlalchemy.engine import Engine
 from sqlmodel import Session, create_engine
 
-from app.conf import ALGORITHM, DATABASE_URL, ECHO_SQL, SECRET_KEY
-from app.models.token import TokenData
-from app.models.user import DBUser
+from app.admission import AdmissionController
+from app.audit import AuditLog, AuditSink, DatabaseAuditSink, JSONLinesAuditSink
+from app.conf import (
+    ALGORITHM,
+    AUDIT_BATCH_SIZE,
+    AUDIT_FILE,
+    AUDIT_FILE_MAX_BYTES,
+    AUDIT_QUEUE_SIZE,
+    AUDIT_SINK,
+    AUTHORIZATION_CODE_STORE,
+    DATABASE_READ_URLS,
+    DATABASE_URL,
+    ECHO_SQL,
+    OPAQUE_TOKEN_CACHE_SIZE,
+    REPLICA_RETRY_SECONDS,
+    SECRET_KEY,
+    SHED_RETRY_AFTER_SECONDS,
+    SHED_ROUTES,
+    SHED_WAIT_MS,
+    STATELESS_TOKENS,
+    TOKEN_AUDIENCE,
+    TOKEN_CACHE_SIZE,
+    TOKEN_ISSUER,
+    get_settings,
+)
+from app.lanes import current_lane, in_lane, lanes
+from app.models.token import Claims
+from app.models.user import UserSnapshot
+from app.pool import MonitoredQueuePool, PoolMonitor, queue_pool_metrics
+from app.realms import DEFAULT_REALM, is_realm
+from app.replicas import ReplicaSet, RoutingSession
 from app.repositories.client import ClientRepository
 from app.repositories.user import UserRepository
+from app.scopes import parse_scopes
 from app.services.client import ClientService
 from app.services.user import UserService
+from app.stores.codes import (
+    AuthorizationCodeStore,
+    DatabaseAuthorizationCodeStore,
+    InMemoryAuthorizationCodeStore,
+)
+from app.stores.tokens import OpaqueTokenStore
+from app.tokens import get_verifier
 from app.utils import oauth2_scheme
 
 
+@lru_cache(maxsize=1)
 def get_engine() -> Engine:
     """
     This function creates a SQLAlchemy engine using the database URL from the environment variable.
     The engine is used to connect to the database and execute SQL queries.
     The echo parameter is set to True to log all SQL queries to the console.
     This is useful for debugging purposes.
+    The engine, and with it the connection pool, is created once per process
+    and sized by DATABASE_POOL_SIZE, DATABASE_MAX_OVERFLOW and DATABASE_POOL_TIMEOUT.
+    A sized pool times its checkouts, see pool_metrics.
     :return: SQLAlchemy engine
     """
     database_url = DATABASE_URL
     if not database_url:
         raise ValueError("DATABASE_URL environment variable is not set")
 
-    echo_sql = ECHO_SQL
+    options = get_settings().engine_options
+    if "pool_size" in options:
+        options = {**options, "poolclass": MonitoredQueuePool}
 
-    return create_engine(database_url, echo=echo_sql)
+    return create_engine(database_url, **options)
+
+
+@lru_cache(maxsize=None)
+def get_lane_engine(name: str, pool_size: int) -> Engine:
+    """
+    This function creates the engine of a lane with its own pool partition.
+
+    The partition holds pool_size connections and never overflows, so a
+    lane cannot take connections from another. A database that takes no
+    pool sizes (in-memory SQLite) is shared with the primary engine.
+
+    :param name: the lane, for the cache
+    :param pool_size: connections reserved for the lane
+    :return: SQLAlchemy engine
+    """
+    options = get_settings().engine_options
+    if "pool_size" not in options:
+        return get_engine()
+
+    options = {
+        **options,
+        "pool_size": pool_size,
+        "max_overflow": 0,
+        "poolclass": MonitoredQueuePool,
+    }
+    return create_engine(DATABASE_URL, **options)
+
+
+def get_request_engine() -> Engine:
+    """
+    This function returns the engine of the lane handling the request.
+
+    :return: the lane engine, or the primary engine outside a partitioned lane
+    """
+    lane = current_lane.get()
+    if lane is None or not lane.pool_size:
+        return get_engine()
+    return get_lane_engine(lane.name, lane.pool_size)
+
+
+def get_pool_monitors() -> List[PoolMonitor]:
+    """
+    This function returns the checkout monitors of the primary pool and of
+    the pool partition of every lane.
+
+    :return: the monitors of the monitored pools
+    """
+    engines = [get_engine()] + [
+        get_lane_engine(lane.name, lane.pool_size) for lane in lanes if lane.pool_size
+    ]
+    monitors: List[PoolMonitor] = []
+    for engine in engines:
+        monitor = getattr(engine.pool, "monitor", None)
+        if monitor is not None and monitor not in monitors:
+            monitors.append(monitor)
+    return monitors
+
+
+def pool_pressure() -> float:
+    """
+    This function reports how long checkouts waited lately, in the most
+    contended of the primary pool and the lane partitions.
+
+    Logins check connections out of the auth lane partition, so the lanes
+    must count or shedding would never start under the default lanes.
+
+    :return: seconds, 0 if no pool is monitored
+    """
+    return max((monitor.pressure() for monitor in get_pool_monitors()), default=0.0)
+
+
+def pool_metrics() -> Dict[str, Any]:
+    """
+    This function reports the size, connections in use, overflow and
+    checkout waits of the primary pool, with the load of every lane and of
+    its pool partition.
+
+    :return:
+    """
+    metrics = queue_pool_metrics(get_engine().pool)
+    lanes_metrics: Dict[str, Dict[str, Any]] = {}
+    for name, lane in lanes.metrics().items():
+        lanes_metrics[name] = lane
+        if lane["pool_size"]:
+            engine = get_lane_engine(name, lane["pool_size"])
+            lanes_metrics[name] = {**lane, "pool": queue_pool_metrics(engine.pool)}
+    metrics["lanes"] = lanes_metrics
+    return metrics
+
+
+@lru_cache(maxsize=1)
+def get_admission_controller() -> AdmissionController:
+    """
+    This function returns the process wide admission controller.
+
+    :return:
+    """
+    return AdmissionController(
+        SHED_ROUTES, SHED_WAIT_MS / 1000, pool_pressure, SHED_RETRY_AFTER_SECONDS
+    )
+
+
+@lru_cache(maxsize=1)
+def get_replica_set() -> ReplicaSet:
+    """
+    This function creates the engines of the read replicas once per process.
+
+    :return: the replica set, empty when DATABASE_READ_URLS is not set
+    """
+    return ReplicaSet(
+        [create_engine(url, echo=ECHO_SQL) for url in DATABASE_READ_URLS],
+        retry_after=REPLICA_RETRY_SECONDS,
+    )
 
 
 def get_session() -> Generator[Session, None, None]:
     """
-    This function gets the session
+    This function gets the session of the current request
+
+    FastAPI caches dependencies per request, so every repository resolved
+    while handling a request shares this session: one connection checkout
+    and one transaction per request. Objects stay loaded after a commit
+    so routes can serialize them without another round trip.
+
+    Reads go to a read replica until the session writes, after which the
+    request sticks to the primary.
+
+    Requests in a lane with a pool partition write through the engine of
+    the lane.
 
     :return:
     """
-    with Session(get_engine()) as session:
+    with RoutingSession(
+        get_request_engine(), get_replica_set(), expire_on_commit=False
+    ) as session:
         yield session
 
 
-def get_client_repository(engine_obj: Engine = Depends(get_engine)) -> ClientRepository:
+def use_primary(session: Session = Depends(get_session)) -> None:
+    """
+    This function pins the request session to the primary.
+
+    Use it on routes that read before writing and cannot tolerate
+    replication lag, e.g. uniqueness checks before an insert.
+
+    :param session:
+    """
+    if isinstance(session, RoutingSession):
+        session.use_primary()
+
+
+def get_realm(x_realm: Optional[str] = Header(None)) -> str:
+    """
+    This function gets the realm (tenant) of the request from X-Realm.
+
+    :param x_realm:
+    :return: the realm, the default realm when the header is absent
+    """
+    if x_realm is None:
+        return DEFAULT_REALM
+
+    if not is_realm(x_realm):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Unknown realm"
+        )
+
+    return x_realm
+
+
+def get_client_repository(
+    session: Session = Depends(get_session), realm: str = Depends(get_realm)
+) -> ClientRepository:
     """
     This function creates and returns a ClientRepository instance.
 
-    :param engine_obj:
+    :param session:
+    :param realm:
     :return:
     """
-    return ClientRepository(engine_obj)
+    return ClientRepository(session, realm)
 
 
-def get_user_repository(engine_obj: Engine = Depends(get_engine)) -> UserRepository:
+def get_user_repository(
+    session: Session = Depends(get_session), realm: str = Depends(get_realm)
+) -> UserRepository:
     """
     This function creates and returns a UserRepository instance.
 
-    :param engine_obj:
+    :param session:
+    :param realm:
     :return:
     """
-    return UserRepository(engine_obj)
+    return UserRepository(session, realm)
 
 
 def get_client_service(
@@ -90,15 +297,155 @@ def get_user_service(
     return UserService(user_repository)
 
 
-async def get_current_user(
+@lru_cache(maxsize=1)
+def get_authorization_code_store() -> AuthorizationCodeStore:
+    """
+    This function returns the process wide authorization code store.
+
+    :return:
+    """
+    if AUTHORIZATION_CODE_STORE == "database":
+        return DatabaseAuthorizationCodeStore(get_engine())
+
+    return InMemoryAuthorizationCodeStore()
+
+
+@lru_cache(maxsize=1)
+def get_audit_log() -> AuditLog:
+    """
+    This function returns the process wide audit log.
+
+    :return:
+    """
+    sink: AuditSink
+    if AUDIT_SINK == "jsonl":
+        sink = JSONLinesAuditSink(AUDIT_FILE, AUDIT_FILE_MAX_BYTES)
+    else:
+        sink = DatabaseAuditSink(get_engine())
+
+    return AuditLog(sink, AUDIT_QUEUE_SIZE, AUDIT_BATCH_SIZE)
+
+
+@lru_cache(maxsize=1)
+def get_token_store() -> OpaqueTokenStore:
+    """
+    This function returns the process wide opaque token store.
+
+    :return:
+    """
+    return OpaqueTokenStore(get_engine(), OPAQUE_TOKEN_CACHE_SIZE)
+
+
+@lru_cache(maxsize=None)
+def get_token_cache(realm: str) -> Callable[[str], Optional[Claims]]:
+    """
+    This function returns the verified token cache of a realm.
+
+    Every realm gets a cache of TOKEN_CACHE_SIZE tokens, created on first
+    use, so tokens sent to a busy realm cannot evict another's.
+
+    :param realm:
+    :return: the cached decode of the token verifier
+    """
+    verifier = get_verifier(SECRET_KEY, ALGORITHM, TOKEN_ISSUER, TOKEN_AUDIENCE)
+    return lru_cache(maxsize=TOKEN_CACHE_SIZE)(verifier.decode)
+
+
+def verify_token(token: str, realm: str = DEFAULT_REALM) -> Optional[Claims]:
+    """
+    This function verifies an access token and extracts its claims.
+
+    Results are cached per token in the cache of the realm the token is
+    sent to, so the signature check and the scope parsing happen once per
+    token instead of once per request. The time window is re-checked by
+    the caller because a cached token outlives its decode.
+
+    :param token:
+    :param realm: the realm of the request
+    :return: the claims or None if the token is invalid
+    """
+    return get_token_cache(realm)(token)
+
+
+def user_from_claims(claims: Claims, service: UserService) -> Optional[UserSnapshot]:
+    """
+    This function builds the current user from the claims of a stateless token.
+
+    Instead of loading the user, only its security stamp is compared, and
+    that comes from a short lived cache, so a password change, a disable or
+    a scope change revokes the token within SECURITY_STAMP_CACHE_SECONDS.
+
+    :param claims:
+    :param service:
+    :return: the user or None if the token was revoked
+    """
+    if claims.uid is None or claims.email is None or claims.stamp is None:
+        return None
+
+    if service.read_security_stamp(claims.uid) != claims.stamp:
+        return None
+
+    return UserSnapshot(
+        id=claims.uid,
+        username=claims.sub,
+        email=claims.email,
+        disabled=claims.disabled,
+        scopes=tuple(sorted(claims.scopes)),
+        security_stamp=claims.stamp,
+    )
+
+
+def read_token_claims(
+    token: str, token_store: OpaqueTokenStore, realm: str
+) -> Optional[Claims]:
+    """
+    This function reads the claims of an access token sent to a realm.
+
+    A JWT always has dots in it, a token without them is an opaque handle.
+    Tokens are only accepted in the realm they were issued for.
+
+    :param token:
+    :param token_store:
+    :param realm: the realm of the request
+    :return: the claims or None if the token is invalid, expired or of another realm
+    """
+    if "." in token:
+        claims = verify_token(token, realm)
+    else:
+        claims = token_store.lookup(token, realm)
+
+    if (
+        claims is None
+        or claims.realm != realm
+        or not claims.is_current(time.time(), get_settings().token_leeway_seconds)
+    ):
+        return None
+
+    return claims
+
+
+@in_lane
+def get_current_user(
+    security_scopes: SecurityScopes,
     token: str = Depends(oauth2_scheme),
     service: UserService = Depends(get_user_service),
-) -> DBUser:
+    token_store: OpaqueTokenStore = Depends(get_token_store),
+    realm: str = Depends(get_realm),
+) -> UserSnapshot:
     """
     This function gets the current user
 
+    Looking up the token and the user may wait for a connection, so this
+    runs on the threads of the request's lane instead of on the event loop.
+    The connection goes back to the pool before the endpoint waits for a
+    lane thread; otherwise requests holding connections would queue behind
+    lookups blocked on those same connections.
+
+    :param security_scopes:
     :param token:
     :param service:
+    :param token_store:
+    :param realm:
     :return:
     """
     credential_exception = HTTPException(
@@ -107,20 +454,23 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-
-        if username is None:
-            raise credential_exception
+    claims = read_token_claims(token, token_store, realm)
+    if claims is None:
+        raise credential_exception
 
-        token_data = TokenData()
-        token_data.username = username
-    except JWTError as err:
-        raise credential_exception from err
+    if not parse_scopes(security_scopes.scope_str) <= claims.scopes:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions",
+            headers={"WWW-Authenticate": f'Bearer scope="{security_scopes.scope_str}"'},
+        )
 
-    user = service.read_by_username(username=token_data.username)
+    if STATELESS_TOKENS and claims.uid is not None:
+        user = user_from_claims(claims, service)
+    else:
+        user = service.read_snapshot(claims.sub)
 
+    service.release_connection()
     if user is None:
         raise credential_exception
 
@@ -128,8 +478,8 @@ async def get_current_user(
 
 
 async def get_current_active_user(
-    current_user: DBUser = Depends(get_current_user),
-) -> DBUser:
+    current_user: UserSnapshot = Security(get_current_user),
+) -> UserSnapshot:
     """
     This function gets the current active user
 
@@ -0,0 +1,300 @@
+"""
+This module contains the in-process event bus for committed changes
+
+Repositories emit typed change events while they write; the events are
+published once the session commits and dropped if it rolls back, so a
+subscriber never reacts to a change that did not happen. With
+CHANGE_FEED enabled the events are also written to the change_events
+table in the same transaction, and a ChangeFeedPoller on every node
+publishes the events written by other processes.
+"""
+
+import logging
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Protocol, Type, TypeVar
+
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlmodel import col
+
+from app.conf import CHANGE_FEED
+from app.models.event import DBChangeEvent
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process in the change feed
+ORIGIN = uuid.uuid4().hex
+
+PENDING_EVENTS = "pending_events"
+
+
+@dataclass(frozen=True, slots=True)
+class ChangeEvent:
+    """
+    A committed change to the row with primary key uid
+    """
+
+    uid: int
+
+
+@dataclass(frozen=True, slots=True)
+class UserChanged(ChangeEvent):
+    """
+    A user was written
+    """
+
+
+@dataclass(frozen=True, slots=True)
+class UserCreated(UserChanged):
+    """
+    A user was created
+    """
+
+
+@dataclass(frozen=True, slots=True)
+class UserDisabled(UserChanged):
+    """
+    A user was disabled
+    """
+
+
+@dataclass(frozen=True, slots=True)
+class PasswordChanged(UserChanged):
+    """
+    The password of a user changed
+    """
+
+
+@dataclass(frozen=True, slots=True)
+class UserScopesChanged(UserChanged):
+    """
+    The scopes held by a user changed
+    """
+
+
+@dataclass(frozen=True, slots=True)
+class UserDeleted(UserChanged):
+    """
+    A user was deleted
+    """
+
+
+@dataclass(frozen=True, slots=True)
+class ClientChanged(ChangeEvent):
+    """
+    A client was written
+    """
+
+
+@dataclass(frozen=True, slots=True)
+class ClientCreated(ClientChanged):
+    """
+    A client was created
+    """
+
+
+@dataclass(frozen=True, slots=True)
+class ClientSecretRotated(ClientChanged):
+    """
+    The secret of a client changed
+    """
+
+
+@dataclass(frozen=True, slots=True)
+class ClientDeleted(ClientChanged):
+    """
+    A client was deleted
+    """
+
+
+EVENT_TYPES: Dict[str, Type[ChangeEvent]] = {
+    event_type.__name__: event_type
+    for event_type in (
+        UserChanged,
+        UserCreated,
+        UserDisabled,
+        PasswordChanged,
+        UserScopesChanged,
+        UserDeleted,
+        ClientChanged,
+        ClientCreated,
+        ClientSecretRotated,
+        ClientDeleted,
+    )
+}
+
+E = TypeVar("E", bound=ChangeEvent)
+
+
+class Invalidatable(Protocol):  # pylint: disable=too-few-public-methods
+    """
+    Anything that drops what it holds about a row, e.g. a cache
+    """
+
+    def invalidate(self, uid: int) -> None:
+        """
+        Drop what is held about a row.
+
+        :param uid: The primary key of the row.
+        """
+
+
+class EventBus:
+    """
+    This class dispatches change events to the subscribers of their type
+
+    A subscriber of a base class, e.g. UserChanged, receives every event
+    derived from it.
+    """
+
+    def __init__(self) -> None:
+        self._handlers: Dict[type, List[Callable[[ChangeEvent], None]]] = defaultdict(
+            list
+        )
+        self._lock = Lock()
+
+    def subscribe(
+        self, event_type: Type[E], handler: Callable[[E], None]
+    ) -> Callable[[E], None]:
+        """
+        Call a handler for every event of a type.
+
+        :param event_type: The event class, base classes match subclasses.
+        :param handler: The function to call with the event.
+        :return: The handler, so it can be unsubscribed.
+        """
+        with self._lock:
+            self._handlers[event_type].append(handler)  # type: ignore[arg-type]
+        return handler
+
+    def unsubscribe(self, event_type: Type[E], handler: Callable[[E], None]) -> None:
+        """
+        Stop calling a handler.
+
+        :param event_type: The event class it was subscribed to.
+        :param handler: The handler.
+        """
+        with self._lock:
+            self._handlers[event_type].remove(handler)  # type: ignore[arg-type]
+
+    def publish(self, change: ChangeEvent) -> None:
+        """
+        Call the subscribers of an event now.
+
+        A failing subscriber is logged and does not stop the others.
+
+        :param change: The event.
+        """
+        for event_type in type(change).__mro__:
+            for handler in self._handlers.get(event_type, ()):
+                try:
+                    handler(change)
+                except Exception:  # pylint: disable=broad-exception-caught
+                    logger.exception("Handler failed for %r", change)
+
+    def emit(self, session: Session, *changes: ChangeEvent) -> None:
+        """
+        Publish events once the session commits.
+
+        :param session: The session doing the write.
+        :param changes: The events describing the write.
+        """
+        session.info.setdefault(PENDING_EVENTS, []).extend(changes)
+        if CHANGE_FEED:
+            now = time.time()
+            session.add_all(
+                DBChangeEvent(
+                    kind=type(change).__name__,
+                    uid=change.uid,
+                    origin=ORIGIN,
+                    created_at=now,
+                )
+                for change in changes
+            )
+
+
+event_bus = EventBus()
+
+
+def invalidate_on(
+    event_type: Type[ChangeEvent], *targets: Invalidatable, bus: EventBus = event_bus
+) -> None:
+    """
+    This function drops a row from the targets whenever it changes
+
+    :param event_type: The event class to react to.
+    :param targets: The caches holding rows of that kind.
+    :param bus: The event bus.
+    """
+
+    def invalidate(change: ChangeEvent) -> None:
+        for target in targets:
+            target.invalidate(change.uid)
+
+    bus.subscribe(event_type, invalidate)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session: Session) -> None:
+    for change in session.info.pop(PENDING_EVENTS, ()):
+        event_bus.publish(change)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session: Session) -> None:
+    session.info.pop(PENDING_EVENTS, None)
+
+
+class ChangeFeedPoller:
+    """
+    This class publishes the change events other processes committed
+
+    Rows are read in id order. A transaction that commits after one with
+    a higher id can be missed, so caches keep their ttl as a backstop.
+    """
+
+    def __init__(
+        self, engine: Engine, bus: EventBus = event_bus, batch_size: int = 500
+    ) -> None:
+        self.engine = engine
+        self.bus = bus
+        self.batch_size = batch_size
+        self.last_id: Optional[int] = None
+
+    def poll(self) -> int:
+        """
+        This function publishes the rows written since the last poll
+
+        The first poll only records where the feed currently ends.
+
+        :return: the number of events published
+        """
+        with self.engine.connect() as connection:
+            if self.last_id is None:
+                self.last_id = (
+                    connection.execute(select(func.max(col(DBChangeEvent.id)))).scalar()
+                    or 0
+                )
+                return 0
+
+            rows = connection.execute(
+                select(DBChangeEvent)
+                .where(col(DBChangeEvent.id) > self.last_id)
+                .order_by(col(DBChangeEvent.id))
+                .limit(self.batch_size)
+            ).all()
+
+        published = 0
+        for row in rows:
+            self.last_id = row.id
+            event_type = EVENT_TYPES.get(row.kind)
+            if row.origin != ORIGIN and event_type is not None:
+                self.bus.publish(event_type(row.uid))
+                published += 1
+
+        return published
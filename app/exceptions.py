@@ -0,0 +1,61 @@
+"""
+This module contains the application specific exceptions
+"""
+
+from typing import Sequence
+
+
+class VersionConflictError(Exception):
+    """
+    Raised when an update is made against a stale version of a row
+    """
+
+    def __init__(self, uid: int, expected_version: int):
+        super().__init__(f"Row {uid} is no longer at version {expected_version}")
+        self.uid = uid
+        self.expected_version = expected_version
+
+
+class RowExistsError(Exception):
+    """
+    Raised when an upsert would create a row whose id is already taken
+    """
+
+    def __init__(self, uid: int):
+        super().__init__(f"Row {uid} already exists")
+        self.uid = uid
+
+
+class MissingFieldsError(Exception):
+    """
+    Raised when an upsert would create a row without its required fields
+    """
+
+    def __init__(self, fields: Sequence[str]):
+        super().__init__(f"Creating a row needs {', '.join(fields)}")
+        self.fields = list(fields)
+
+
+class ProfilerBusyError(Exception):
+    """
+    Raised when a profile is asked for while another one is running
+    """
+
+    def __init__(self) -> None:
+        super().__init__("A profile is already running in this worker")
+
+
+class ConfigurationError(Exception):
+    """
+    Raised at startup when the settings cannot run a server
+    """
+
+
+class LaneFullError(Exception):
+    """
+    Raised when a lane already has as much work queued as it accepts
+    """
+
+    def __init__(self, lane: str) -> None:
+        super().__init__(f"Lane {lane} is full")
+        self.lane = lane
@@ -0,0 +1,38 @@
+"""
+This module contains the form models accepted by the token endpoint
+"""
+
+from typing import Optional
+
+from fastapi import Form
+
+
+class TokenRequestForm:  # pylint: disable=too-many-instance-attributes
+    """
+    This class collects the form fields of every supported grant type
+
+    It mirrors fastapi's OAuth2PasswordRequestForm but does not require a
+    username and password, which the authorization code grant does not send.
+    """
+
+    def __init__(
+        self,
+        grant_type: str = Form("password"),
+        username: Optional[str] = Form(None),
+        password: Optional[str] = Form(None),
+        scope: str = Form(""),
+        client_id: Optional[str] = Form(None),
+        client_secret: Optional[str] = Form(None),
+        code: Optional[str] = Form(None),
+        redirect_uri: Optional[str] = Form(None),
+        code_verifier: Optional[str] = Form(None),
+    ):
+        self.grant_type = grant_type
+        self.username = username
+        self.password = password
+        self.scopes = scope.split()
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.code = code
+        self.redirect_uri = redirect_uri
+        self.code_verifier = code_verifier
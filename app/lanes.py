@@ -0,0 +1,238 @@
+"""
+This module contains the priority lanes that keep route groups apart
+
+A lane owns a bounded thread pool that runs the endpoints of its routes and,
+optionally, its own partition of the database connection pool. Lanes are
+registered in app.main with the routes they serve; LaneMiddleware picks the
+lane of each request, so a slow admin listing waits for an admin thread and
+an admin connection and never for the ones logins need.
+"""
+
+import asyncio
+import contextvars
+import functools
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from fastapi import HTTPException, status
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.admission import Rule, match_route, parse_routes
+from app.exceptions import LaneFullError
+
+T = TypeVar("T")
+
+# The lane of the request being handled, None outside every lane
+current_lane: ContextVar[Optional["Lane"]] = ContextVar("current_lane", default=None)
+
+
+class Lane:  # pylint: disable=too-many-instance-attributes
+    """
+    This class is one lane: a bounded executor and an optional pool partition
+
+    At most max_pending calls are running or queued; past that, calls fail
+    with LaneFullError instead of growing the queue.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        workers: int,
+        pool_size: int = 0,
+        max_pending: Optional[int] = None,
+    ) -> None:
+        self.name = name
+        self.workers = workers
+        self.pool_size = pool_size
+        self.max_pending = max_pending or workers * 8
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """
+        The threads of the lane, started on first use
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                self.workers, thread_name_prefix=f"lane-{self.name}"
+            )
+        return self._executor
+
+    def shutdown(self) -> None:
+        """
+        Stop the threads of the lane; the next call starts new ones
+        """
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        This function runs a blocking call on the threads of the lane
+
+        Only the event loop changes the counters, so they need no lock.
+
+        :param func:
+        :param args:
+        :param kwargs:
+        :return: what func returned
+        :raises LaneFullError: if max_pending calls are already waiting
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise LaneFullError(self.name)
+
+        self.pending += 1
+        try:
+            context = contextvars.copy_context()
+            call = functools.partial(context.run, func, *args, **kwargs)
+            return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def metrics(self) -> Dict[str, int]:
+        """
+        This function reports the size and the load of the lane
+
+        :return:
+        """
+        return {
+            "workers": self.workers,
+            "pool_size": self.pool_size,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+class LaneRegistry:
+    """
+    This class maps requests to lanes, first registered match first
+    """
+
+    def __init__(self) -> None:
+        self._lanes: List[Tuple[Lane, List[Rule]]] = []
+
+    def register(self, lane: Lane, routes: Sequence[str]) -> Lane:
+        """
+        This function registers a lane for some routes
+
+        :param lane:
+        :param routes: patterns such as "POST /token" or "/users*"
+        :return: the lane
+        """
+        self._lanes.append((lane, parse_routes(routes)))
+        return lane
+
+    def __iter__(self) -> Iterator[Lane]:
+        return (lane for lane, _ in self._lanes)
+
+    def lane_for(self, method: str, path: str) -> Optional[Lane]:
+        """
+        This function finds the lane of a request
+
+        :param method:
+        :param path:
+        :return: the lane or None if no lane serves the route
+        """
+        for lane, rules in self._lanes:
+            if match_route(rules, method, path):
+                return lane
+        return None
+
+    def metrics(self) -> Dict[str, Dict[str, int]]:
+        """
+        This function reports the metrics of every lane
+
+        :return: the metrics by lane name
+        """
+        return {lane.name: lane.metrics() for lane, _ in self._lanes}
+
+    def shutdown(self) -> None:
+        """
+        This function stops the threads of every lane
+        """
+        for lane, _ in self._lanes:
+            lane.shutdown()
+
+
+class LaneMiddleware:  # pylint: disable=too-few-public-methods
+    """
+    This class puts each request in its lane for the endpoint to run in
+    """
+
+    def __init__(self, app: ASGIApp, registry: LaneRegistry) -> None:
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = current_lane.set(self.registry.lane_for(scope["method"], scope["path"]))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_lane.reset(token)
+
+
+def in_lane(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    This function makes a blocking endpoint run on the threads of its lane
+
+    Outside every lane it runs in the shared thread pool, as FastAPI would
+    run it. The signature is kept so FastAPI still sees the parameters.
+
+    :param endpoint: a plain (not async) endpoint
+    :return: the async endpoint
+    """
+    if inspect.iscoroutinefunction(endpoint):
+        return endpoint
+
+    @functools.wraps(endpoint)
+    async def run(*args: Any, **kwargs: Any) -> Any:
+        lane = current_lane.get()
+        if lane is None:
+            return await run_in_threadpool(endpoint, *args, **kwargs)
+
+        try:
+            return await lane.run(endpoint, *args, **kwargs)
+        except LaneFullError as error:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server busy, retry later",
+                headers={"Retry-After": "1"},
+            ) from error
+
+    return run
+
+
+class LaneRoute(APIRoute):
+    """
+    This class is the route class of routers whose endpoints run in lanes
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        super().__init__(path, in_lane(endpoint), **kwargs)
+
+
+lanes = LaneRegistry()
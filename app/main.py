@@ -2,19 +2,59 @@
 This is the main file for the FastAPI application
 """
 
+import asyncio
 import os
+import signal
+import threading
+import time
 from contextlib import asynccontextmanager
-from typing import Any, AsyncGenerator, Tuple
+from functools import partial
+from typing import Any, AsyncGenerator, Optional, Tuple
 
 import toml
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
 from utils import find_root_directory
 
-from app.conf import DATABASE_URL
+from app.admission import AdmissionMiddleware
+from app.conf import (
+    ADMIN_LANE_POOL_SIZE,
+    ADMIN_LANE_WORKERS,
+    AUDIT_FLUSH_SECONDS,
+    AUTH_LANE_POOL_SIZE,
+    AUTH_LANE_WORKERS,
+    CHANGE_EVENT_RETENTION_SECONDS,
+    CHANGE_FEED,
+    CHANGE_FEED_POLL_SECONDS,
+    DATABASE_URL,
+    OPENAPI_FILE,
+    PRODUCTION,
+    PROFILING_ENABLED,
+    SWEEP_BATCH_PAUSE_SECONDS,
+    SWEEP_BATCH_SIZE,
+    SWEEP_INTERVAL_SECONDS,
+    SWEEP_MAX_BATCHES,
+    TOKEN_FORMAT,
+    get_settings,
+    reload_settings,
+)
 from app.database import init_db
-from app.routes import auth, clients, probes, users
+from app.dependencies import (
+    get_admission_controller,
+    get_audit_log,
+    get_engine,
+    get_token_store,
+)
+from app.events import ChangeFeedPoller
+from app.lanes import Lane, LaneMiddleware, LaneRegistry, lanes
+from app.models.code import DBAuthorizationCode
+from app.models.event import DBChangeEvent
+from app.models.token import DBAccessToken
+from app.oidc import get_discovery_document, get_jwks_document
+from app.responses import Document, ORJSONResponse, serve_document
+from app.routes import auth, clients, debug, oidc, probes, users
+from app.scheduler import ExpiredRowPurger, Scheduler, scheduler
 
 
 def get_project_metadata() -> Tuple[str, str, str, str]:
@@ -50,6 +90,101 @@ def get_project_metadata() -> Tuple[str, str, str, str]:
 description, version, author_name, author_email = get_project_metadata()
 
 
+def schedule_jobs(jobs: Scheduler) -> None:
+    """
+    Registers the background jobs: flushing the audit log, purging expired
+    rows and, when enabled, polling the change feed and evicting expired
+    opaque tokens.
+
+    :param jobs: the scheduler to register the jobs with
+    """
+    engine = get_engine()
+    jobs.every(AUDIT_FLUSH_SECONDS, "flush_audit_log", get_audit_log().flush)
+    purger = partial(
+        ExpiredRowPurger,
+        engine,
+        batch_size=SWEEP_BATCH_SIZE,
+        pause=SWEEP_BATCH_PAUSE_SECONDS,
+        max_batches=SWEEP_MAX_BATCHES,
+    )
+    jobs.every(
+        SWEEP_INTERVAL_SECONDS,
+        "purge_access_tokens",
+        purger(DBAccessToken, "token_hash", "expires_at"),
+    )
+    jobs.every(
+        SWEEP_INTERVAL_SECONDS,
+        "purge_authorization_codes",
+        purger(DBAuthorizationCode, "code_hash", "expires_at"),
+    )
+    jobs.every(
+        SWEEP_INTERVAL_SECONDS,
+        "purge_change_events",
+        purger(
+            DBChangeEvent,
+            "id",
+            "created_at",
+            cutoff=lambda: time.time() - CHANGE_EVENT_RETENTION_SECONDS,
+        ),
+    )
+    if CHANGE_FEED:
+        jobs.every(
+            CHANGE_FEED_POLL_SECONDS, "change_feed", ChangeFeedPoller(engine).poll
+        )
+    if TOKEN_FORMAT == "opaque":
+        jobs.every(
+            SWEEP_INTERVAL_SECONDS,
+            "evict_access_tokens",
+            get_token_store().evict_expired,
+        )
+
+
+def register_lanes(registry: LaneRegistry) -> None:
+    """
+    Registers the priority lanes: logins, and the client metadata consent
+    screens show, get their own threads and database connections, and the
+    admin routes, whose listings and bulk updates are slow, get a few of
+    their own. Other routes share the default thread pool and the primary
+    pool.
+
+    :param registry: the registry to register the lanes with
+    """
+    registry.register(
+        Lane("auth", AUTH_LANE_WORKERS, AUTH_LANE_POOL_SIZE),
+        [
+            "POST /token",
+            "GET /authorize",
+            "POST /register",
+            "GET /users/me",
+            "GET /userinfo",
+            "GET /clients/*",
+        ],
+    )
+    registry.register(
+        Lane("admin", ADMIN_LANE_WORKERS, ADMIN_LANE_POOL_SIZE),
+        ["/users*", "/clients*"],
+    )
+
+
+def reload_on_sighup() -> bool:
+    """
+    Re-reads the reloadable settings whenever the process receives SIGHUP.
+
+    Signal handlers can only be installed from the main thread, which is
+    where uvicorn runs the event loop.
+
+    :return: True if the handler was installed
+    """
+    if (
+        not hasattr(signal, "SIGHUP")
+        or threading.current_thread() is not threading.main_thread()
+    ):
+        return False
+
+    asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_settings)
+    return True
+
+
 @asynccontextmanager
 async def lifespan(api_app: FastAPI) -> AsyncGenerator[None, Any]:  # noqa: D103
     """
@@ -60,13 +195,31 @@ async def lifespan(api_app: FastAPI) -> AsyncGenerator[None, Any]:  # noqa: D103
 
     :param api_app: FastAPI
     """
+    get_settings().check()
     print("Starting up the application...")
     print(f"Database URL: {DATABASE_URL}")
-    print("Swagger UI: http://127.0.0.1:8000/docs")
-    print("ReDoc: http://127.0.0.1:8000/redoc")
+    # Create the missing tables and upgrade the existing ones
+    init_db(api_app)
+    if not PRODUCTION:
+        print("Swagger UI: http://127.0.0.1:8000/docs")
+        print("ReDoc: http://127.0.0.1:8000/redoc")
+        # Generate the schema now rather than on the first /openapi.json
+        api_app.openapi()
+
+    # Build the OpenID Connect documents before the first client asks
+    get_discovery_document()
+    get_jwks_document()
+    schedule_jobs(scheduler)
+    scheduler.start()
+    reloading = reload_on_sighup()
 
     yield
-    # Add any cleanup code here if needed
+
+    if reloading:
+        asyncio.get_running_loop().remove_signal_handler(signal.SIGHUP)
+    await scheduler.stop()
+    lanes.shutdown()
+    get_audit_log().flush()
 
 
 tags_metadata = [
@@ -86,6 +239,14 @@ tags_metadata = [
         "name": "clients",
         "description": "Client management routes",
     },
+    {
+        "name": "oidc",
+        "description": "OpenID Connect discovery and userinfo",
+    },
+    {
+        "name": "debug",
+        "description": "Diagnostics of a running worker",
+    },
 ]
 
 # Define the allowed origins
@@ -109,8 +270,20 @@ app = FastAPI(
     },
     lifespan=lifespan,
     openapi_tags=tags_metadata,
+    default_response_class=ORJSONResponse,
+    openapi_url=None if PRODUCTION else "/openapi.json",
+    docs_url=None if PRODUCTION else "/docs",
+    redoc_url=None if PRODUCTION else "/redoc",
 )
 
+# Run the endpoints of each route group on the threads and connections of its lane
+register_lanes(lanes)
+app.add_middleware(LaneMiddleware, registry=lanes)
+
+# Answer low priority requests with 503 while the database pool is saturated;
+# added first so CORS, added last and outermost, also covers the 503s
+app.add_middleware(AdmissionMiddleware, controller=get_admission_controller())
+
 # Add CORS middleware to the application
 app.add_middleware(
     CORSMiddleware,
@@ -120,14 +293,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize the database
-init_db(app)
-
 # Include routers
 app.include_router(auth.router, tags=["auth"])
+app.include_router(oidc.router, tags=["oidc"])
 app.include_router(users.router, prefix="/users", tags=["users"])
 app.include_router(probes.router, prefix="/health", tags=["probes"])
 app.include_router(clients.router, prefix="/clients", tags=["clients"])
+if PROFILING_ENABLED:
+    app.include_router(debug.router, prefix="/debug", tags=["debug"])
+
+
+def mount_openapi_file(api_app: FastAPI, path: str) -> None:
+    """
+    Serves the schema exported at build time at /openapi.json.
+
+    The file is read once, so the route never walks the routes and models;
+    clients revalidate it with its ETag.
+
+    :param api_app: FastAPI
+    :param path: the file written by the openapi command
+    """
+    document = Document.from_file(path)
+
+    async def openapi_json(if_none_match: Optional[str] = Header(None)) -> Response:
+        return serve_document(document, if_none_match, max_age=0)
+
+    api_app.add_api_route("/openapi.json", openapi_json, include_in_schema=False)
+
+
+if PRODUCTION and OPENAPI_FILE:
+    mount_openapi_file(app, OPENAPI_FILE)
 
 
 def main() -> None:
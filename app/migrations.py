@@ -0,0 +1,203 @@
+"""
+This module upgrades an existing database to the current models
+
+create_all creates the tables that are missing but never changes the ones
+that exist, so a database created by an earlier release lacks the columns
+added since (row versions, scopes, security stamps, realms, nonces) and
+keeps the client lists in text columns. upgrade_schema adds what is
+missing and converts those lists, and leaves a current database untouched;
+the conversions are recorded in schema_migrations so each runs once. It
+runs when a worker starts up and from the migrate command, never on import.
+"""
+
+import logging
+import time
+from typing import Any, List, Optional
+
+import orjson
+from sqlalchemy import (
+    JSON,
+    Column,
+    Table,
+    Text,
+    inspect,
+    literal,
+    select,
+    text,
+    type_coerce,
+    update,
+)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql.schema import ScalarElementColumnDefault
+from sqlmodel import SQLModel
+
+# Every table must be registered on the metadata before it is compared
+# pylint: disable-next=unused-import
+from app.models import audit, client, code, event, token, user  # noqa: F401
+from app.models.migration import DBSchemaMigration
+
+logger = logging.getLogger(__name__)
+
+
+def _literal_default(column: Column[Any], connection: Connection) -> Optional[str]:
+    """
+    This function renders the scalar default of a column as SQL
+
+    :param column:
+    :param connection:
+    :return: the literal or None if the column has no scalar default
+    """
+    default = column.default
+    if not isinstance(default, ScalarElementColumnDefault):
+        return None
+    return str(
+        literal(default.arg, column.type).compile(
+            dialect=connection.dialect, compile_kwargs={"literal_binds": True}
+        )
+    )
+
+
+def _add_column(connection: Connection, table: Table, column: Column[Any]) -> None:
+    """
+    This function adds a column to an existing table
+
+    Existing rows get the column default, so NOT NULL columns can be added
+    to tables that already hold rows.
+
+    :param connection:
+    :param table:
+    :param column:
+    """
+    preparer = connection.dialect.identifier_preparer
+    ddl = (
+        f"ALTER TABLE {preparer.format_table(table)} "
+        f"ADD COLUMN {preparer.format_column(column)} "
+        f"{column.type.compile(dialect=connection.dialect)}"
+    )
+    default = _literal_default(column, connection)
+    if default is not None:
+        ddl += f" DEFAULT {default}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+    connection.execute(text(ddl))
+
+
+def _text_to_json(connection: Connection, table: Table, column: Column[Any]) -> bool:
+    """
+    This function turns a list stored as space separated text into JSON
+
+    Values that already are JSON arrays are kept. On PostgreSQL the column
+    type is changed as well; SQLite and MySQL read JSON from text columns,
+    so there the column keeps its type and the conversion is recorded in
+    schema_migrations instead, so it runs once.
+
+    :param connection:
+    :param table:
+    :param column:
+    :return: True if anything was converted
+    """
+    migrations = DBSchemaMigration.__table__  # type: ignore[attr-defined]
+    name = f"{table.name}.{column.name}:json"
+    if connection.execute(
+        select(migrations.c.name).where(migrations.c.name == name)
+    ).first():
+        return False
+
+    key = table.c[column.name]
+    (primary_key,) = table.primary_key.columns
+    rows = connection.execute(
+        select(primary_key, type_coerce(key, Text)).where(key.is_not(None))
+    ).all()
+    converted = False
+    for uid, value in rows:
+        try:
+            if isinstance(orjson.loads(value), list):
+                continue
+        except orjson.JSONDecodeError:
+            pass
+        connection.execute(
+            update(table).where(primary_key == uid).values({key: value.split()})
+        )
+        converted = True
+
+    if connection.dialect.name == "postgresql":
+        preparer = connection.dialect.identifier_preparer
+        quoted = preparer.format_column(column)
+        connection.execute(
+            text(
+                f"ALTER TABLE {preparer.format_table(table)} ALTER COLUMN {quoted} "
+                f"TYPE JSON USING {quoted}::json"
+            )
+        )
+        converted = True
+
+    connection.execute(migrations.insert().values(name=name, applied_at=time.time()))
+    return converted
+
+
+def _upgrade_table(engine: Engine, table: Table) -> List[str]:
+    """
+    This function brings one existing table up to its model
+
+    :param engine:
+    :param table:
+    :return: the changes made
+    """
+    inspector = inspect(engine)
+    existing = {column["name"]: column for column in inspector.get_columns(table.name)}
+    indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+    changes: List[str] = []
+
+    with engine.begin() as connection:
+        for column in table.columns:
+            if column.name not in existing:
+                _add_column(connection, table, column)
+                changes.append(f"{table.name}.{column.name}: added")
+            elif (
+                isinstance(column.type, JSON)
+                and not isinstance(existing[column.name]["type"], JSON)
+                and _text_to_json(connection, table, column)
+            ):
+                changes.append(f"{table.name}.{column.name}: converted to JSON")
+
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(connection)
+                changes.append(f"{table.name}: index {index.name} created")
+
+    return changes
+
+
+def upgrade_schema(engine: Engine) -> List[str]:
+    """
+    This function creates the missing tables and upgrades the existing ones
+
+    Every table is upgraded in its own transaction. When several workers
+    start together one of them may add a column first; the others then
+    find the table current and carry on.
+
+    :param engine:
+    :return: the changes made, empty when the database was current
+    """
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    changes = [
+        f"{table.name}: created"
+        for table in SQLModel.metadata.sorted_tables
+        if table.name not in existing
+    ]
+    SQLModel.metadata.create_all(engine, checkfirst=True)
+
+    for table in SQLModel.metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        try:
+            changes += _upgrade_table(engine, table)
+        except DBAPIError:
+            # Another worker changed the table first, look at it again
+            changes += _upgrade_table(engine, table)
+
+    for change in changes:
+        logger.info("Schema upgrade: %s", change)
+    return changes
@@ -0,0 +1,38 @@
+"""
+This module contains the AuditEvent models
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlmodel import Field, SQLModel
+
+
+@dataclass(frozen=True, slots=True)
+class AuditEvent:
+    """
+    Something that happened which compliance needs a record of
+    """
+
+    at: float
+    action: str
+    outcome: str
+    actor: Optional[str] = None
+    target: Optional[str] = None
+    detail: Optional[str] = None
+
+
+class DBAuditEvent(SQLModel, table=True):
+    """
+    The database model of the audit log
+    """
+
+    __tablename__ = "audit_events"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    at: float = Field(index=True)
+    action: str = Field(index=True)
+    outcome: str
+    actor: Optional[str] = Field(default=None, index=True)
+    target: Optional[str] = None
+    detail: Optional[str] = None
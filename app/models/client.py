@@ -2,11 +2,14 @@
 This module contains the Client model
 """
 
-from typing import Optional
+from dataclasses import dataclass
+from typing import FrozenSet, Iterable, List, Optional, Tuple
 
-from sqlalchemy import Column, Text
+from sqlalchemy import JSON, Column, Index
 from sqlmodel import Field, SQLModel
 
+from app.realms import DEFAULT_REALM
+
 
 class DBClient(SQLModel, table=True):
     """
@@ -15,7 +18,8 @@ class DBClient(SQLModel, table=True):
     The fields are described below
 
     id: int - the primary key
-    client_id: str - the client ID
+    tenant_id: str - the realm the client belongs to
+    client_id: str - the client ID, unique within its realm
     client_secret: str - the client secret
     redirect_uris: List[str] - the redirect URIs
     grant_types: List[str] - the grant types
@@ -27,20 +31,111 @@ class DBClient(SQLModel, table=True):
     contacts: Optional[List[str]] - the contacts
     tos_uri: Optional[str] - the terms of service URI
     policy_uri: Optional[str] - the policy URI
+    version: int - the row version used for optimistic concurrency
     """
 
     __tablename__ = "clients"
+    __table_args__ = (
+        Index("ix_clients_tenant_client_id", "tenant_id", "client_id", unique=True),
+    )
 
     id: int = Field(default=None, primary_key=True)
+    tenant_id: str = Field(default=DEFAULT_REALM, nullable=False, max_length=64)
     client_id: str
     client_secret: str
-    redirect_uris: Optional[str] = Field(sa_column=Column(Text))
-    grant_types: Optional[str] = Field(sa_column=Column(Text))
-    response_types: Optional[str] = Field(sa_column=Column(Text))
+    redirect_uris: Optional[List[str]] = Field(default=None, sa_column=Column(JSON))
+    grant_types: Optional[List[str]] = Field(default=None, sa_column=Column(JSON))
+    response_types: Optional[List[str]] = Field(default=None, sa_column=Column(JSON))
     client_name: Optional[str] = None
     client_uri: Optional[str] = None
     logo_uri: Optional[str] = None
-    scope: Optional[str] = Field(sa_column=Column(Text))
-    contacts: Optional[str] = Field(sa_column=Column(Text), default=None)
+    scope: Optional[List[str]] = Field(default=None, sa_column=Column(JSON))
+    contacts: Optional[List[str]] = Field(default=None, sa_column=Column(JSON))
     tos_uri: Optional[str] = None
     policy_uri: Optional[str] = None
+    version: int = Field(default=1, nullable=False)
+
+
+@dataclass(frozen=True, slots=True)
+class ClientSnapshot:  # pylint: disable=too-many-instance-attributes
+    """
+    A detached, read-only copy of a client with its authorization rules
+
+    It carries no session state and never the client secret. The lists the
+    authorize and token endpoints check are compiled into frozensets, so
+    every check is a set lookup; the other fields mirror ClientDisplay.
+    """
+
+    id: int
+    client_id: str
+    version: int
+    redirect_uris: FrozenSet[str] = frozenset()
+    grant_types: FrozenSet[str] = frozenset()
+    response_types: FrozenSet[str] = frozenset()
+    scope: FrozenSet[str] = frozenset()
+    client_name: Optional[str] = None
+    client_uri: Optional[str] = None
+    logo_uri: Optional[str] = None
+    contacts: Tuple[str, ...] = ()
+    tos_uri: Optional[str] = None
+    policy_uri: Optional[str] = None
+
+    @classmethod
+    def from_client(cls, client: DBClient) -> "ClientSnapshot":
+        """
+        Take a snapshot of a client row
+
+        :param client: the client row
+        :return: the snapshot
+        """
+        return cls(
+            id=client.id,
+            client_id=client.client_id,
+            version=client.version,
+            redirect_uris=frozenset(client.redirect_uris or ()),
+            grant_types=frozenset(client.grant_types or ()),
+            response_types=frozenset(client.response_types or ()),
+            scope=frozenset(client.scope or ()),
+            client_name=client.client_name,
+            client_uri=client.client_uri,
+            logo_uri=client.logo_uri,
+            contacts=tuple(client.contacts or ()),
+            tos_uri=client.tos_uri,
+            policy_uri=client.policy_uri,
+        )
+
+    def allows_redirect_uri(self, redirect_uri: str) -> bool:
+        """
+        Check a redirect URI against the registered ones (exact match)
+
+        :param redirect_uri: the requested redirect URI
+        :return: True if the redirect URI is registered
+        """
+        return redirect_uri in self.redirect_uris
+
+    def allows_grant_type(self, grant_type: str) -> bool:
+        """
+        Check whether the client may use a grant type
+
+        :param grant_type: the requested grant type
+        :return: True if the grant type is allowed
+        """
+        return grant_type in self.grant_types
+
+    def allows_response_type(self, response_type: str) -> bool:
+        """
+        Check whether the client may use a response type
+
+        :param response_type: the requested response type
+        :return: True if the response type is allowed
+        """
+        return response_type in self.response_types
+
+    def allows_scopes(self, scopes: Iterable[str]) -> bool:
+        """
+        Check whether every requested scope is registered for the client
+
+        :param scopes: the requested scopes
+        :return: True if all scopes are allowed
+        """
+        return self.scope.issuperset(scopes)
@@ -0,0 +1,49 @@
+"""
+This module contains the AuthorizationCode models
+"""
+
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from sqlmodel import Field, SQLModel
+
+from app.realms import DEFAULT_REALM
+
+
+@dataclass(frozen=True, slots=True)
+class AuthorizationCode:  # pylint: disable=too-many-instance-attributes
+    """
+    An issued authorization code waiting to be exchanged at /token
+    """
+
+    code: str
+    client_id: str
+    redirect_uri: str
+    username: str
+    scopes: Tuple[str, ...]
+    code_challenge: str
+    code_challenge_method: str
+    expires_at: float
+    realm: str = DEFAULT_REALM
+    nonce: Optional[str] = None
+
+
+class DBAuthorizationCode(SQLModel, table=True):
+    """
+    The database model for authorization codes shared between nodes
+
+    Only a hash of the code is stored so a leaked table cannot be replayed.
+    """
+
+    __tablename__ = "authorization_codes"
+
+    code_hash: str = Field(primary_key=True, max_length=64)
+    client_id: str
+    redirect_uri: str
+    username: str
+    scope: Optional[str] = None
+    code_challenge: str
+    code_challenge_method: str
+    expires_at: float = Field(index=True)
+    realm: str = Field(default=DEFAULT_REALM, max_length=64)
+    nonce: Optional[str] = None
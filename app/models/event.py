@@ -0,0 +1,24 @@
+"""
+This module contains the ChangeEvent model
+"""
+
+from typing import Optional
+
+from sqlmodel import Field, SQLModel
+
+
+class DBChangeEvent(SQLModel, table=True):
+    """
+    The database model of the change feed
+
+    Each row records a committed write so other nodes can drop what they
+    cached about it. origin identifies the process that wrote the row.
+    """
+
+    __tablename__ = "change_events"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str
+    uid: int
+    origin: str
+    created_at: float = Field(index=True)
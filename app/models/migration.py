@@ -0,0 +1,20 @@
+"""
+This module contains the SchemaMigration model
+"""
+
+from sqlmodel import Field, SQLModel
+
+
+class DBSchemaMigration(SQLModel, table=True):
+    """
+    The database model of the data migrations already applied
+
+    Schema changes are found by comparing the tables with the models, but a
+    data change such as rewriting a column leaves no trace, so it is
+    recorded here by name once it is done.
+    """
+
+    __tablename__ = "schema_migrations"
+
+    name: str = Field(primary_key=True, max_length=128)
+    applied_at: float
@@ -2,9 +2,13 @@
 This is the Token model
 """
 
-from typing import Optional
+from dataclasses import dataclass
+from typing import FrozenSet, Optional
 
 from pydantic import BaseModel
+from sqlmodel import Field, SQLModel
+
+from app.realms import DEFAULT_REALM
 
 
 class Token(BaseModel):
@@ -14,6 +18,8 @@ class Token(BaseModel):
 
     access_token: str
     token_type: str
+    scope: Optional[str] = None
+    id_token: Optional[str] = None
 
 
 class TokenData(BaseModel):
@@ -22,3 +28,51 @@ class TokenData(BaseModel):
     """
 
     username: Optional[str] = None
+
+
+@dataclass(frozen=True, slots=True)
+class Claims:  # pylint: disable=too-many-instance-attributes
+    """
+    The verified claims of an access token
+
+    The user fields are only present on tokens issued in stateless mode.
+    The realm comes from the key that verified the token, not its payload.
+    """
+
+    sub: str
+    realm: str = DEFAULT_REALM
+    scopes: FrozenSet[str] = frozenset()
+    exp: Optional[float] = None
+    nbf: Optional[float] = None
+    uid: Optional[int] = None
+    email: Optional[str] = None
+    disabled: Optional[bool] = None
+    stamp: Optional[int] = None
+
+    def is_current(self, now: float, leeway: float = 0) -> bool:
+        """
+        Check the time window of the token
+
+        :param now: the current unix time
+        :param leeway: seconds of clock skew to tolerate
+        :return: True if the token is neither expired nor used too early
+        """
+        if self.exp is not None and self.exp + leeway <= now:
+            return False
+
+        return self.nbf is None or self.nbf - leeway <= now
+
+
+class DBAccessToken(SQLModel, table=True):
+    """
+    The database model for opaque access tokens
+
+    Only a hash of the handle is stored so a leaked table cannot be replayed.
+    """
+
+    __tablename__ = "access_tokens"
+
+    token_hash: str = Field(primary_key=True, max_length=64)
+    sub: str = Field(index=True)
+    claims: str
+    expires_at: float = Field(index=True)
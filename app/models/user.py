@@ -2,21 +2,72 @@
 This module contains the User model
 """
 
-from typing import Optional
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
 
+from sqlalchemy import JSON, Column, Index
 from sqlmodel import Field, SQLModel
 
+from app.realms import DEFAULT_REALM
+
 
 class DBUser(SQLModel, table=True):
     """
     The database model for the User
+
+    Users are partitioned by realm: the lookup indexes lead on tenant_id,
+    so a realm's lookups only ever walk that realm's part of the index.
     """
 
     __tablename__ = "users"
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        Index("ix_users_tenant_username", "tenant_id", "username", unique=True),
+        Index("ix_users_tenant_email", "tenant_id", "email"),
+        {"extend_existing": True},
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
+    tenant_id: str = Field(default=DEFAULT_REALM, nullable=False, max_length=64)
     username: str
     email: str
     disabled: Optional[bool] = False
     hashed_password: Optional[str] = None
+    scopes: Optional[List[str]] = Field(default=None, sa_column=Column(JSON))
+    version: int = Field(default=1, nullable=False)
+    # Bumped whenever existing tokens must stop working (password, disable, scopes)
+    security_stamp: int = Field(default=1, nullable=False)
+
+
+@dataclass(frozen=True, slots=True)
+class UserSnapshot:
+    """
+    A detached, read-only copy of a user for hot paths and caches
+
+    It carries no session state and never the password hash.
+    """
+
+    id: Optional[int]
+    username: str
+    email: str
+    disabled: Optional[bool] = False
+    scopes: Tuple[str, ...] = ()
+    version: int = 1
+    security_stamp: int = 1
+
+    @classmethod
+    def from_user(cls, user: DBUser) -> "UserSnapshot":
+        """
+        Take a snapshot of a user row
+
+        :param user: the user row
+        :return: the snapshot
+        """
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            disabled=user.disabled,
+            scopes=tuple(user.scopes or ()),
+            version=user.version,
+            security_stamp=user.security_stamp,
+        )
@@ -0,0 +1,135 @@
+"""
+This module contains the OpenID Connect metadata: the discovery document,
+the JWKS and the claims of ID tokens
+
+The discovery document and the JWKS only change with the configuration, so
+each is serialized and hashed into an ETag once per process. Serving them
+is a dict lookup, and clients that already hold them get a 304.
+"""
+
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from jose import jwk
+
+from app.conf import ALGORITHM, BASE_URL, REALMS, TOKEN_ISSUER
+from app.models.user import UserSnapshot
+from app.realms import DEFAULT_REALM, realm_key, realm_kid
+from app.responses import Document
+from app.scopes import EMAIL, OPENID, PROFILE, SCOPES
+from app.tokens import ID_TOKEN_USE
+
+
+def get_issuer() -> str:
+    """
+    This function returns the issuer identifier of the server
+
+    :return: TOKEN_ISSUER, or BASE_URL when it is not set
+    """
+    return (TOKEN_ISSUER or BASE_URL or "http://localhost:8000").rstrip("/")
+
+
+def discovery_metadata(issuer: str, algorithm: str) -> Dict[str, Any]:
+    """
+    This function builds the OpenID Provider metadata
+
+    :param issuer: the issuer, also the base of every endpoint
+    :param algorithm: the algorithm tokens are signed with
+    :return:
+    """
+    return {
+        "issuer": issuer,
+        "authorization_endpoint": f"{issuer}/authorize",
+        "token_endpoint": f"{issuer}/token",
+        "userinfo_endpoint": f"{issuer}/userinfo",
+        "jwks_uri": f"{issuer}/.well-known/jwks.json",
+        "scopes_supported": [OPENID, PROFILE, EMAIL, *SCOPES],
+        "response_types_supported": ["code"],
+        "grant_types_supported": ["authorization_code", "password"],
+        "subject_types_supported": ["public"],
+        "id_token_signing_alg_values_supported": [algorithm],
+        "token_endpoint_auth_methods_supported": ["none"],
+        "code_challenge_methods_supported": ["S256"],
+        "claims_supported": ["sub", "iss", "aud", "exp", "iat", "nonce", "email"],
+    }
+
+
+def public_keys(algorithm: str, realms: List[str]) -> List[Dict[str, Any]]:
+    """
+    This function lists the public keys tokens can be verified with
+
+    HMAC keys are secrets and are never published, so with an HS algorithm
+    the list is empty and ID tokens are signed with the client's secret.
+
+    :param algorithm:
+    :param realms: the realms served, each with its own key
+    :return: the keys as JWKs
+    """
+    if algorithm.startswith("HS"):
+        return []
+
+    keys = []
+    for realm in [DEFAULT_REALM, *realms]:
+        key = jwk.construct(realm_key(realm), algorithm).public_key().to_dict()
+        key["use"] = "sig"
+        kid = realm_kid(realm)
+        if kid:
+            key["kid"] = kid
+        if key not in keys:
+            keys.append(key)
+    return keys
+
+
+@lru_cache(maxsize=1)
+def get_discovery_document() -> Document:
+    """
+    This function returns the discovery document, built once per process
+
+    :return:
+    """
+    return Document.from_content(discovery_metadata(get_issuer(), ALGORITHM))
+
+
+@lru_cache(maxsize=1)
+def get_jwks_document() -> Document:
+    """
+    This function returns the JWKS, built once per process
+
+    :return:
+    """
+    return Document.from_content({"keys": public_keys(ALGORITHM, REALMS)})
+
+
+def id_token_claims(
+    username: str,
+    client_id: str,
+    realm: str,
+    nonce: Optional[str] = None,
+    user: Optional[UserSnapshot] = None,
+) -> Dict[str, Any]:
+    """
+    This function builds the claims of an ID token
+
+    :param username: the subject
+    :param client_id: the audience
+    :param realm:
+    :param nonce: the nonce sent to /authorize, echoed back
+    :param user: the user when it was loaded and the email scope was granted,
+        to add its email
+    :return:
+    """
+    claims: Dict[str, Any] = {
+        "iss": get_issuer(),
+        "sub": username,
+        "aud": client_id,
+        "iat": int(time.time()),
+        "token_use": ID_TOKEN_USE,
+    }
+    if realm != DEFAULT_REALM:
+        claims["realm"] = realm
+    if nonce:
+        claims["nonce"] = nonce
+    if user is not None:
+        claims["email"] = user.email
+    return claims
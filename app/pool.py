@@ -0,0 +1,159 @@
+"""
+This module measures how long requests wait for a database connection
+
+QueuePool blocks a checkout once pool_size + max_overflow connections are
+in use, until one is returned or pool_timeout expires. MonitoredQueuePool
+times every checkout, so saturation shows up as wait time long before it
+shows up as timeouts.
+"""
+
+import itertools
+import time
+from collections import deque
+from threading import Lock
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from sqlalchemy import exc
+from sqlalchemy.pool import PoolProxiedConnection, QueuePool
+
+
+class PoolMonitor:  # pylint: disable=too-many-instance-attributes
+    """
+    This class keeps the checkout wait times of a pool
+
+    Waits are remembered for window seconds; pressure() is the longest of
+    them, or how long the oldest checkout still waiting has been waiting,
+    so it rises while the pool is stuck and falls back once it drains.
+    """
+
+    def __init__(self, window: float = 5.0) -> None:
+        self.window = window
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._recent: Deque[Tuple[float, float]] = deque()
+        self._waiting: Dict[int, float] = {}
+        self._ids = itertools.count()
+        self._lock = Lock()
+
+    @property
+    def waiting(self) -> int:
+        """
+        The number of checkouts in progress
+        """
+        return len(self._waiting)
+
+    def started(self) -> int:
+        """
+        Record the start of a checkout
+
+        :return: the id to finish it with
+        """
+        waiter = next(self._ids)
+        with self._lock:
+            self._waiting[waiter] = time.monotonic()
+        return waiter
+
+    def finished(self, waiter: int, timed_out: bool = False) -> float:
+        """
+        Record the end of a checkout
+
+        :param waiter: the id returned by started
+        :param timed_out: whether the pool gave up
+        :return: the seconds waited
+        """
+        now = time.monotonic()
+        with self._lock:
+            wait = now - self._waiting.pop(waiter, now)
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self._recent.append((now, wait))
+            self._expire(now)
+        return wait
+
+    def _expire(self, now: float) -> None:
+        """
+        Forget the waits older than the window
+        """
+        while self._recent and self._recent[0][0] < now - self.window:
+            self._recent.popleft()
+
+    def pressure(self) -> float:
+        """
+        How long checkouts have had to wait lately
+
+        :return: seconds
+        """
+        now = time.monotonic()
+        with self._lock:
+            oldest = min(self._waiting.values(), default=now)
+            self._expire(now)
+            recent = max((wait for _, wait in self._recent), default=0.0)
+        return max(recent, now - oldest)
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Report the checkout counters and wait times in milliseconds
+
+        :return:
+        """
+        average = self.total_wait / self.checkouts if self.checkouts else 0.0
+        return {
+            "waiting": self.waiting,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_ms_avg": round(average * 1000, 3),
+            "wait_ms_max": round(self.max_wait * 1000, 3),
+            "pressure_ms": round(self.pressure() * 1000, 3),
+        }
+
+
+class MonitoredQueuePool(QueuePool):
+    """
+    This class is a QueuePool that times its checkouts
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.monitor = PoolMonitor()
+
+    def connect(self) -> PoolProxiedConnection:
+        waiter = self.monitor.started()
+        timed_out = False
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.monitor.finished(waiter, timed_out)
+
+    def recreate(self) -> QueuePool:
+        pool = super().recreate()
+        if isinstance(pool, MonitoredQueuePool):
+            pool.monitor = self.monitor
+        return pool
+
+
+def queue_pool_metrics(pool: Any) -> Dict[str, Any]:
+    """
+    This function reports the usage of a pool
+
+    :param pool: the pool of an engine
+    :return: the sizes of a QueuePool and the waits of a monitored one
+    """
+    metrics: Dict[str, Any] = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        metrics.update(
+            size=pool.size(),
+            in_use=pool.checkedout(),
+            idle=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+        )
+    monitor: Optional[PoolMonitor] = getattr(pool, "monitor", None)
+    if monitor is not None:
+        metrics.update(monitor.metrics())
+    return metrics
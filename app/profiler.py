@@ -0,0 +1,111 @@
+"""
+This module contains the sampling profiler behind /debug/profile
+"""
+
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+from typing import Dict, List, Optional
+
+from app.exceptions import ProfilerBusyError
+
+
+def frame_label(frame: FrameType) -> str:
+    """
+    This function names a frame as module:qualified.function
+
+    :param frame:
+    :return:
+    """
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{frame.f_code.co_qualname}"
+
+
+def collapse_stack(frame: Optional[FrameType], root: str) -> str:
+    """
+    This function collapses a stack into a single root-first line
+
+    :param frame: the innermost frame
+    :param root: the label of the bottom frame, e.g. the thread name
+    :return: the frames joined by semicolons
+    """
+    labels: List[str] = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    labels.append(root)
+
+    return ";".join(reversed(labels))
+
+
+class StackSampler:
+    """
+    This class samples the stacks of every thread in the worker
+
+    Nothing runs until a profile is asked for: sample() starts a thread
+    that reads sys._current_frames() at the interval and stops once the
+    duration is up. Only one profile runs at a time per worker.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+
+    def sample(self, seconds: float, interval: float) -> Counter[str]:
+        """
+        This function samples the stacks of all threads but its own
+
+        :param seconds: how long to sample for
+        :param interval: the seconds between two samples
+        :return: the number of times each collapsed stack was seen
+        :raises ProfilerBusyError: if another profile is running
+        """
+        # pylint: disable-next=consider-using-with
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError()
+
+        try:
+            return self._sample(seconds, interval)
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def _sample(seconds: float, interval: float) -> Counter[str]:
+        """
+        This function takes the samples
+
+        :param seconds:
+        :param interval:
+        :return:
+        """
+        # pylint: disable=protected-access
+        own = threading.get_ident()
+        stacks: Counter[str] = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names: Dict[int, str] = {
+                thread.ident: thread.name
+                for thread in threading.enumerate()
+                if thread.ident is not None
+            }
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    stacks[collapse_stack(frame, names.get(ident, str(ident)))] += 1
+            time.sleep(interval)
+
+        return stacks
+
+
+def format_collapsed(stacks: Counter[str]) -> str:
+    """
+    This function renders stack counts in the collapsed format read by
+    flamegraph.pl and speedscope
+
+    :param stacks:
+    :return: one "frame;frame;frame count" line per stack
+    """
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+sampler = StackSampler()
@@ -0,0 +1,60 @@
+"""
+This module contains the realms (tenants) and their signing keys
+
+Every user, client and token belongs to a realm. Each realm signs its
+tokens with its own key, named by the realm in the kid header, so a token
+of one realm cannot be replayed against another.
+"""
+
+import hashlib
+import hmac
+from functools import lru_cache
+
+from app.conf import ALGORITHM, REALM_SECRET_KEYS, REALMS, SECRET_KEY
+
+DEFAULT_REALM = "default"
+
+
+def is_realm(realm: str) -> bool:
+    """
+    This function checks whether a realm is served
+
+    :param realm:
+    :return:
+    """
+    return realm == DEFAULT_REALM or realm in REALMS
+
+
+def realm_kid(realm: str) -> str:
+    """
+    This function returns the kid of the key of a realm
+
+    The default realm keeps an empty kid so its tokens look as before.
+
+    :param realm:
+    :return:
+    """
+    return "" if realm == DEFAULT_REALM else realm
+
+
+@lru_cache(maxsize=1024)
+def realm_key(realm: str) -> str:
+    """
+    This function returns the signing key of a realm
+
+    A key set in REALM_SECRET_KEYS wins. Otherwise HMAC keys are derived
+    from SECRET_KEY and the realm name; RSA/EC realms need an explicit key
+    and share SECRET_KEY until they get one.
+
+    :param realm:
+    :return:
+    """
+    if realm in REALM_SECRET_KEYS:
+        return REALM_SECRET_KEYS[realm]
+
+    if realm == DEFAULT_REALM or not ALGORITHM.startswith("HS"):
+        return SECRET_KEY
+
+    return hmac.new(
+        SECRET_KEY.encode(), f"realm:{realm}".encode(), hashlib.sha256
+    ).hexdigest()
@@ -0,0 +1,144 @@
+"""
+This module routes read queries to replicas and writes to the primary
+"""
+
+import itertools
+import time
+from functools import partial
+from threading import Lock
+from typing import Any, Callable, Dict, Optional, Sequence, TypeVar
+
+from sqlalchemy import Select, event
+from sqlalchemy.engine import Connection, Engine, ExceptionContext
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session
+
+T = TypeVar("T")
+
+
+class ReplicaSet:
+    """
+    This class hands out read replicas round-robin, skipping unhealthy ones
+
+    A replica that fails to connect, or drops its connection, is taken out
+    of rotation for retry_after seconds and then tried again.
+    """
+
+    def __init__(self, engines: Sequence[Engine], retry_after: float = 30.0):
+        self.engines = list(engines)
+        self.retry_after = retry_after
+        self._cycle = itertools.count()
+        self._down_until: Dict[int, float] = {}
+        self._lock = Lock()
+
+        for engine in self.engines:
+            event.listen(engine, "handle_error", self._on_error)
+
+    def __len__(self) -> int:
+        return len(self.engines)
+
+    def pick(self) -> Optional[Engine]:
+        """
+        Pick the next healthy replica
+
+        :return: a replica engine or None if every replica is down
+        """
+        count = len(self.engines)
+        if not count:
+            return None
+
+        now = time.monotonic()
+        start = next(self._cycle)
+        for offset in range(count):
+            engine = self.engines[(start + offset) % count]
+            if self._down_until.get(id(engine), 0.0) <= now:
+                return engine
+
+        return None
+
+    def mark_down(self, engine: Engine) -> None:
+        """
+        Take a replica out of rotation for retry_after seconds
+
+        :param engine: the failing replica
+        """
+        with self._lock:
+            self._down_until[id(engine)] = time.monotonic() + self.retry_after
+
+    def _on_error(self, context: ExceptionContext) -> None:
+        """
+        Mark a replica down on connection failures, not on query errors
+        """
+        if context.engine is not None and (
+            context.is_disconnect or context.connection is None
+        ):
+            self.mark_down(context.engine)
+
+
+class RoutingSession(Session):
+    """
+    This class is a session that sends plain reads to a replica
+
+    Anything that is not a SELECT, anything issued while flushing, and every
+    statement after the session first wrote goes to the primary, so a
+    request always reads its own writes. A session reads from one replica,
+    picked on its first read, so it holds at most one replica connection;
+    if that replica fails, the read is retried on the primary.
+    """
+
+    def __init__(self, primary: Engine, replicas: ReplicaSet, **kwargs: Any):
+        super().__init__(primary, **kwargs)
+        self.primary = primary
+        self.replicas = replicas
+        self._pinned = not replicas
+        self._replica: Optional[Engine] = None
+        self._reading_replica = False
+
+    def use_primary(self) -> None:
+        """
+        Send every remaining statement of this session to the primary
+        """
+        self._pinned = True
+
+    def get_bind(
+        self,
+        mapper: Optional[Any] = None,
+        clause: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> Engine | Connection:
+        self._reading_replica = False
+        if self._pinned:
+            return self.primary
+
+        if self._flushing or not isinstance(clause, Select):
+            self._pinned = True
+            return self.primary
+
+        if self._replica is None:
+            self._replica = self.replicas.pick()
+            if self._replica is None:
+                return self.primary
+
+        self._reading_replica = True
+        return self._replica
+
+    def _fall_back(self, call: Callable[[], T]) -> T:
+        """
+        Run a statement, retrying it on the primary if its replica failed
+        """
+        try:
+            return call()
+        except OperationalError:
+            replica = self._replica
+            if not self._reading_replica or replica is None:
+                raise
+
+            self.replicas.mark_down(replica)
+            self.use_primary()
+            return call()
+
+    def execute(self, *args: Any, **kwargs: Any) -> Any:
+        return self._fall_back(partial(super().execute, *args, **kwargs))
+
+    def exec(self, *args: Any, **kwargs: Any) -> Any:
+        return self._fall_back(partial(super().exec, *args, **kwargs))
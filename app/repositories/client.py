@@ -2,22 +2,40 @@
 This module contains the client repository class
 """
 
-from typing import Optional, Sequence
-
-from sqlalchemy.engine import Engine
-from sqlmodel import Session, select
-
+from typing import Any, Dict, Optional, Sequence
+
+from sqlmodel import Session, col, select, update
+
+from app.events import (
+    ChangeEvent,
+    ClientChanged,
+    ClientCreated,
+    ClientDeleted,
+    ClientSecretRotated,
+    event_bus,
+)
+from app.exceptions import (
+    MissingFieldsError,
+    RowExistsError,
+    VersionConflictError,
+)
 from app.models.client import DBClient
+from app.realms import DEFAULT_REALM
 from app.schemas.client import ClientCreate, ClientUpdate
 
 
 class ClientRepository:
     """
     This class contains the methods for the client repository
+
+    The repository works inside the session of the current request, so
+    every repository used while handling a request shares one connection
+    and one transaction. It only sees the clients of its realm.
     """
 
-    def __init__(self, engine: Engine):
-        self.engine = engine
+    def __init__(self, session: Session, realm: str = DEFAULT_REALM):
+        self.session = session
+        self.realm = realm
 
     def read(self, uid: int) -> Optional[DBClient]:
         """
@@ -26,9 +44,23 @@ class ClientRepository:
         :param uid:
         :return:
         """
-        with Session(self.engine) as session:
-            client = session.get(DBClient, uid)
-            return client
+        client = self.session.get(DBClient, uid)
+        if client is None or client.tenant_id != self.realm:
+            return None
+        return client
+
+    def read_by_client_id(self, client_id: str) -> Optional[DBClient]:
+        """
+        Retrieve a client by its OAuth2 client ID
+
+        :param client_id: the OAuth2 client ID
+        :return: the client
+        :rtype: Optional[DBClient]
+        """
+        statement = select(DBClient).where(
+            DBClient.tenant_id == self.realm, DBClient.client_id == client_id
+        )
+        return self.session.exec(statement).first()
 
     def read_all(self) -> Sequence[DBClient]:
         """
@@ -36,9 +68,8 @@ class ClientRepository:
 
         :return:
         """
-        with Session(self.engine) as session:
-            clients = session.exec(select(DBClient)).all()
-            return clients
+        statement = select(DBClient).where(DBClient.tenant_id == self.realm)
+        return self.session.exec(statement).all()
 
     def create(self, client: ClientCreate) -> DBClient:
         """
@@ -48,42 +79,135 @@ class ClientRepository:
         :return: the created client
         :rtype: DBClient
         """
-        db_client = DBClient(**client.model_dump())
-        with Session(self.engine) as session:
-            session.add(db_client)
-            session.commit()
-            session.refresh(db_client)
+        db_client = DBClient(tenant_id=self.realm, **client.model_dump())
+        self.session.add(db_client)
+        self.session.flush()
+        event_bus.emit(self.session, ClientCreated(db_client.id))
+        self.session.commit()
 
-            return db_client
+        return db_client
 
     def update(self, uid: int, client: ClientUpdate) -> Optional[DBClient]:
         """
-        Update a client
+        Update a client, creating it when it does not exist yet
 
         :param uid: the client id
         :param client: the client data
         :return: the updated client
         :rtype: Optional[DBClient]
+        :raises VersionConflictError: if the client changed since it was read
+        :raises RowExistsError: if the id belongs to a client of another realm
+        :raises MissingFieldsError: if a new client lacks its ID or secret
         """
-        client_dict = client.model_dump()
+        values = client.model_dump(exclude_none=True)
+        expected_version = values.pop("version", None)
 
-        with Session(self.engine) as session:
-            db_client = session.get(DBClient, uid)
+        db_client = self._update_returning(uid, values, expected_version)
 
-            if not db_client:
-                db_client = DBClient(id=uid, **client_dict)
-                session.add(db_client)
-            else:
-                for key, value in client_dict.items():
-                    if value is not None:
-                        setattr(db_client, key, value)
+        if db_client:
+            event_bus.emit(self.session, self._change_event(uid, values))
+        elif expected_version is None:
+            self._check_new_row(uid, values)
+            db_client = DBClient(id=uid, tenant_id=self.realm, **values)
+            self.session.add(db_client)
+            event_bus.emit(self.session, ClientCreated(uid))
 
-                session.add(db_client)
+        self.session.commit()
+
+        return db_client
+
+    def patch(self, uid: int, client: ClientUpdate) -> Optional[DBClient]:
+        """
+        Partially update a client, only touching the fields that were sent
+
+        :param uid: the client id
+        :param client: the client data
+        :return: the updated client or None if the client does not exist
+        :rtype: Optional[DBClient]
+        :raises VersionConflictError: if the client changed since it was read
+        """
+        values = client.model_dump(exclude_unset=True)
+        expected_version = values.pop("version", None)
 
-            session.commit()
-            session.refresh(db_client)
+        db_client = self._update_returning(uid, values, expected_version)
+        if db_client:
+            event_bus.emit(self.session, self._change_event(uid, values))
+        self.session.commit()
 
-            return db_client
+        return db_client
+
+    @staticmethod
+    def _change_event(uid: int, values: Dict[str, Any]) -> ChangeEvent:
+        """
+        Describe an update as a change event
+
+        :param uid: the client id
+        :param values: the columns that changed
+        :return: the event
+        """
+        if values.get("client_secret") is not None:
+            return ClientSecretRotated(uid)
+
+        return ClientChanged(uid)
+
+    def _check_new_row(self, uid: int, values: Dict[str, Any]) -> None:
+        """
+        Check that an upsert can insert the client instead of failing in the database
+
+        :param uid: the client id
+        :param values: the columns of the new row
+        :raises RowExistsError: if the id belongs to a client of another realm
+        :raises MissingFieldsError: if a required column has no value
+        """
+        if self.session.get(DBClient, uid) is not None:
+            raise RowExistsError(uid)
+
+        table = DBClient.__table__  # type: ignore[attr-defined]
+        missing = [
+            column.name
+            for column in table.columns
+            if not column.nullable
+            and not column.primary_key
+            and column.default is None
+            and column.name not in values
+        ]
+        if missing:
+            raise MissingFieldsError(missing)
+
+    def _update_returning(
+        self,
+        uid: int,
+        values: Dict[str, Any],
+        expected_version: Optional[int],
+    ) -> Optional[DBClient]:
+        """
+        Issue a single UPDATE ... RETURNING for the given columns
+
+        :param uid: the client id
+        :param values: the columns to change
+        :param expected_version: the version the caller last read, if any
+        :return: the updated client or None if no row matched
+        :raises VersionConflictError: if the row exists at another version
+        """
+        statement = (
+            update(DBClient)
+            .where(col(DBClient.id) == uid, col(DBClient.tenant_id) == self.realm)
+            .values(**values, version=col(DBClient.version) + 1)
+            .returning(DBClient)
+        )
+        if expected_version is not None:
+            statement = statement.where(col(DBClient.version) == expected_version)
+
+        db_client: Optional[DBClient] = self.session.exec(
+            statement
+        ).scalar_one_or_none()
+
+        if db_client is None and expected_version is not None:
+            # Only the failure path pays for telling "gone" from "stale"
+            if self.read(uid) is not None:
+                raise VersionConflictError(uid, expected_version)
+
+        return db_client
 
     def delete(self, uid: int) -> bool:
         """
@@ -93,12 +217,12 @@ class ClientRepository:
         :return: True if the client was deleted, False otherwise
         :rtype: bool
         """
-        with Session(self.engine) as session:
-            client = session.get(DBClient, uid)
+        client = self.read(uid)
 
-            if not client:
-                return False
+        if not client:
+            return False
 
-            session.delete(client)
-            session.commit()
-            return True
+        self.session.delete(client)
+        event_bus.emit(self.session, ClientDeleted(uid))
+        self.session.commit()
+        return True
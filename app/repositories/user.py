@@ -2,12 +2,27 @@
 This module contains the user repository class
 """
 
-from typing import Optional, Sequence
+from typing import Any, Dict, List, Optional, Sequence
 
-from sqlalchemy.engine import Engine
-from sqlmodel import Session, select
+from sqlmodel import Session, col, select, update
 
+from app.events import (
+    ChangeEvent,
+    PasswordChanged,
+    UserChanged,
+    UserCreated,
+    UserDeleted,
+    UserDisabled,
+    UserScopesChanged,
+    event_bus,
+)
+from app.exceptions import (
+    MissingFieldsError,
+    RowExistsError,
+    VersionConflictError,
+)
 from app.models.user import DBUser
+from app.realms import DEFAULT_REALM
 from app.schemas.user import UserCreate, UserUpdate
 from app.security import get_password_hash
 
@@ -15,10 +30,15 @@ from app.security import get_password_hash
 class UserRepository:
     """
     This class contains the methods for the user repository
+
+    The repository works inside the session of the current request, so
+    every repository used while handling a request shares one connection
+    and one transaction. It only sees the users of its realm.
     """
 
-    def __init__(self, engine: Engine):
-        self.engine = engine
+    def __init__(self, session: Session, realm: str = DEFAULT_REALM):
+        self.session = session
+        self.realm = realm
 
     def read(self, uid: int) -> Optional[DBUser]:
         """
@@ -27,9 +47,8 @@ class UserRepository:
         :param uid:
         :return:
         """
-        with Session(self.engine) as session:
-            user = session.get(DBUser, uid)
-            return user
+        user = self.session.get(DBUser, uid)
+        return user if user is not None and user.tenant_id == self.realm else None
 
     def read_by_username(self, username: str) -> Optional[DBUser]:
         """
@@ -39,10 +58,10 @@ class UserRepository:
         :return: the user
         :rtype: Optional[DBUser]
         """
-        with Session(self.engine) as session:
-            statement = select(DBUser).where(DBUser.username == username)
-            user = session.exec(statement).first()
-            return user
+        statement = select(DBUser).where(
+            DBUser.tenant_id == self.realm, DBUser.username == username
+        )
+        return self.session.exec(statement).first()
 
     def read_by_email(self, email: str) -> Optional[DBUser]:
         """
@@ -52,10 +71,23 @@ class UserRepository:
         :return: the user
         :rtype: Optional[DBUser]
         """
-        with Session(self.engine) as session:
-            statement = select(DBUser).where(DBUser.email == email)
-            user = session.exec(statement).first()
-            return user
+        statement = select(DBUser).where(
+            DBUser.tenant_id == self.realm, DBUser.email == email
+        )
+        return self.session.exec(statement).first()
+
+    def read_security_stamp(self, uid: int) -> Optional[int]:
+        """
+        Retrieve only the security stamp of a user
+
+        :param uid: the user id
+        :return: the security stamp or None if the user does not exist
+        :rtype: Optional[int]
+        """
+        statement = select(DBUser.security_stamp).where(
+            DBUser.id == uid, DBUser.tenant_id == self.realm
+        )
+        return self.session.exec(statement).first()
 
     def read_all(self) -> Sequence[DBUser]:
         """
@@ -63,9 +95,8 @@ class UserRepository:
 
         :return:
         """
-        with Session(self.engine) as session:
-            users = session.exec(select(DBUser)).all()
-            return users
+        statement = select(DBUser).where(DBUser.tenant_id == self.realm)
+        return self.session.exec(statement).all()
 
     def create(self, user_create: UserCreate) -> DBUser:
         """
@@ -75,50 +106,179 @@ class UserRepository:
         :return: the created user
         :rtype: DBUser
         """
-        with Session(self.engine) as session:
-            db_user = DBUser(**user_create.model_dump())
-            session.add(db_user)
-            session.commit()
-            session.refresh(db_user)
+        values = user_create.model_dump()
+        # UserService.create hashes the password before it gets here
+        db_user = DBUser(
+            hashed_password=values.pop("password"), tenant_id=self.realm, **values
+        )
+        self.session.add(db_user)
+        self.session.flush()
+        if db_user.id is not None:
+            event_bus.emit(self.session, UserCreated(db_user.id))
+        self.session.commit()
 
-            return db_user
+        return db_user
 
     def update(self, uid: int, user_update: UserUpdate) -> Optional[DBUser]:
         """
-        Update a user
+        Update a user, creating it when it does not exist yet
 
         :param uid: the user id
         :param user_update: the user data
         :return: the updated user
         :rtype: Optional[DBUser]
+        :raises VersionConflictError: if the user changed since it was read
+        :raises RowExistsError: if the id belongs to a user of another realm
+        :raises MissingFieldsError: if a new user lacks its username or email
         """
-        user_dict = user_update.model_dump()
+        values = self._column_values(user_update.model_dump(exclude_none=True))
+        expected_version = values.pop("version", None)
 
-        with Session(self.engine) as session:
-            db_user = session.get(DBUser, uid)
+        db_user = self._update_returning(uid, values, expected_version)
 
-            if not db_user:
-                user_dict["hashed_password"] = get_password_hash(
-                    user_dict.pop("password")
-                )
-                db_user = DBUser(id=uid, **user_dict)
-                session.add(db_user)
-            else:
-                for key, value in user_dict.items():
-                    if value is not None:
-                        if hasattr(db_user, key):
-                            setattr(db_user, key, value)
-                        else:
-                            # Handle fields that are not part of DBUser, e.g., password
-                            if key == "password":
-                                db_user.hashed_password = get_password_hash(value)
+        if db_user:
+            event_bus.emit(self.session, *self._change_events(uid, values))
+        elif expected_version is None:
+            # A new row starts at the default stamp
+            values.pop("security_stamp", None)
+            self._check_new_row(uid, values)
+            db_user = DBUser(id=uid, tenant_id=self.realm, **values)
+            self.session.add(db_user)
+            event_bus.emit(self.session, UserCreated(uid))
 
-                session.add(db_user)
+        self.session.commit()
 
-            session.commit()
-            session.refresh(db_user)
+        return db_user
 
-            return db_user
+    def patch(self, uid: int, user_update: UserUpdate) -> Optional[DBUser]:
+        """
+        Partially update a user, only touching the fields that were sent
+
+        :param uid: the user id
+        :param user_update: the user data
+        :return: the updated user or None if the user does not exist
+        :rtype: Optional[DBUser]
+        :raises VersionConflictError: if the user changed since it was read
+        """
+        values = self._column_values(user_update.model_dump(exclude_unset=True))
+        expected_version = values.pop("version", None)
+
+        db_user = self._update_returning(uid, values, expected_version)
+        if db_user:
+            event_bus.emit(self.session, *self._change_events(uid, values))
+        self.session.commit()
+
+        return db_user
+
+    @staticmethod
+    def _column_values(user_dict: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Map update fields onto DBUser columns, hashing a new password
+
+        Changing the password or scopes, or disabling the user, bumps the
+        security stamp so tokens issued before the change stop working.
+
+        :param user_dict: the fields to update
+        :return: the column values
+        """
+        password = user_dict.pop("password", None)
+        if password is not None:
+            user_dict["hashed_password"] = get_password_hash(password)
+
+        if (
+            password is not None
+            or user_dict.get("scopes") is not None
+            or user_dict.get("disabled") is True
+        ):
+            user_dict["security_stamp"] = col(DBUser.security_stamp) + 1
+
+        return user_dict
+
+    @staticmethod
+    def _change_events(uid: int, values: Dict[str, Any]) -> List[ChangeEvent]:
+        """
+        Describe an update as change events
+
+        :param uid: the user id
+        :param values: the columns that changed
+        :return: the events, at least UserChanged
+        """
+        events: List[ChangeEvent] = []
+        if "hashed_password" in values:
+            events.append(PasswordChanged(uid))
+        if values.get("disabled") is True:
+            events.append(UserDisabled(uid))
+        if values.get("scopes") is not None:
+            events.append(UserScopesChanged(uid))
+
+        return events or [UserChanged(uid)]
+
+    def _check_new_row(self, uid: int, values: Dict[str, Any]) -> None:
+        """
+        Check that an upsert can insert the user instead of failing in the database
+
+        :param uid: the user id
+        :param values: the columns of the new row
+        :raises RowExistsError: if the id belongs to a user of another realm
+        :raises MissingFieldsError: if a required column has no value
+        """
+        if self.session.get(DBUser, uid) is not None:
+            raise RowExistsError(uid)
+
+        table = DBUser.__table__  # type: ignore[attr-defined]
+        missing = [
+            column.name
+            for column in table.columns
+            if not column.nullable
+            and not column.primary_key
+            and column.default is None
+            and column.name not in values
+        ]
+        if missing:
+            raise MissingFieldsError(missing)
+
+    def _update_returning(
+        self,
+        uid: int,
+        values: Dict[str, Any],
+        expected_version: Optional[int],
+    ) -> Optional[DBUser]:
+        """
+        Issue a single UPDATE ... RETURNING for the given columns
+
+        :param uid: the user id
+        :param values: the columns to change
+        :param expected_version: the version the caller last read, if any
+        :return: the updated user or None if no row matched
+        :raises VersionConflictError: if the row exists at another version
+        """
+        statement = (
+            update(DBUser)
+            .where(col(DBUser.id) == uid, col(DBUser.tenant_id) == self.realm)
+            .values(**values, version=col(DBUser.version) + 1)
+            .returning(DBUser)
+        )
+        if expected_version is not None:
+            statement = statement.where(col(DBUser.version) == expected_version)
+
+        db_user: Optional[DBUser] = self.session.exec(statement).scalar_one_or_none()
+
+        if db_user is None and expected_version is not None:
+            # Only the failure path pays for telling "gone" from "stale"
+            if self.read(uid) is not None:
+                raise VersionConflictError(uid, expected_version)
+
+        return db_user
+
+    def release_connection(self) -> None:
+        """
+        End the read transaction of the session, returning its connection
+
+        The session takes a connection again on its next statement; loaded
+        objects stay usable since the session does not expire on commit.
+        """
+        if not (self.session.new or self.session.dirty or self.session.deleted):
+            self.session.commit()
 
     def delete(self, uid: int) -> bool:
         """
@@ -128,12 +288,12 @@ class UserRepository:
         :return: True if the user was deleted, False otherwise
         :rtype: bool
         """
-        with Session(self.engine) as session:
-            user = session.get(DBUser, uid)
+        user = self.read(uid)
 
-            if not user:
-                return False
+        if not user:
+            return False
 
-            session.delete(user)
-            session.commit()
-            return True
+        self.session.delete(user)
+        event_bus.emit(self.session, UserDeleted(uid))
+        self.session.commit()
+        return True
@@ -0,0 +1,129 @@
+"""
+This module contains the response helpers shared by the routes
+"""
+
+import hashlib
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type
+
+import orjson
+from fastapi import Response, status
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    This class renders JSON responses with orjson
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+@lru_cache(maxsize=None)
+def _fields(schema: Type[BaseModel]) -> Tuple[str, ...]:
+    """
+    This function returns the field names of a response schema
+    """
+    return tuple(schema.model_fields)
+
+
+def project(obj: Any, schema: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    This function copies the fields of a response schema off an object
+
+    Rows read from the database are already valid, so this skips the
+    pydantic validation FastAPI would otherwise run on every response.
+
+    :param obj: the object to serialize, e.g. a DBUser
+    :param schema: the response schema listing the public fields
+    :return: a JSON ready dict
+    """
+    return {field: getattr(obj, field) for field in _fields(schema)}
+
+
+def project_all(objs: Iterable[Any], schema: Type[BaseModel]) -> List[Dict[str, Any]]:
+    """
+    This function projects every object of a listing
+
+    :param objs: the objects to serialize
+    :param schema: the response schema listing the public fields
+    :return: a list of JSON ready dicts
+    """
+    fields = _fields(schema)
+    return [{field: getattr(obj, field) for field in fields} for obj in objs]
+
+
+@dataclass(frozen=True, slots=True)
+class Document:
+    """
+    A JSON document serialized once, with its ETag
+    """
+
+    body: bytes
+    etag: str
+
+    @classmethod
+    def from_bytes(cls, body: bytes) -> "Document":
+        """
+        Derive the ETag of a serialized document from its bytes
+
+        :param body:
+        :return:
+        """
+        return cls(body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+
+    @classmethod
+    def from_content(cls, content: Any) -> "Document":
+        """
+        Serialize the content
+
+        :param content:
+        :return:
+        """
+        return cls.from_bytes(orjson.dumps(content))
+
+    @classmethod
+    def from_file(cls, path: str) -> "Document":
+        """
+        Read a prebuilt JSON file as it is
+
+        :param path:
+        :return:
+        """
+        with open(path, "rb") as file:
+            return cls.from_bytes(file.read())
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """
+        Check an If-None-Match header against the ETag
+
+        :param if_none_match: the header, a list of ETags or "*"
+        :return: True if the client already holds this document
+        """
+        if not if_none_match:
+            return False
+
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or self.etag in tags
+
+
+def serve_document(
+    document: Document, if_none_match: Optional[str], max_age: int
+) -> Response:
+    """
+    This function serves a prebuilt document, or a 304 when the client
+    already holds it
+
+    :param document:
+    :param if_none_match: the If-None-Match header of the request
+    :param max_age: seconds the client may cache the document
+    :return:
+    """
+    headers = {"ETag": document.etag, "Cache-Control": f"public, max-age={max_age}"}
+    if document.matches(if_none_match):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(document.body, media_type="application/json", headers=headers)
@@ -2,30 +2,155 @@
 This module contains the routes for authentication
 """
 
+import secrets
+import time
 from datetime import timedelta
-from typing import Optional
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+from urllib.parse import urlencode
 
-from dependencies import get_user_service
 from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordRequestForm
-from models.user import DBUser
-from schemas.user import UserCreate
-from services.user import UserService
+from fastapi.responses import RedirectResponse
 
-from app.conf import ACCESS_TOKEN_EXPIRE_MINUTES, ALGORITHM, SECRET_KEY
+from app.audit import FAILURE, AuditLog
+from app.conf import (
+    ALGORITHM,
+    STATELESS_TOKENS,
+    TOKEN_AUDIENCE,
+    TOKEN_FORMAT,
+    TOKEN_ISSUER,
+    Settings,
+    get_settings,
+)
+from app.dependencies import (
+    get_audit_log,
+    get_authorization_code_store,
+    get_client_service,
+    get_current_active_user,
+    get_realm,
+    get_token_store,
+    get_user_service,
+    use_primary,
+)
+from app.forms import TokenRequestForm
+from app.lanes import LaneRoute
+from app.models.code import AuthorizationCode
 from app.models.token import Token
+from app.models.user import DBUser, UserSnapshot
+from app.oidc import id_token_claims
+from app.realms import DEFAULT_REALM, realm_key, realm_kid
+from app.responses import ORJSONResponse, project
+from app.schemas.user import UserCreate, UserDisplay
+from app.scopes import EMAIL, OPENID, format_scopes, grant_scopes
+from app.security import verify_code_challenge
+from app.services.client import ClientService
+from app.services.user import UserService
+from app.stores.codes import AuthorizationCodeStore
+from app.stores.tokens import OpaqueTokenStore
+from app.tokens import HMAC_ALGORITHMS
 from app.utils import authenticate_user, create_access_token, register_user
 
-router = APIRouter()
+router = APIRouter(route_class=LaneRoute)
 
+CODE_CHALLENGE_METHODS = frozenset({"S256"})
+
+
+def _redirect(redirect_uri: str, params: Dict[str, Optional[str]]) -> RedirectResponse:
+    """
+    This function redirects back to the client with the given query parameters
+    """
+    query = urlencode({key: value for key, value in params.items() if value})
+    separator = "&" if "?" in redirect_uri else "?"
+    return RedirectResponse(
+        f"{redirect_uri}{separator}{query}", status_code=status.HTTP_302_FOUND
+    )
+
+
+@router.get("/authorize")
+def authorize(
+    response_type: str,
+    client_id: str,
+    redirect_uri: str,
+    code_challenge: str,
+    code_challenge_method: str = "S256",
+    scope: str = "",
+    state: Optional[str] = None,
+    nonce: Optional[str] = None,
+    current_user: UserSnapshot = Depends(get_current_active_user),
+    client_service: ClientService = Depends(get_client_service),
+    code_store: AuthorizationCodeStore = Depends(get_authorization_code_store),
+    audit: AuditLog = Depends(get_audit_log),
+    realm: str = Depends(get_realm),
+    settings: Settings = Depends(get_settings),
+) -> RedirectResponse:
+    """
+    This function issues an authorization code (authorization code grant with PKCE)
+
+    The resource owner is the user behind the Bearer token of the request;
+    there is no login page, so a browser redirected here has to be sent
+    through a front end that holds the user's token.
+    """
+    client = client_service.read_snapshot(client_id)
+
+    # Never redirect to a URI we could not match against the client
+    if client is None or not client.allows_redirect_uri(redirect_uri):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unknown client or redirect_uri",
+        )
+
+    requested_scopes = scope.split()
+    error = None
+    if response_type != "code" or not client.allows_response_type(response_type):
+        error = "unsupported_response_type"
+    elif not client.allows_grant_type("authorization_code"):
+        error = "unauthorized_client"
+    elif code_challenge_method not in CODE_CHALLENGE_METHODS:
+        error = "invalid_request"
+    elif not client.allows_scopes(requested_scopes):
+        error = "invalid_scope"
+
+    if error:
+        audit.record("authorize", FAILURE, current_user.username, client_id, error)
+        return _redirect(redirect_uri, {"error": error, "state": state})
+
+    authorization_code = AuthorizationCode(
+        code=secrets.token_urlsafe(32),
+        client_id=client_id,
+        redirect_uri=redirect_uri,
+        username=current_user.username,
+        scopes=tuple(
+            sorted(
+                grant_scopes(requested_scopes, current_user.scopes or (), client.scope)
+            )
+        ),
+        code_challenge=code_challenge,
+        code_challenge_method=code_challenge_method,
+        expires_at=time.time() + settings.authorization_code_expire_seconds,
+        realm=realm,
+        nonce=nonce,
+    )
+    code_store.save(authorization_code)
+    audit.record(
+        "authorize",
+        actor=current_user.username,
+        target=client_id,
+        detail=format_scopes(authorization_code.scopes),
+    )
+
+    return _redirect(redirect_uri, {"code": authorization_code.code, "state": state})
+
+
+def _password_grant(
+    form_data: TokenRequestForm, service: UserService
+) -> Tuple[DBUser, FrozenSet[str]]:
+    """
+    This function authenticates the resource owner and returns the user
+    and the scopes granted to the token
+    """
+    user = None
+    if form_data.username and form_data.password:
+        user = authenticate_user(service, form_data.username, form_data.password)
 
-@router.post("/token", response_model=Token)
-async def login_for_access_token(
-    form_data: OAuth2PasswordRequestForm = Depends(),
-    service: UserService = Depends(get_user_service),
-) -> Token:
-    """This function logs in for access token"""
-    user = authenticate_user(service, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -33,35 +158,253 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    return user, grant_scopes(form_data.scopes, user.scopes or ())
+
+
+def _authorization_code_grant(
+    form_data: TokenRequestForm,
+    code_store: AuthorizationCodeStore,
+    client_service: ClientService,
+    realm: str,
+) -> AuthorizationCode:
+    """
+    This function redeems an authorization code
+
+    The client is checked again, since it may have been deleted or lost
+    the grant type after the code was issued.
+    """
+    authorization_code = None
+    if form_data.code and form_data.code_verifier:
+        authorization_code = code_store.consume(form_data.code)
+
+    client = None
+    if authorization_code is not None:
+        client = client_service.read_snapshot(authorization_code.client_id)
+
+    if (
+        authorization_code is None
+        or client is None
+        or not client.allows_grant_type("authorization_code")
+        or authorization_code.realm != realm
+        or authorization_code.client_id != form_data.client_id
+        or authorization_code.redirect_uri != form_data.redirect_uri
+        or not verify_code_challenge(
+            form_data.code_verifier or "",
+            authorization_code.code_challenge,
+            authorization_code.code_challenge_method,
+        )
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid authorization code",
+        )
+
+    return authorization_code
+
+
+def _grant(
+    form_data: TokenRequestForm,
+    service: UserService,
+    code_store: AuthorizationCodeStore,
+    client_service: ClientService,
+    realm: str,
+) -> Tuple[Optional[UserSnapshot], str, FrozenSet[str], Optional[str]]:
+    """
+    This function runs the requested grant and returns the user when it
+    was loaded, the username, the scopes granted to the token and the
+    nonce to put in the ID token
+    """
+    if form_data.grant_type == "password":
+        # The client_id becomes the audience of the ID token
+        if (
+            form_data.client_id
+            and client_service.read_snapshot(form_data.client_id) is None
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Unknown client",
+            )
+        db_user, scopes = _password_grant(form_data, service)
+        user = UserSnapshot.from_user(db_user)
+        return user, user.username, scopes, None
+
+    if form_data.grant_type == "authorization_code":
+        code = _authorization_code_grant(form_data, code_store, client_service, realm)
+        return None, code.username, frozenset(code.scopes), code.nonce
+
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Unsupported grant type",
+    )
+
+
+def _token_claims(
+    username: str,
+    scopes: FrozenSet[str],
+    service: UserService,
+    realm: str,
+    user: Optional[UserSnapshot] = None,
+) -> Dict[str, Any]:
+    """
+    This function builds the claims of an access token
+
+    Stateless tokens also carry what get_current_user needs to rebuild
+    the user without loading it, pinned to the user's security stamp.
+    """
+    claims: Dict[str, Any] = {"sub": username, "scope": format_scopes(scopes)}
+    if realm != DEFAULT_REALM:
+        claims["realm"] = realm
+    if TOKEN_ISSUER:
+        claims["iss"] = TOKEN_ISSUER
+    if TOKEN_AUDIENCE:
+        claims["aud"] = TOKEN_AUDIENCE
+    if not STATELESS_TOKENS:
+        return claims
+
+    if user is None:
+        user = service.read_snapshot(username)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid authorization code",
+        )
+
+    claims.update(
+        uid=user.id,
+        email=user.email,
+        disabled=user.disabled,
+        stamp=user.security_stamp,
+    )
+    return claims
+
+
+def _sign(claims: Dict[str, Any], realm: str, expires_delta: timedelta) -> str:
+    """
+    This function signs a JWT with the key of the realm
+    """
+    return create_access_token(
+        data=claims,
+        secret_key=realm_key(realm),
+        algorithm=ALGORITHM,
+        expires_delta=expires_delta,
+        kid=realm_kid(realm),
+    )
+
+
+def _sign_id_token(
+    claims: Dict[str, Any],
+    client_id: str,
+    client_service: ClientService,
+    realm: str,
+    expires_delta: timedelta,
+) -> str:
+    """
+    This function signs an ID token so that its client can verify it
 
-    secret_key = SECRET_KEY or ""
-    algorithm = ALGORITHM or ""
+    RSA/EC ID tokens are signed with the realm key published in the JWKS.
+    HMAC keys are never published, so HS ID tokens are signed with the
+    client's secret instead (OpenID Connect Core 10.1).
+    """
+    if ALGORITHM not in HMAC_ALGORITHMS:
+        return _sign(claims, realm, expires_delta)
 
-    access_token = create_access_token(
-        data={"sub": user.username},
-        secret_key=secret_key,
-        algorithm=algorithm,
-        expires_delta=access_token_expires,
+    client_secret = client_service.read_secret(client_id)
+    if client_secret is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unknown client",
+        )
+    return create_access_token(
+        data=claims,
+        secret_key=client_secret,
+        algorithm=ALGORITHM,
+        expires_delta=expires_delta,
     )
 
-    return Token(access_token=access_token, token_type="bearer")
+
+@router.post("/token", response_model=Token)
+def login_for_access_token(
+    form_data: TokenRequestForm = Depends(),
+    service: UserService = Depends(get_user_service),
+    code_store: AuthorizationCodeStore = Depends(get_authorization_code_store),
+    client_service: ClientService = Depends(get_client_service),
+    token_store: OpaqueTokenStore = Depends(get_token_store),
+    audit: AuditLog = Depends(get_audit_log),
+    realm: str = Depends(get_realm),
+    settings: Settings = Depends(get_settings),
+) -> Token:
+    """This function logs in for access token"""
+    try:
+        user, username, scopes, nonce = _grant(
+            form_data, service, code_store, client_service, realm
+        )
+    except HTTPException:
+        audit.record(
+            "token",
+            FAILURE,
+            form_data.username,
+            form_data.client_id,
+            form_data.grant_type,
+        )
+        raise
+
+    access_token_expires = settings.access_token_expires
+
+    claims = _token_claims(username, scopes, service, realm, user)
+    if TOKEN_FORMAT == "opaque":
+        access_token = token_store.issue(claims, access_token_expires.total_seconds())
+    else:
+        access_token = _sign(claims, realm, access_token_expires)
+
+    id_token = None
+    if OPENID in scopes and form_data.client_id:
+        id_token = _sign_id_token(
+            id_token_claims(
+                username,
+                form_data.client_id,
+                realm,
+                nonce,
+                user if EMAIL in scopes else None,
+            ),
+            form_data.client_id,
+            client_service,
+            realm,
+            access_token_expires,
+        )
+
+    audit.record(
+        "token",
+        actor=username,
+        target=form_data.client_id,
+        detail=f"{form_data.grant_type} {claims['scope']}".rstrip(),
+    )
+    return Token(
+        access_token=access_token,
+        token_type="bearer",
+        scope=claims["scope"],
+        id_token=id_token,
+    )
 
 
-@router.post("/register", response_model=DBUser)
-async def create_user(
+@router.post(
+    "/register", response_model=UserDisplay, dependencies=[Depends(use_primary)]
+)
+def create_user(
     user: UserCreate,
     service: UserService = Depends(get_user_service),
-) -> Optional[DBUser]:
+    audit: AuditLog = Depends(get_audit_log),
+) -> ORJSONResponse:
     """This function registers a new user"""
     new_user: Optional[DBUser] = register_user(
         service, user.username, user.password, user.email
     )
 
     if not new_user:
+        audit.record("register", FAILURE, user.username, detail="already registered")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User already registered",
         )
 
-    return new_user
+    audit.record("register", actor=user.username, target=str(new_user.id))
+    return ORJSONResponse(project(new_user, UserDisplay))
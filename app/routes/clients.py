@@ -4,84 +4,165 @@ This module contains routes for the Client model
 
 from typing import Optional, Sequence
 
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Response,
+    Security,
+    status,
+)
 
+from app.audit import FAILURE, AuditLog
+from app.conf import Settings, get_settings
 from app.dependencies import (
+    get_audit_log,
     get_client_service,
     get_current_active_user,
-    get_session,
 )
+from app.exceptions import (
+    MissingFieldsError,
+    RowExistsError,
+    VersionConflictError,
+)
+from app.lanes import LaneRoute
 from app.models.client import DBClient
-from app.models.user import DBUser
-from app.schemas.client import ClientCreate, ClientUpdate
+from app.models.user import UserSnapshot
+from app.responses import ORJSONResponse, project, project_all, serve_document
+from app.schemas.client import (
+    ClientCreate,
+    ClientDisplay,
+    ClientMetadata,
+    ClientUpdate,
+)
+from app.scopes import READ_CLIENTS, WRITE_CLIENTS
 from app.services.client import ClientService
 
-router = APIRouter()
+router = APIRouter(route_class=LaneRoute)
 
 
-@router.get("", response_model=list[DBClient])
-async def read_clients(
-    current_user: DBUser = Depends(get_current_active_user),  # noqa: F841
+@router.get("", response_model=list[ClientDisplay])
+def read_clients(
+    current_user: UserSnapshot = Security(  # noqa: F841
+        get_current_active_user, scopes=[READ_CLIENTS]
+    ),
     service: ClientService = Depends(get_client_service),
-) -> Sequence[DBClient]:
+) -> ORJSONResponse:
     """This function reads all clients"""
-    return service.read_all()
+    clients: Sequence[DBClient] = service.read_all()
+    return ORJSONResponse(project_all(clients, ClientDisplay))
 
 
-@router.post("", response_model=DBClient)
-async def create_client(
+@router.post("", response_model=ClientDisplay)
+def create_client(
     client_create: ClientCreate,
-    db: Session = Depends(get_session),
-    current_user: DBUser = Depends(get_current_active_user),  # noqa: F841
-) -> DBClient:
+    service: ClientService = Depends(get_client_service),
+    current_user: UserSnapshot = Security(
+        get_current_active_user, scopes=[WRITE_CLIENTS]
+    ),
+    audit: AuditLog = Depends(get_audit_log),
+) -> ORJSONResponse:
     """This function creates a new client"""
-    db_client = DBClient(
-        client_id=client_create.client_id,
-        client_secret=client_create.client_secret,
-        redirect_uris=client_create.redirect_uris,
-        grant_types=client_create.grant_types,
-        response_types=client_create.response_types,
-        client_name=client_create.client_name,
-        client_uri=client_create.client_uri,
-        logo_uri=client_create.logo_uri,
-        scope=client_create.scope,
-        contacts=client_create.contacts,
-        tos_uri=client_create.tos_uri,
-        policy_uri=client_create.policy_uri,
+    db_client = service.create(client_create)
+    audit.record(
+        "client.create", actor=current_user.username, target=db_client.client_id
     )
-    db.add(db_client)
-    db.commit()
-    db.refresh(db_client)
 
-    return db_client
+    return ORJSONResponse(project(db_client, ClientDisplay))
 
 
-@router.get("/{client_id}", response_model=DBClient)
-async def read_client(
-    client_id: int, service: ClientService = Depends(get_client_service)
-) -> Optional[DBClient]:
-    """This function reads a client"""
-    return service.read(client_id)
+@router.get("/{client_id}", response_model=ClientMetadata)
+def read_client(
+    client_id: int,
+    if_none_match: Optional[str] = Header(None),
+    service: ClientService = Depends(get_client_service),
+    settings: Settings = Depends(get_settings),
+) -> Response:
+    """This function reads the public metadata of a client"""
+    document = service.read_metadata(client_id)
+    if document is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Client not found"
+        )
+    return serve_document(
+        document, if_none_match, settings.client_metadata_max_age_seconds
+    )
 
 
-@router.put("/{client_id}", response_model=DBClient)
-async def update_client(
+@router.put("/{client_id}", response_model=Optional[ClientDisplay])
+def update_client(
     client_id: int,
     client: ClientUpdate,
     service: ClientService = Depends(get_client_service),
-    current_user: DBUser = Depends(get_current_active_user),  # noqa: F841
-) -> Optional[DBClient]:
+    current_user: UserSnapshot = Security(
+        get_current_active_user, scopes=[WRITE_CLIENTS]
+    ),
+    audit: AuditLog = Depends(get_audit_log),
+) -> ORJSONResponse:
     """This function updates a client"""
-    return service.update(client_id, client)
+    try:
+        db_client = service.update(client_id, client)
+    except VersionConflictError as err:
+        audit.record(
+            "client.update", FAILURE, current_user.username, str(client_id), str(err)
+        )
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=str(err)
+        ) from err
+    except RowExistsError as err:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=str(err)
+        ) from err
+    except MissingFieldsError as err:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(err)
+        ) from err
+
+    audit.record("client.update", actor=current_user.username, target=str(client_id))
+    return ORJSONResponse(project(db_client, ClientDisplay) if db_client else None)
+
+
+@router.patch("/{client_id}", response_model=ClientDisplay)
+def patch_client(
+    client_id: int,
+    client: ClientUpdate,
+    service: ClientService = Depends(get_client_service),
+    current_user: UserSnapshot = Security(
+        get_current_active_user, scopes=[WRITE_CLIENTS]
+    ),
+    audit: AuditLog = Depends(get_audit_log),
+) -> ORJSONResponse:
+    """This function partially updates a client"""
+    try:
+        db_client = service.patch(client_id, client)
+    except VersionConflictError as err:
+        audit.record(
+            "client.patch", FAILURE, current_user.username, str(client_id), str(err)
+        )
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=str(err)
+        ) from err
+
+    if not db_client:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Client not found"
+        )
+    audit.record("client.patch", actor=current_user.username, target=str(client_id))
+    return ORJSONResponse(project(db_client, ClientDisplay))
 
 
 @router.delete("/{client_id}")
-async def delete_client(
+def delete_client(
     client_id: int,
     service: ClientService = Depends(get_client_service),
-    current_user: DBUser = Depends(get_current_active_user),  # noqa: F841
+    current_user: UserSnapshot = Security(
+        get_current_active_user, scopes=[WRITE_CLIENTS]
+    ),
+    audit: AuditLog = Depends(get_audit_log),
 ) -> None:
     """This function deletes a client"""
-    service.delete(client_id)
-    return None
+    if service.delete(client_id):
+        audit.record(
+            "client.delete", actor=current_user.username, target=str(client_id)
+        )
@@ -0,0 +1,40 @@
+"""
+This module contains the diagnostics routes, only mounted when PROFILING_ENABLED
+"""
+
+from fastapi import APIRouter, HTTPException, Query, Security, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+
+from app.conf import PROFILE_MAX_SECONDS
+from app.dependencies import get_current_active_user
+from app.exceptions import ProfilerBusyError
+from app.models.user import UserSnapshot
+from app.profiler import format_collapsed, sampler
+from app.scopes import ADMIN
+
+router = APIRouter()
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(10.0, gt=0, le=PROFILE_MAX_SECONDS),
+    interval: float = Query(0.005, ge=0.001, le=1.0),
+    current_user: UserSnapshot = Security(  # noqa: F841
+        get_current_active_user, scopes=[ADMIN]
+    ),
+) -> PlainTextResponse:
+    """
+    This function samples the stacks of this worker for a number of seconds
+
+    The body is in the collapsed stack format, ready for flamegraph.pl or
+    speedscope.
+    """
+    try:
+        stacks = await run_in_threadpool(sampler.sample, seconds, interval)
+    except ProfilerBusyError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=str(exc)
+        ) from exc
+
+    return PlainTextResponse(format_collapsed(stacks))
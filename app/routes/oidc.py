@@ -0,0 +1,70 @@
+"""
+This module contains the routes for OpenID Connect
+"""
+
+from typing import Dict, Optional
+
+from fastapi import APIRouter, Depends, Header, Response, Security
+
+from app.conf import Settings, get_settings
+from app.dependencies import (
+    get_current_active_user,
+    get_realm,
+    get_token_store,
+    read_token_claims,
+)
+from app.models.user import UserSnapshot
+from app.oidc import get_discovery_document, get_jwks_document
+from app.responses import ORJSONResponse, serve_document
+from app.scopes import EMAIL, OPENID
+from app.stores.tokens import OpaqueTokenStore
+from app.utils import oauth2_scheme
+
+router = APIRouter()
+
+
+@router.get("/.well-known/openid-configuration")
+async def openid_configuration(
+    if_none_match: Optional[str] = Header(None),
+    settings: Settings = Depends(get_settings),
+) -> Response:
+    """This function serves the OpenID Provider metadata"""
+    return serve_document(
+        get_discovery_document(), if_none_match, settings.discovery_max_age_seconds
+    )
+
+
+@router.get("/.well-known/jwks.json")
+async def jwks(
+    if_none_match: Optional[str] = Header(None),
+    settings: Settings = Depends(get_settings),
+) -> Response:
+    """This function serves the public keys tokens are signed with"""
+    return serve_document(
+        get_jwks_document(), if_none_match, settings.discovery_max_age_seconds
+    )
+
+
+@router.get("/userinfo")
+def userinfo(
+    current_user: UserSnapshot = Security(get_current_active_user, scopes=[OPENID]),
+    token: str = Depends(oauth2_scheme),
+    token_store: OpaqueTokenStore = Depends(get_token_store),
+    realm: str = Depends(get_realm),
+) -> ORJSONResponse:
+    """
+    This function returns the claims about the current user
+
+    The user comes from the verified token, so with stateless tokens no
+    query is made beyond the cached security stamp check. The email is
+    only returned to tokens granted the email scope; the token was just
+    verified, so reading its scopes again is a cache hit.
+    """
+    claims: Dict[str, str] = {
+        "sub": current_user.username,
+        "preferred_username": current_user.username,
+    }
+    token_claims = read_token_claims(token, token_store, realm)
+    if token_claims is not None and EMAIL in token_claims.scopes:
+        claims["email"] = current_user.email
+    return ORJSONResponse(claims, headers={"Cache-Control": "no-store"})
@@ -1,6 +1,18 @@
-from fastapi import APIRouter
+from typing import Any, Dict
+
+from fastapi import APIRouter, Security
 from schemas.status import StatusResponse
 
+from app.dependencies import (
+    get_admission_controller,
+    get_audit_log,
+    get_current_active_user,
+    pool_metrics,
+)
+from app.models.user import UserSnapshot
+from app.scheduler import scheduler
+from app.scopes import ADMIN
+
 router = APIRouter()
 
 
@@ -17,3 +29,33 @@ async def health_startup() -> StatusResponse:
 @router.get("/ready", response_model=StatusResponse)
 async def health_ready() -> StatusResponse:
     return StatusResponse(status="ready")
+
+
+@router.get("/jobs")
+async def health_jobs(
+    current_user: UserSnapshot = Security(  # noqa: F841
+        get_current_active_user, scopes=[ADMIN]
+    ),
+) -> Dict[str, Dict[str, Any]]:
+    """This function reports the runs, purged rows and lag of the background jobs"""
+    return scheduler.metrics()
+
+
+@router.get("/audit")
+async def health_audit(
+    current_user: UserSnapshot = Security(  # noqa: F841
+        get_current_active_user, scopes=[ADMIN]
+    ),
+) -> Dict[str, int]:
+    """This function reports the queued, written and dropped audit events"""
+    return get_audit_log().metrics()
+
+
+@router.get("/pool")
+async def health_pool(
+    current_user: UserSnapshot = Security(  # noqa: F841
+        get_current_active_user, scopes=[ADMIN]
+    ),
+) -> Dict[str, Any]:
+    """This function reports the database pool usage and the requests shed"""
+    return {**pool_metrics(), "shed": get_admission_controller().shed}
@@ -4,91 +4,204 @@ This module contains routes for the User model
 
 from typing import Optional, Sequence
 
-from dependencies import get_user_service
-from fastapi import APIRouter, Depends, HTTPException, status
-from schemas.status import StatusResponse
-from schemas.user import UserUpdate
-from services.user import UserService
+from fastapi import APIRouter, Depends, HTTPException, Security, status
+
+from app.audit import FAILURE, AuditLog
+from app.dependencies import (
+    get_audit_log,
+    get_current_active_user,
+    get_user_service,
+)
+from app.exceptions import (
+    MissingFieldsError,
+    RowExistsError,
+    VersionConflictError,
+)
+from app.lanes import LaneRoute
+from app.models.user import DBUser, UserSnapshot
+from app.responses import ORJSONResponse, project, project_all
+from app.schemas.detail import DetailResponse
+from app.schemas.user import UserDisplay, UserScopesUpdate, UserUpdate
+from app.scopes import ADMIN, READ_USERS, SCOPES, WRITE_USERS
+from app.services.user import UserService
+
+router = APIRouter(route_class=LaneRoute)
+
+
+def _forbid_scope_changes(user: UserUpdate) -> None:
+    """
+    This function rejects updates that change scopes, which need the admin
+    scope and go through PUT /users/{uid}/scopes
+    """
+    if user.scopes is not None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Scopes are changed at /users/{uid}/scopes with the admin scope",
+        )
 
-from app.dependencies import get_current_active_user
-from app.models.user import DBUser
 
-router = APIRouter()
+def _forbid_password_changes(
+    uid: int, user: UserUpdate, current_user: UserSnapshot
+) -> None:
+    """
+    This function rejects updates that set the password of another user,
+    which would let a write:users holder log in as anyone, admins included
+    """
+    if user.password is not None and uid != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Users can only change their own password",
+        )
 
 
-@router.get("/me", response_model=DBUser)
+@router.get("/me", response_model=UserDisplay)
 async def read_users_me(
-    current_user: DBUser = Depends(get_current_active_user),
-) -> DBUser:
+    current_user: UserSnapshot = Depends(get_current_active_user),
+) -> ORJSONResponse:
     """This function reads the current user"""
-    return current_user
+    return ORJSONResponse(project(current_user, UserDisplay))
 
 
-@router.get("", response_model=Sequence[DBUser])
-async def read_users(
+@router.get("", response_model=Sequence[UserDisplay])
+def read_users(
     service: UserService = Depends(get_user_service),
-    current_user: DBUser = Depends(get_current_active_user),
-) -> Sequence[DBUser]:
+    current_user: UserSnapshot = Security(  # noqa: F841
+        get_current_active_user, scopes=[READ_USERS]
+    ),
+) -> ORJSONResponse:
     """This function reads all users"""
-    if not current_user:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not allowed to read all users",
-        )
-
     users: Sequence[DBUser] = service.read_all()
-    return users
+    return ORJSONResponse(project_all(users, UserDisplay))
 
 
-@router.get("/{uid}", response_model=DBUser)
-async def read_user(
+@router.get("/{uid}", response_model=UserDisplay)
+def read_user(
     uid: int,
     service: UserService = Depends(get_user_service),
-    current_user: DBUser = Depends(get_current_active_user),
-) -> Optional[DBUser]:
+    current_user: UserSnapshot = Security(  # noqa: F841
+        get_current_active_user, scopes=[READ_USERS]
+    ),
+) -> ORJSONResponse:
     """This function reads a user by uid"""
-    if not current_user:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not allowed to read this user",
-        )
-
     user: Optional[DBUser] = service.read(uid)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
-    return user
+    return ORJSONResponse(project(user, UserDisplay))
 
 
-@router.put("/{uid}", response_model=DBUser)
-async def update_user(
+@router.put("/{uid}", response_model=UserDisplay)
+def update_user(
     uid: int,
     user: UserUpdate,
     service: UserService = Depends(get_user_service),
-    current_user: DBUser = Depends(get_current_active_user),
-) -> Optional[DBUser]:
+    current_user: UserSnapshot = Security(
+        get_current_active_user, scopes=[WRITE_USERS]
+    ),
+    audit: AuditLog = Depends(get_audit_log),
+) -> ORJSONResponse:
     """This function updates a user by uid"""
-    if not current_user:
+    _forbid_scope_changes(user)
+    _forbid_password_changes(uid, user, current_user)
+    try:
+        updated_user: Optional[DBUser] = service.update(uid, user)
+    except VersionConflictError as err:
+        audit.record("user.update", FAILURE, current_user.username, str(uid), str(err))
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not allowed to update this user",
+            status_code=status.HTTP_409_CONFLICT, detail=str(err)
+        ) from err
+    except RowExistsError as err:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=str(err)
+        ) from err
+    except MissingFieldsError as err:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(err)
+        ) from err
+
+    audit.record("user.update", actor=current_user.username, target=str(uid))
+    return ORJSONResponse(project(updated_user, UserDisplay) if updated_user else None)
+
+
+@router.patch("/{uid}", response_model=UserDisplay)
+def patch_user(
+    uid: int,
+    user: UserUpdate,
+    service: UserService = Depends(get_user_service),
+    current_user: UserSnapshot = Security(
+        get_current_active_user, scopes=[WRITE_USERS]
+    ),
+    audit: AuditLog = Depends(get_audit_log),
+) -> ORJSONResponse:
+    """This function partially updates a user by uid"""
+    _forbid_scope_changes(user)
+    _forbid_password_changes(uid, user, current_user)
+    try:
+        patched_user: Optional[DBUser] = service.patch(uid, user)
+    except VersionConflictError as err:
+        audit.record("user.patch", FAILURE, current_user.username, str(uid), str(err))
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=str(err)
+        ) from err
+
+    if not patched_user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
-    updated_user: Optional[DBUser] = service.update(uid, user)
-    return updated_user
+    audit.record("user.patch", actor=current_user.username, target=str(uid))
+    return ORJSONResponse(project(patched_user, UserDisplay))
 
 
-@router.delete("/{uid}")
-async def delete_user(
+@router.put("/{uid}/scopes", response_model=UserDisplay)
+def update_user_scopes(
     uid: int,
+    update: UserScopesUpdate,
     service: UserService = Depends(get_user_service),
-    current_user: DBUser = Depends(get_current_active_user),
-) -> StatusResponse:
-    """This function deletes a user by uid"""
-    if not current_user:
+    current_user: UserSnapshot = Security(get_current_active_user, scopes=[ADMIN]),
+    audit: AuditLog = Depends(get_audit_log),
+) -> ORJSONResponse:
+    """This function replaces the scopes held by a user"""
+    unknown = set(update.scopes) - set(SCOPES)
+    if unknown:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not allowed to delete this user",
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown scopes: {', '.join(sorted(unknown))}",
+        )
+
+    try:
+        patched_user: Optional[DBUser] = service.patch(
+            uid, UserUpdate(scopes=update.scopes, version=update.version)
         )
-    service.delete(uid)
-    return {"detail": "User deleted"}
+    except VersionConflictError as err:
+        audit.record("user.scopes", FAILURE, current_user.username, str(uid), str(err))
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=str(err)
+        ) from err
+
+    if not patched_user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+    audit.record(
+        "user.scopes",
+        actor=current_user.username,
+        target=str(uid),
+        detail=" ".join(sorted(update.scopes)),
+    )
+    return ORJSONResponse(project(patched_user, UserDisplay))
+
+
+@router.delete("/{uid}", response_model=DetailResponse)
+def delete_user(
+    uid: int,
+    service: UserService = Depends(get_user_service),
+    current_user: UserSnapshot = Security(
+        get_current_active_user, scopes=[WRITE_USERS]
+    ),
+    audit: AuditLog = Depends(get_audit_log),
+) -> DetailResponse:
+    """This function deletes a user by uid"""
+    if service.delete(uid):
+        audit.record("user.delete", actor=current_user.username, target=str(uid))
+    return DetailResponse(detail="User deleted")
@@ -0,0 +1,203 @@
+"""
+This module contains the background scheduler started by the lifespan handler
+
+Jobs are plain functions run in a worker thread at a fixed interval, so a
+slow job never blocks the event loop and a failing job is logged and tried
+again at its next run.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional, Type
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.engine import Engine
+from sqlmodel import SQLModel
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class JobMetrics:
+    """
+    The counters of one scheduled job
+    """
+
+    runs: int = 0
+    failures: int = 0
+    last_run: Optional[float] = None
+    last_duration: Optional[float] = None
+    last_result: Optional[int] = None
+    total: int = 0
+    lag: Optional[float] = None
+
+
+@dataclass(slots=True)
+class Job:
+    """
+    A function the scheduler runs every interval seconds
+
+    The function returns how much work it did, e.g. the rows it purged,
+    and may expose how far behind it is as a lag attribute.
+    """
+
+    name: str
+    interval: float
+    target: Callable[[], int]
+    metrics: JobMetrics
+
+    def run_once(self) -> None:
+        """
+        This function runs the job and records its metrics
+        """
+        started = time.monotonic()
+        self.metrics.runs += 1
+        self.metrics.last_run = time.time()
+        try:
+            result = self.target()
+        except Exception:  # pylint: disable=broad-exception-caught
+            self.metrics.failures += 1
+            logger.exception("Scheduled job %s failed", self.name)
+        else:
+            self.metrics.last_result = result
+            self.metrics.total += result
+            self.metrics.lag = getattr(self.target, "lag", None)
+        self.metrics.last_duration = time.monotonic() - started
+
+
+class Scheduler:
+    """
+    This class runs jobs periodically on the event loop of the application
+    """
+
+    def __init__(self) -> None:
+        self.jobs: Dict[str, Job] = {}
+        self._tasks: List["asyncio.Task[None]"] = []
+
+    def every(self, interval: float, name: str, target: Callable[[], int]) -> Job:
+        """
+        This function registers a job
+
+        :param interval: seconds between two runs
+        :param name: the name the metrics are reported under
+        :param target: the function to run
+        :return: the job
+        """
+        job = Job(name, interval, target, JobMetrics())
+        self.jobs[name] = job
+        return job
+
+    @staticmethod
+    async def _loop(job: Job) -> None:
+        while True:
+            await asyncio.to_thread(job.run_once)
+            await asyncio.sleep(job.interval)
+
+    def start(self) -> None:
+        """
+        This function starts every registered job
+        """
+        self._tasks = [
+            asyncio.create_task(self._loop(job), name=job.name)
+            for job in self.jobs.values()
+        ]
+
+    async def stop(self) -> None:
+        """
+        This function cancels the jobs and waits for them to finish
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """
+        This function reports the metrics of every job
+
+        :return: the metrics by job name
+        """
+        return {name: asdict(job.metrics) for name, job in self.jobs.items()}
+
+
+class ExpiredRowPurger:  # pylint: disable=too-many-instance-attributes
+    """
+    This class deletes the expired rows of a table in small batches
+
+    Each batch is its own short transaction that deletes at most batch_size
+    rows picked by primary key, followed by a pause, so the purge never
+    holds a lock for long or keeps a pooled connection busy. A run stops
+    after max_batches; whatever is left is picked up by the next run and
+    shows up as lag.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        engine: Engine,
+        model: Type[SQLModel],
+        key: str,
+        expires: str,
+        cutoff: Callable[[], float] = time.time,
+        batch_size: int = 500,
+        pause: float = 0.05,
+        max_batches: int = 100,
+    ) -> None:
+        self.engine = engine
+        self.table = model.__table__  # type: ignore[attr-defined]
+        self.key = self.table.c[key]
+        self.expires = self.table.c[expires]
+        self.cutoff = cutoff
+        self.batch_size = batch_size
+        self.pause = pause
+        self.max_batches = max_batches
+        self.lag: float = 0.0
+
+    def _purge_batch(self, now: float) -> int:
+        """
+        This function deletes one batch of expired rows
+
+        :param now: rows expiring at or before this time are purged
+        :return: the number of rows deleted
+        """
+        batch = (
+            select(self.key).where(self.expires <= now).limit(self.batch_size)
+        ).scalar_subquery()
+        with self.engine.begin() as connection:
+            result = connection.execute(delete(self.table).where(self.key.in_(batch)))
+        return int(result.rowcount)
+
+    def _measure_lag(self, now: float) -> float:
+        """
+        This function measures how far behind the purge is
+
+        :param now:
+        :return: seconds the oldest expired row has been waiting, 0 if none is
+        """
+        with self.engine.connect() as connection:
+            oldest = connection.execute(
+                select(func.min(self.expires)).where(self.expires <= now)
+            ).scalar()
+        return 0.0 if oldest is None else now - float(oldest)
+
+    def __call__(self) -> int:
+        """
+        This function purges expired rows
+
+        :return: the number of rows deleted
+        """
+        now = self.cutoff()
+        purged = 0
+        for _ in range(self.max_batches):
+            deleted = self._purge_batch(now)
+            purged += deleted
+            if deleted < self.batch_size:
+                break
+            time.sleep(self.pause)
+
+        self.lag = self._measure_lag(now)
+        return purged
+
+
+scheduler = Scheduler()
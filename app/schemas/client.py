@@ -2,9 +2,9 @@
 This module contains the Client schema
 """
 
-from typing import List, Optional
+from typing import Any, List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 
 
 class Client(BaseModel):
@@ -26,6 +26,46 @@ class Client(BaseModel):
     policy_uri: Optional[str] = None
 
 
+class ClientDisplay(BaseModel):
+    """
+    This is the Client model for display, it never includes the secret
+    """
+
+    id: Optional[int] = None
+    client_id: str
+    redirect_uris: Optional[List[str]] = None
+    grant_types: Optional[List[str]] = None
+    response_types: Optional[List[str]] = None
+    client_name: Optional[str] = None
+    client_uri: Optional[str] = None
+    logo_uri: Optional[str] = None
+    scope: Optional[List[str]] = None
+    contacts: Optional[list[str]] = None
+    tos_uri: Optional[str] = None
+    policy_uri: Optional[str] = None
+    version: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+
+class ClientMetadata(BaseModel):
+    """
+    This is the public Client model shown to users, e.g. on consent screens;
+    it leaves out the secret and the registration details
+    """
+
+    id: int
+    client_id: str
+    client_name: Optional[str] = None
+    client_uri: Optional[str] = None
+    logo_uri: Optional[str] = None
+    scope: Optional[List[str]] = None
+    tos_uri: Optional[str] = None
+    policy_uri: Optional[str] = None
+    version: int
+
+
 class ClientCreate(BaseModel):
     """
     This is the Client model for creation
@@ -62,3 +102,17 @@ class ClientUpdate(BaseModel):
     contacts: Optional[list[str]] = None
     tos_uri: Optional[str] = None
     policy_uri: Optional[str] = None
+    version: Optional[int] = None
+
+    @field_validator("client_id", "client_secret")
+    @classmethod
+    def not_null(cls, value: Optional[Any]) -> Any:
+        """
+        Reject an explicit null for a field the client must keep
+
+        :param value:
+        :return:
+        """
+        if value is None:
+            raise ValueError("may be left out but not null")
+        return value
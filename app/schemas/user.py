@@ -2,9 +2,9 @@
 This module contains the User schema
 """
 
-from typing import Optional
+from typing import Any, List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 
 
 class UserDisplay(BaseModel):
@@ -16,6 +16,8 @@ class UserDisplay(BaseModel):
     username: str
     email: str
     disabled: Optional[bool] = False
+    scopes: Optional[List[str]] = None
+    version: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -41,6 +43,30 @@ class UserUpdate(BaseModel):
     email: Optional[str] = None
     password: Optional[str] = None
     disabled: Optional[bool] = False
+    scopes: Optional[List[str]] = None
+    version: Optional[int] = None
+
+    @field_validator("username", "email", "disabled")
+    @classmethod
+    def not_null(cls, value: Optional[Any]) -> Any:
+        """
+        Reject an explicit null for a field the user must keep
+
+        :param value:
+        :return:
+        """
+        if value is None:
+            raise ValueError("may be left out but not null")
+        return value
+
+
+class UserScopesUpdate(BaseModel):
+    """
+    This is the User model for changing the scopes a user holds
+    """
+
+    scopes: List[str]
+    version: Optional[int] = None
 
 
 class UserLogin(BaseModel):
@@ -0,0 +1,80 @@
+"""
+This module contains the OAuth2 scopes understood by the server
+"""
+
+from functools import lru_cache
+from typing import FrozenSet, Iterable, Optional
+
+READ_USERS = "read:users"
+WRITE_USERS = "write:users"
+READ_CLIENTS = "read:clients"
+WRITE_CLIENTS = "write:clients"
+ADMIN = "admin"
+# OpenID Connect consent scopes
+OPENID = "openid"
+PROFILE = "profile"
+EMAIL = "email"
+
+SCOPES = {
+    READ_USERS: "Read user data",
+    WRITE_USERS: "Modify user data",
+    READ_CLIENTS: "Read client data",
+    WRITE_CLIENTS: "Modify client data",
+    ADMIN: "Operate the server (diagnostics and maintenance)",
+}
+
+
+@lru_cache(maxsize=1024)
+def parse_scopes(scope: str) -> FrozenSet[str]:
+    """
+    This function parses a space separated scope string into a frozenset
+
+    Tokens issued to the same kind of caller carry the same scope string,
+    so the cache turns parsing into a dict lookup after the first request.
+
+    :param scope: the scope string, e.g. "read:users write:users"
+    :return: the scopes
+    """
+    return frozenset(scope.split())
+
+
+def format_scopes(scopes: Iterable[str]) -> str:
+    """
+    This function formats scopes as a canonical space separated string
+
+    :param scopes: the scopes
+    :return: the scope string
+    """
+    return " ".join(sorted(set(scopes)))
+
+
+def grant_scopes(
+    requested: Iterable[str],
+    held: Iterable[str],
+    registered: Optional[Iterable[str]] = None,
+) -> FrozenSet[str]:
+    """
+    This function works out the scopes a token may carry
+
+    Privileged scopes (those listed in SCOPES) are only granted when the user
+    holds them; other scopes such as "openid" are consent scopes and pass
+    through. For a client, only the scopes it registered are granted and
+    asking for nothing asks for those; without one, asking for nothing
+    grants nothing.
+
+    :param requested: the scopes asked for
+    :param held: the scopes assigned to the user
+    :param registered: the scopes registered for the client, if any
+    :return: the granted scopes
+    """
+    held_scopes = frozenset(held)
+    requested_scopes = frozenset(requested)
+    if registered is not None:
+        registered_scopes = frozenset(registered)
+        requested_scopes = (requested_scopes or registered_scopes) & registered_scopes
+
+    return frozenset(
+        scope
+        for scope in requested_scopes
+        if scope in held_scopes or scope not in SCOPES
+    )
@@ -1,5 +1,9 @@
 # app/security.py
 
+import base64
+import hashlib
+import hmac
+
 from passlib.context import CryptContext
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -14,3 +18,24 @@ def get_password_hash(password: str) -> str:
     """
     hashed_password: str = pwd_context.hash(password)
     return hashed_password
+
+
+def verify_code_challenge(code_verifier: str, code_challenge: str, method: str) -> bool:
+    """
+    This function checks a PKCE code verifier against its challenge (RFC 7636)
+
+    :param code_verifier: the verifier sent to the token endpoint
+    :param code_challenge: the challenge sent to the authorization endpoint
+    The plain method is refused: it sends the verifier itself as the
+    challenge, so anyone who sees the authorization request can redeem it.
+
+    :param method: the challenge method, only S256 is accepted
+    :return: True if the verifier matches the challenge
+    """
+    if method != "S256":
+        return False
+
+    digest = hashlib.sha256(code_verifier.encode("ascii")).digest()
+    expected = base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+    return hmac.compare_digest(expected, code_challenge)
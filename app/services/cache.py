@@ -0,0 +1,433 @@
+"""
+This module contains the snapshot caches shared by the services
+
+Every cache implements CacheBackend. The default keeps snapshots in the
+worker (SnapshotCache); with CACHE_BACKEND=redis the workers share one
+Redis-protocol server and tell each other about writes over pub/sub.
+"""
+
+import dataclasses
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    get_origin,
+)
+
+import orjson
+
+from app.conf import CACHE_BACKEND, CACHE_URL
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend(ABC, Generic[T]):
+    """
+    This class is the interface of the snapshot caches
+
+    Snapshots are looked up by key, e.g. a username or a client_id, and
+    dropped by the primary key of their row when it is written.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[T]:
+        """
+        Get a cached snapshot.
+
+        :param key: The lookup key.
+        :return: The snapshot or None on a miss.
+        """
+
+    @abstractmethod
+    def put(self, key: str, uid: int, snapshot: T, ttl: Optional[float] = None) -> None:
+        """
+        Cache a snapshot.
+
+        :param key: The lookup key.
+        :param uid: The primary key of the row the snapshot was taken from.
+        :param snapshot: The snapshot.
+        :param ttl: The seconds this entry is kept, instead of the cache's ttl.
+        """
+
+    @abstractmethod
+    def invalidate(self, uid: int) -> None:
+        """
+        Drop the cached snapshot of a row.
+
+        :param uid: The primary key of the row.
+        """
+
+    @abstractmethod
+    def clear(self) -> None:
+        """
+        Drop every cached snapshot.
+        """
+
+
+class SnapshotCache(CacheBackend[T]):
+    """
+    This class holds read-only snapshots by key, e.g. a username or a
+    client_id, and drops them by primary key when the row is written
+
+    The least recently used entries are evicted beyond maxsize; with a
+    ttl, entries also expire so other workers' writes show up in time.
+    """
+
+    def __init__(self, maxsize: int = 100_000, ttl: Optional[float] = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[T, float, int]]" = OrderedDict()
+        self._keys: Dict[int, str] = {}
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[T]:
+        """
+        Get a cached snapshot.
+
+        :param key: The lookup key.
+        :return: The snapshot or None on a miss or once it expired.
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+
+        try:
+            self._entries.move_to_end(key)
+        except KeyError:  # evicted concurrently
+            pass
+        return entry[0]
+
+    def put(self, key: str, uid: int, snapshot: T, ttl: Optional[float] = None) -> None:
+        """
+        Cache a snapshot.
+
+        :param key: The lookup key.
+        :param uid: The primary key of the row the snapshot was taken from.
+        :param snapshot: The snapshot.
+        :param ttl: The seconds this entry is kept, instead of the cache's ttl.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if ttl == 0 or self.maxsize <= 0:
+            return
+
+        expires_at = time.monotonic() + ttl if ttl else float("inf")
+        with self._lock:
+            previous = self._keys.get(uid)
+            if previous is not None and previous != key:
+                self._entries.pop(previous, None)
+            self._entries[key] = (snapshot, expires_at, uid)
+            self._entries.move_to_end(key)
+            self._keys[uid] = key
+            while len(self._entries) > self.maxsize:
+                evicted, (_, _, evicted_uid) = self._entries.popitem(last=False)
+                if self._keys.get(evicted_uid) == evicted:
+                    del self._keys[evicted_uid]
+
+    def invalidate(self, uid: int) -> None:
+        """
+        Drop the cached snapshot of a row.
+
+        :param uid: The primary key of the row.
+        """
+        with self._lock:
+            key = self._keys.pop(uid, None)
+            if key is not None:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Drop every cached snapshot.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _encode_set(value: Any) -> Any:
+    """
+    Encode the frozensets orjson does not know as sorted lists
+    """
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError
+
+
+class SnapshotCodec(Generic[T]):
+    """
+    This class turns snapshot dataclasses into bytes and back
+    """
+
+    def __init__(self, snapshot_type: Type[T]) -> None:
+        self._factory: Callable[..., T] = snapshot_type
+        fields = dataclasses.fields(snapshot_type)  # type: ignore[arg-type]
+        self._fields = tuple(field.name for field in fields)
+        # Lists decode back into the collection type of their field
+        self._collections: Dict[str, Callable[[Any], Any]] = {
+            field.name: frozenset if get_origin(field.type) is frozenset else tuple
+            for field in fields
+        }
+
+    def encode(self, uid: int, snapshot: T) -> bytes:
+        """
+        Encode a snapshot together with the primary key of its row
+
+        :param uid:
+        :param snapshot:
+        :return:
+        """
+        return orjson.dumps(
+            [uid, {name: getattr(snapshot, name) for name in self._fields}],
+            default=_encode_set,
+        )
+
+    def decode(self, data: bytes) -> Tuple[int, T]:
+        """
+        Decode a snapshot, turning lists back into tuples or frozensets
+
+        :param data:
+        :return: the primary key and the snapshot
+        """
+        uid, values = orjson.loads(data)
+        return uid, self._factory(
+            **{
+                name: (
+                    self._collections[name](value) if isinstance(value, list) else value
+                )
+                for name, value in values.items()
+            }
+        )
+
+
+# pylint: disable-next=too-many-instance-attributes
+class RedisCacheBackend(CacheBackend[T]):
+    """
+    This class shares snapshots between workers through a Redis-protocol
+    server, with a small near cache in each worker
+
+    A write deletes the shared entry and publishes the primary key, and
+    every worker drops it from its near cache when the message arrives.
+    If the server is unreachable the cache behaves like a miss, so
+    requests fall back to the database instead of failing.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        namespace: str,
+        snapshot_type: Type[T],
+        ttl: Optional[float] = None,
+        near_cache_size: int = 10_000,
+        errors: Tuple[Type[Exception], ...] = (ConnectionError, TimeoutError),
+    ) -> None:
+        self.client = client
+        self.namespace = namespace
+        self.channel = f"{namespace}:invalidate"
+        self.ttl = ttl
+        self.errors = errors
+        self.local: SnapshotCache[T] = SnapshotCache(near_cache_size, ttl)
+        self._codec = SnapshotCodec(snapshot_type)
+        self._listener: Optional[threading.Thread] = None
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:key:{key}"
+
+    def _index(self, uid: int) -> str:
+        return f"{self.namespace}:id:{uid}"
+
+    def get(self, key: str) -> Optional[T]:
+        snapshot = self.local.get(key)
+        if snapshot is not None:
+            return snapshot
+
+        try:
+            data = self.client.get(self._key(key))
+        except self.errors:
+            logger.warning("Cache %s unreachable, reading through", self.namespace)
+            return None
+        if data is None:
+            return None
+
+        uid, snapshot = self._codec.decode(data)
+        self.local.put(key, uid, snapshot)
+        return snapshot
+
+    def put(self, key: str, uid: int, snapshot: T, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        if ttl == 0:
+            return
+
+        self.local.put(key, uid, snapshot, ttl)
+        expire = max(1, int(ttl)) if ttl else None
+        try:
+            pipeline = self.client.pipeline()
+            pipeline.set(self._key(key), self._codec.encode(uid, snapshot), ex=expire)
+            pipeline.set(self._index(uid), key, ex=expire)
+            pipeline.execute()
+        except self.errors:
+            logger.warning("Cache %s unreachable, not shared", self.namespace)
+
+    def invalidate(self, uid: int) -> None:
+        self.local.invalidate(uid)
+        try:
+            key = self.client.get(self._index(uid))
+            pipeline = self.client.pipeline()
+            if key is not None:
+                pipeline.delete(self._key(key.decode()))
+            pipeline.delete(self._index(uid))
+            pipeline.publish(self.channel, str(uid))
+            pipeline.execute()
+        except self.errors:
+            logger.error("Cache %s unreachable, %s may be stale", self.namespace, uid)
+
+    def clear(self) -> None:
+        self.local.clear()
+        try:
+            for name in self.client.scan_iter(match=f"{self.namespace}:*"):
+                self.client.delete(name)
+        except self.errors:
+            logger.error("Cache %s unreachable, not cleared", self.namespace)
+
+    def on_message(self, message: Dict[str, Any]) -> None:
+        """
+        This function drops the near cache entry another worker wrote
+
+        :param message: a pub/sub message carrying the primary key
+        """
+        if message.get("type") == "message":
+            self.local.invalidate(int(message["data"]))
+
+    def listen_once(self) -> None:
+        """
+        This function subscribes to the invalidation channel and handles
+        messages until the subscription ends
+        """
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        for message in pubsub.listen():
+            self.on_message(message)
+
+    def _listen(self) -> None:
+        while True:
+            try:
+                self.listen_once()
+            except self.errors:
+                logger.warning("Cache %s lost its subscription", self.namespace)
+            # Messages may have been missed while disconnected
+            self.local.clear()
+            time.sleep(1)
+
+    def start_listener(self) -> None:
+        """
+        This function starts the invalidation listener of this worker
+        """
+        if self._listener is None:
+            self._listener = threading.Thread(
+                target=self._listen, name=f"{self.channel}-listener", daemon=True
+            )
+            self._listener.start()
+
+
+@lru_cache(maxsize=1)
+def get_redis_client() -> Any:
+    """
+    This function connects to the shared cache server once per process
+
+    :return: a redis client
+    """
+    import redis  # pylint: disable=import-outside-toplevel,import-error
+
+    return redis.Redis.from_url(CACHE_URL)
+
+
+def build_cache(
+    namespace: str,
+    snapshot_type: Type[T],
+    ttl: Optional[float] = None,
+    maxsize: int = 100_000,
+) -> CacheBackend[T]:
+    """
+    This function creates the cache configured by CACHE_BACKEND
+
+    :param namespace: The key prefix and channel name of the cache.
+    :param snapshot_type: The snapshot dataclass the cache holds.
+    :param ttl: Seconds an entry lives, None for no expiry, 0 to disable.
+    :param maxsize: The number of entries kept in the worker.
+    :return: The cache.
+    """
+    if CACHE_BACKEND != "redis":
+        return SnapshotCache(maxsize, ttl)
+
+    import redis  # pylint: disable=import-outside-toplevel,import-error
+
+    backend = RedisCacheBackend(
+        get_redis_client(),
+        namespace,
+        snapshot_type,
+        ttl,
+        errors=(redis.RedisError,),
+    )
+    backend.start_listener()
+    return backend
+
+
+class CachePartitions(Generic[T]):
+    """
+    This class keeps one cache per realm
+
+    Every realm gets a cache of its own size, created on first use, so a
+    busy realm cannot evict the entries of another. Row ids are unique
+    across realms, so an invalidation is passed to every partition.
+    """
+
+    def __init__(self, factory: Callable[[str], CacheBackend[T]]) -> None:
+        self.factory = factory
+        self._partitions: Dict[str, CacheBackend[T]] = {}
+        self._lock = Lock()
+
+    def for_realm(self, realm: str) -> CacheBackend[T]:
+        """
+        This function returns the cache of a realm
+
+        :param realm: The realm.
+        :return: The cache.
+        """
+        cache = self._partitions.get(realm)
+        if cache is None:
+            with self._lock:
+                cache = self._partitions.get(realm)
+                if cache is None:
+                    cache = self._partitions[realm] = self.factory(realm)
+        return cache
+
+    def invalidate(self, uid: int) -> None:
+        """
+        This function drops a row from every partition
+
+        :param uid: The row id.
+        """
+        for cache in list(self._partitions.values()):
+            cache.invalidate(uid)
+
+    def clear(self) -> None:
+        """
+        This function empties every partition
+        """
+        for cache in list(self._partitions.values()):
+            cache.clear()
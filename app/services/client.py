@@ -4,9 +4,31 @@ This module contains the ClientService class, which provides methods for client
 
 from typing import Optional, Sequence
 
-from app.models.client import DBClient
+from app.conf import CLIENT_CACHE_SECONDS, get_settings
+from app.events import ClientChanged, invalidate_on
+from app.models.client import ClientSnapshot, DBClient
 from app.repositories.client import ClientRepository
-from app.schemas.client import ClientCreate, ClientUpdate
+from app.responses import Document, project
+from app.schemas.client import ClientCreate, ClientMetadata, ClientUpdate
+from app.services.cache import (
+    CacheBackend,
+    CachePartitions,
+    SnapshotCache,
+    build_cache,
+)
+
+client_caches: CachePartitions[ClientSnapshot] = CachePartitions(
+    lambda realm: build_cache(
+        f"clients:{realm}", ClientSnapshot, ttl=CLIENT_CACHE_SECONDS
+    )
+)
+
+# Serialized public metadata by client row id; the body, and with it the
+# ETag, carries the row version. An entry is kept no longer than clients may
+# cache the document, so a change made on another worker shows up in time.
+metadata_caches: CachePartitions[Document] = CachePartitions(
+    lambda realm: SnapshotCache(maxsize=10_000)
+)
 
 
 class ClientService:
@@ -14,8 +36,21 @@ class ClientService:
     This class is the client service
     """
 
-    def __init__(self, client_repository: ClientRepository):
+    def __init__(
+        self,
+        client_repository: ClientRepository,
+        cache: Optional[CacheBackend[ClientSnapshot]] = None,
+        metadata_cache: Optional[CacheBackend[Document]] = None,
+    ):
         self.client_repository = client_repository
+        self.cache = (
+            client_caches.for_realm(client_repository.realm) if cache is None else cache
+        )
+        self.metadata_cache = (
+            metadata_caches.for_realm(client_repository.realm)
+            if metadata_cache is None
+            else metadata_cache
+        )
 
     def create(self, client_data: ClientCreate) -> DBClient:
         """
@@ -46,6 +81,66 @@ class ClientService:
         """
         return self.client_repository.read_all()
 
+    def read_snapshot(self, client_id: str) -> Optional[ClientSnapshot]:
+        """
+        Read a client by OAuth2 client ID as a snapshot, loading it on a cache miss.
+
+        :param client_id: The OAuth2 client ID.
+        :type client_id: str
+        :return: The snapshot or None if the client does not exist.
+        :rtype: Optional[ClientSnapshot]
+        """
+        snapshot = self.cache.get(client_id)
+        if snapshot is not None:
+            return snapshot
+
+        db_client = self.client_repository.read_by_client_id(client_id)
+        if db_client is None:
+            return None
+
+        snapshot = ClientSnapshot.from_client(db_client)
+        self.cache.put(client_id, db_client.id, snapshot)
+        return snapshot
+
+    def read_secret(self, client_id: str) -> Optional[str]:
+        """
+        Read the secret of a client by OAuth2 client ID, never from a cache.
+
+        :param client_id: The OAuth2 client ID.
+        :type client_id: str
+        :return: The secret or None if the client does not exist.
+        :rtype: Optional[str]
+        """
+        db_client = self.client_repository.read_by_client_id(client_id)
+        return None if db_client is None else db_client.client_secret
+
+    def read_metadata(self, client_id: int) -> Optional[Document]:
+        """
+        Read the public metadata of a client, serialized, loading it on a cache miss.
+
+        :param client_id: The ID of the client to read.
+        :type client_id: int
+        :return: The metadata document or None if the client does not exist.
+        :rtype: Optional[Document]
+        """
+        key = str(client_id)
+        document = self.metadata_cache.get(key)
+        if document is not None:
+            return document
+
+        db_client = self.client_repository.read(client_id)
+        if db_client is None:
+            return None
+
+        document = Document.from_content(project(db_client, ClientMetadata))
+        self.metadata_cache.put(
+            key,
+            db_client.id,
+            document,
+            ttl=get_settings().client_metadata_max_age_seconds,
+        )
+        return document
+
     def update(self, client_id: int, client_data: ClientUpdate) -> Optional[DBClient]:
         """
         Update an existing client.
@@ -59,6 +154,19 @@ class ClientService:
         """
         return self.client_repository.update(client_id, client_data)
 
+    def patch(self, client_id: int, client_data: ClientUpdate) -> Optional[DBClient]:
+        """
+        Partially update an existing client.
+
+        :param client_id: The ID of the client to update.
+        :type client_id: int
+        :param client_data: The fields to change on the client.
+        :type client_data: ClientUpdate
+        :return: The updated client or None if the client was not found.
+        :rtype: Optional[DBClient]
+        """
+        return self.client_repository.patch(client_id, client_data)
+
     def delete(self, client_id: int) -> bool:
         """
         Delete a client by ID.
@@ -69,3 +177,7 @@ class ClientService:
         :rtype: bool
         """
         return self.client_repository.delete(client_id)
+
+
+# Writes of any process reach the cache through the event bus
+invalidate_on(ClientChanged, client_caches, metadata_caches)
@@ -4,10 +4,79 @@ This module contains the UserService class, which provides methods for user mana
 
 from typing import Optional, Sequence
 
-from app.models.user import DBUser
+from app.conf import USER_CACHE_SECONDS, get_settings
+from app.events import UserChanged, invalidate_on
+from app.models.user import DBUser, UserSnapshot
 from app.repositories.user import UserRepository
 from app.schemas.user import UserCreate, UserUpdate
 from app.security import get_password_hash
+from app.services.cache import (
+    CacheBackend,
+    CachePartitions,
+    SnapshotCache,
+    build_cache,
+)
+
+
+class SecurityStampCache:
+    """
+    This class holds the security stamps of the current process for a short time
+
+    Without a ttl, SECURITY_STAMP_CACHE_SECONDS is read as each stamp is
+    cached, so a reloaded value applies at once. Beyond maxsize users the
+    least recently used stamps are evicted.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, maxsize: int = 100_000) -> None:
+        self.ttl = ttl
+        self._stamps: SnapshotCache[int] = SnapshotCache(maxsize=maxsize)
+
+    def get(self, user_id: int) -> Optional[int]:
+        """
+        Get the cached security stamp of a user.
+
+        :param user_id: The ID of the user.
+        :return: The security stamp or None on a miss or once it expired.
+        """
+        return self._stamps.get(str(user_id))
+
+    def put(self, user_id: int, stamp: int) -> None:
+        """
+        Cache the security stamp of a user.
+
+        :param user_id: The ID of the user.
+        :param stamp: The current security stamp.
+        """
+        ttl = (
+            get_settings().security_stamp_cache_seconds
+            if self.ttl is None
+            else self.ttl
+        )
+        self._stamps.put(str(user_id), user_id, stamp, ttl=ttl)
+
+    def invalidate(self, user_id: int) -> None:
+        """
+        Drop the cached security stamp of a user.
+
+        :param user_id: The ID of the user.
+        """
+        self._stamps.invalidate(user_id)
+
+    def clear(self) -> None:
+        """
+        Drop every cached security stamp.
+        """
+        self._stamps.clear()
+
+    def __len__(self) -> int:
+        return len(self._stamps)
+
+
+security_stamp_cache = SecurityStampCache()
+
+user_caches: CachePartitions[UserSnapshot] = CachePartitions(
+    lambda realm: build_cache(f"users:{realm}", UserSnapshot, ttl=USER_CACHE_SECONDS)
+)
 
 
 class UserService:
@@ -15,8 +84,17 @@ class UserService:
     UserService class provides methods for user management.
     """
 
-    def __init__(self, user_repository: UserRepository):
+    def __init__(
+        self,
+        user_repository: UserRepository,
+        stamp_cache: Optional[SecurityStampCache] = None,
+        cache: Optional[CacheBackend[UserSnapshot]] = None,
+    ):
         self.repo = user_repository
+        self.stamp_cache = stamp_cache or security_stamp_cache
+        self.cache = (
+            user_caches.for_realm(user_repository.realm) if cache is None else cache
+        )
 
     def create(self, user_create: UserCreate) -> DBUser:
         """
@@ -53,6 +131,33 @@ class UserService:
         """
         return self.repo.read_by_username(username)
 
+    def release_connection(self) -> None:
+        """
+        Give the connection of the request session back to the pool.
+        """
+        self.repo.release_connection()
+
+    def read_snapshot(self, username: str) -> Optional[UserSnapshot]:
+        """
+        Read a user by username as a snapshot, served from the cache while fresh.
+
+        :param username: The username of the user to read.
+        :type username: str
+        :return: The snapshot or None if not found.
+        :rtype: Optional[UserSnapshot]
+        """
+        snapshot = self.cache.get(username)
+        if snapshot is not None:
+            return snapshot
+
+        user = self.repo.read_by_username(username)
+        if user is None or user.id is None:
+            return None
+
+        snapshot = UserSnapshot.from_user(user)
+        self.cache.put(username, user.id, snapshot)
+        return snapshot
+
     def read_by_email(self, email: str) -> Optional[DBUser]:
         """
         Read a user by email.
@@ -64,6 +169,24 @@ class UserService:
         """
         return self.repo.read_by_email(email)
 
+    def read_security_stamp(self, user_id: int) -> Optional[int]:
+        """
+        Read the current security stamp of a user, served from the cache
+        while it is fresh.
+
+        :param user_id: The ID of the user.
+        :type user_id: int
+        :return: The security stamp or None if the user does not exist.
+        :rtype: Optional[int]
+        """
+        stamp = self.stamp_cache.get(user_id)
+        if stamp is None:
+            stamp = self.repo.read_security_stamp(user_id)
+            if stamp is not None:
+                self.stamp_cache.put(user_id, stamp)
+
+        return stamp
+
     def read_all(self) -> Sequence[DBUser]:
         """
         Retrieve all users
@@ -86,6 +209,19 @@ class UserService:
         """
         return self.repo.update(user_id, user_data)
 
+    def patch(self, user_id: int, user_data: UserUpdate) -> Optional[DBUser]:
+        """
+        Partially update an existing user.
+
+        :param user_id: The ID of the user to update.
+        :type user_id: int
+        :param user_data: The fields to change on the user.
+        :type user_data: UserUpdate
+        :return: The updated user or None if the user was not found.
+        :rtype: Optional[DBUser]
+        """
+        return self.repo.patch(user_id, user_data)
+
     def delete(self, user_id: int) -> bool:
         """
         Delete a user by ID.
@@ -95,3 +231,7 @@ class UserService:
         :rtype: bool
         """
         return self.repo.delete(user_id)
+
+
+# Writes of any process reach the caches through the event bus
+invalidate_on(UserChanged, user_caches, security_stamp_cache)
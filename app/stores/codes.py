@@ -0,0 +1,208 @@
+"""
+This module contains the ephemeral stores for authorization codes
+
+Codes live for seconds and are read exactly once, so the stores talk to
+their backing structure directly instead of going through a repository
+and a Session per call.
+"""
+
+import hashlib
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+
+from sqlalchemy import delete
+from sqlalchemy.engine import Engine
+from sqlmodel import col
+
+from app.models.code import AuthorizationCode, DBAuthorizationCode
+
+
+class AuthorizationCodeStore(ABC):
+    """
+    This class is the interface of the authorization code stores
+    """
+
+    def __init__(self, sweep_interval: float = 30.0):
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.time() + sweep_interval
+
+    @abstractmethod
+    def save(self, code: AuthorizationCode) -> None:
+        """
+        Store a freshly issued code
+
+        :param code: the authorization code
+        """
+
+    @abstractmethod
+    def consume(self, code: str) -> Optional[AuthorizationCode]:
+        """
+        Atomically remove and return a code, so it can only be redeemed once
+
+        :param code: the code presented by the client
+        :return: the authorization code or None if unknown or expired
+        """
+
+    @abstractmethod
+    def sweep(self) -> int:
+        """
+        Remove every expired code
+
+        :return: the number of codes removed
+        """
+
+    def _maybe_sweep(self) -> None:
+        """
+        Sweep expired codes at most once per sweep interval
+        """
+        now = time.time()
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            self.sweep()
+
+
+class InMemoryAuthorizationCodeStore(AuthorizationCodeStore):
+    """
+    This class keeps authorization codes in a TTL map of the current process
+    """
+
+    def __init__(self, sweep_interval: float = 30.0):
+        super().__init__(sweep_interval)
+        self._codes: OrderedDict[str, AuthorizationCode] = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def save(self, code: AuthorizationCode) -> None:
+        """
+        Store a freshly issued code
+
+        :param code: the authorization code
+        """
+        with self._lock:
+            self._codes[code.code] = code
+        self._maybe_sweep()
+
+    def consume(self, code: str) -> Optional[AuthorizationCode]:
+        """
+        Atomically remove and return a code, so it can only be redeemed once
+
+        :param code: the code presented by the client
+        :return: the authorization code or None if unknown or expired
+        """
+        with self._lock:
+            authorization_code = self._codes.pop(code, None)
+
+        if authorization_code is None or authorization_code.expires_at <= time.time():
+            return None
+        return authorization_code
+
+    def sweep(self) -> int:
+        """
+        Remove every expired code
+
+        Codes are inserted with a constant lifetime, so the dict's insertion
+        order is also expiry order and the scan stops at the first live code.
+
+        :return: the number of codes removed
+        """
+        now = time.time()
+        removed = 0
+        with self._lock:
+            while self._codes:
+                key = next(iter(self._codes))
+                if self._codes[key].expires_at > now:
+                    break
+                del self._codes[key]
+                removed += 1
+        return removed
+
+
+class DatabaseAuthorizationCodeStore(AuthorizationCodeStore):
+    """
+    This class keeps authorization codes in a table so any node can redeem them
+    """
+
+    def __init__(self, engine: Engine, sweep_interval: float = 30.0):
+        super().__init__(sweep_interval)
+        self.engine = engine
+
+    @staticmethod
+    def _hash(code: str) -> str:
+        return hashlib.sha256(code.encode()).hexdigest()
+
+    def save(self, code: AuthorizationCode) -> None:
+        """
+        Store a freshly issued code
+
+        :param code: the authorization code
+        """
+        table = DBAuthorizationCode.__table__  # type: ignore[attr-defined]
+        with self.engine.begin() as connection:
+            connection.execute(
+                table.insert().values(
+                    code_hash=self._hash(code.code),
+                    client_id=code.client_id,
+                    redirect_uri=code.redirect_uri,
+                    username=code.username,
+                    scope=" ".join(code.scopes),
+                    code_challenge=code.code_challenge,
+                    code_challenge_method=code.code_challenge_method,
+                    expires_at=code.expires_at,
+                    realm=code.realm,
+                    nonce=code.nonce,
+                )
+            )
+        self._maybe_sweep()
+
+    def consume(self, code: str) -> Optional[AuthorizationCode]:
+        """
+        Atomically remove and return a code, so it can only be redeemed once
+
+        A single DELETE ... RETURNING means two nodes racing on the same
+        code cannot both see the row.
+
+        :param code: the code presented by the client
+        :return: the authorization code or None if unknown or expired
+        """
+        table = DBAuthorizationCode.__table__  # type: ignore[attr-defined]
+        with self.engine.begin() as connection:
+            row = connection.execute(
+                table.delete()
+                .where(table.c.code_hash == self._hash(code))
+                .returning(*table.c)
+            ).first()
+
+        if row is None or row.expires_at <= time.time():
+            return None
+
+        return AuthorizationCode(
+            code=code,
+            client_id=row.client_id,
+            redirect_uri=row.redirect_uri,
+            username=row.username,
+            scopes=tuple(row.scope.split()) if row.scope else (),
+            code_challenge=row.code_challenge,
+            code_challenge_method=row.code_challenge_method,
+            expires_at=row.expires_at,
+            realm=row.realm,
+            nonce=row.nonce,
+        )
+
+    def sweep(self) -> int:
+        """
+        Remove every expired code
+
+        :return: the number of codes removed
+        """
+        with self.engine.begin() as connection:
+            result = connection.execute(
+                delete(DBAuthorizationCode).where(
+                    col(DBAuthorizationCode.expires_at) <= time.time()
+                )
+            )
+        return int(result.rowcount)
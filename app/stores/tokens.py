@@ -0,0 +1,198 @@
+"""
+This module contains the store of opaque access tokens
+
+An opaque token is a random handle; its claims live on the server. Every
+worker keeps the claims of the tokens it has seen in an LRU map, so a
+validation is a hash and a dict lookup, and only misses go to the
+access_tokens table shared by all nodes. The map is partitioned by realm
+like the snapshot caches, so a busy realm cannot evict another's tokens.
+"""
+
+import hashlib
+import secrets
+import time
+from collections import OrderedDict
+from contextlib import suppress
+from threading import Lock
+from typing import Any, Dict, Optional
+
+import orjson
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+
+from app.models.token import Claims, DBAccessToken
+from app.realms import DEFAULT_REALM
+from app.scopes import parse_scopes
+
+
+def hash_handle(handle: str) -> str:
+    """
+    This function hashes a token handle into its primary key
+
+    :param handle:
+    :return:
+    """
+    return hashlib.sha256(handle.encode()).hexdigest()
+
+
+def claims_from_dict(sub: str, data: Dict[str, Any]) -> Claims:
+    """
+    This function rebuilds the claims stored with a token
+
+    :param sub: the subject
+    :param data: the stored claims
+    :return:
+    """
+    return Claims(
+        sub=sub,
+        realm=data.get("realm") or DEFAULT_REALM,
+        scopes=parse_scopes(data.get("scope") or ""),
+        exp=data.get("exp"),
+        nbf=data.get("nbf"),
+        uid=data.get("uid"),
+        email=data.get("email"),
+        disabled=data.get("disabled"),
+        stamp=data.get("stamp"),
+    )
+
+
+class OpaqueTokenStore:
+    """
+    This class issues opaque access tokens and looks them up
+
+    The hot tier is keyed by the hashed handle, like the table, so the
+    worker never holds raw handles after issuing them. Every realm gets a
+    hot tier of maxsize tokens, created on first use.
+    """
+
+    def __init__(self, engine: Engine, maxsize: int = 100_000) -> None:
+        self.engine = engine
+        self.maxsize = maxsize
+        self._partitions: Dict[str, OrderedDict[str, Claims]] = {}
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return sum(len(hot) for hot in list(self._partitions.values()))
+
+    def _hot(self, realm: str) -> "OrderedDict[str, Claims]":
+        """
+        This function returns the hot tier of a realm
+
+        :param realm:
+        :return:
+        """
+        hot = self._partitions.get(realm)
+        if hot is None:
+            with self._lock:
+                hot = self._partitions.setdefault(realm, OrderedDict())
+        return hot
+
+    def _remember(self, token_hash: str, claims: Claims) -> None:
+        """
+        This function puts claims into the hot tier of their realm,
+        evicting the least recently used ones
+
+        :param token_hash:
+        :param claims:
+        """
+        hot = self._hot(claims.realm)
+        with self._lock:
+            hot[token_hash] = claims
+            hot.move_to_end(token_hash)
+            while len(hot) > self.maxsize:
+                hot.popitem(last=False)
+
+    def issue(self, data: Dict[str, Any], lifetime: float) -> str:
+        """
+        Issue a token for the given claims
+
+        :param data: the claims, with sub, scope and the realm
+        :param lifetime: seconds until the token expires
+        :return: the handle handed to the client
+        """
+        handle = secrets.token_urlsafe(32)
+        token_hash = hash_handle(handle)
+        data = {**data, "exp": time.time() + lifetime}
+        sub = data.pop("sub")
+
+        table = DBAccessToken.__table__  # type: ignore[attr-defined]
+        with self.engine.begin() as connection:
+            connection.execute(
+                table.insert().values(
+                    token_hash=token_hash,
+                    sub=sub,
+                    claims=orjson.dumps(data).decode(),
+                    expires_at=data["exp"],
+                )
+            )
+
+        self._remember(token_hash, claims_from_dict(sub, data))
+        return handle
+
+    def lookup(self, handle: str, realm: str = DEFAULT_REALM) -> Optional[Claims]:
+        """
+        Look up the claims of a token, from memory when this worker has
+        seen it before
+
+        Only the hot tier of the realm the token is presented to is
+        searched, and a token of another realm is not kept in it.
+
+        :param handle: the token presented by the client
+        :param realm: the realm of the request
+        :return: the claims or None if the token is unknown or expired
+        """
+        token_hash = hash_handle(handle)
+        hot = self._hot(realm)
+        claims = hot.get(token_hash)
+        if claims is None:
+            claims = self._load(token_hash)
+            if claims is None:
+                return None
+            if claims.realm == realm:
+                self._remember(token_hash, claims)
+        else:
+            with self._lock, suppress(KeyError):
+                hot.move_to_end(token_hash)
+
+        if claims.exp is not None and claims.exp <= time.time():
+            return None
+        return claims
+
+    def _load(self, token_hash: str) -> Optional[Claims]:
+        """
+        Read a token from the table
+
+        :param token_hash:
+        :return: the claims or None if the token is unknown
+        """
+        table = DBAccessToken.__table__  # type: ignore[attr-defined]
+        with self.engine.connect() as connection:
+            row = connection.execute(
+                select(table.c.sub, table.c.claims).where(
+                    table.c.token_hash == token_hash
+                )
+            ).first()
+
+        if row is None:
+            return None
+        return claims_from_dict(row.sub, orjson.loads(row.claims))
+
+    def evict_expired(self) -> int:
+        """
+        Drop every expired token from the hot tiers
+
+        :return: the number of tokens dropped
+        """
+        now = time.time()
+        dropped = 0
+        with self._lock:
+            for hot in self._partitions.values():
+                expired = [
+                    token_hash
+                    for token_hash, claims in hot.items()
+                    if claims.exp is not None and claims.exp <= now
+                ]
+                for token_hash in expired:
+                    del hot[token_hash]
+                dropped += len(expired)
+        return dropped
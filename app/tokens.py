@@ -0,0 +1,299 @@
+"""
+This module contains the JWT signer and verifier of access tokens
+"""
+
+import base64
+import hashlib
+import hmac
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+import orjson
+from jose import jwk
+
+from app.conf import REALMS
+from app.models.token import Claims
+from app.realms import DEFAULT_REALM, realm_key, realm_kid
+from app.scopes import parse_scopes
+
+HMAC_ALGORITHMS = {
+    "HS256": hashlib.sha256,
+    "HS384": hashlib.sha384,
+    "HS512": hashlib.sha512,
+}
+
+# The token_use claim of ID tokens, which are never accepted as access tokens
+ID_TOKEN_USE = "id"
+
+
+def b64url(data: bytes) -> bytes:
+    """
+    This function encodes bytes as unpadded base64url
+
+    :param data:
+    :return:
+    """
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def b64url_decode(segment: str) -> bytes:
+    """
+    This function decodes unpadded base64url
+
+    :param segment:
+    :return:
+    :raises ValueError: if the segment is not base64url
+    """
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+class JWTSigner:
+    """
+    This class signs JWTs with one key and algorithm
+
+    Everything that does not depend on the claims is done once: the header
+    segment is encoded up front and the key is loaded into an HMAC context
+    (or a jose key for RSA/EC) that each signature starts from. RSA/EC
+    signatures are verified with the public half of the key.
+    """
+
+    def __init__(self, key: str, algorithm: str, kid: str = "") -> None:
+        self.algorithm = algorithm
+        self.kid = kid
+        header: Dict[str, str] = {"alg": algorithm, "typ": "JWT"}
+        if kid:
+            header["kid"] = kid
+        self._header_segment = b64url(orjson.dumps(header)) + b"."
+
+        self._hmac: Optional[hmac.HMAC] = None
+        self._key: Any = None
+        self._public_key: Any = None
+        digestmod = HMAC_ALGORITHMS.get(algorithm)
+        if digestmod is not None:
+            self._hmac = hmac.new(key.encode(), digestmod=digestmod)
+        else:
+            self._key = jwk.construct(key, algorithm)
+            self._public_key = self._key.public_key()
+
+    def _sign(self, signing_input: bytes) -> bytes:
+        """
+        This function signs the header and payload segments
+
+        :param signing_input:
+        :return: the raw signature
+        """
+        if self._hmac is not None:
+            mac = self._hmac.copy()
+            mac.update(signing_input)
+            return mac.digest()
+
+        signature: bytes = self._key.sign(signing_input)
+        return signature
+
+    def verify_signature(self, signing_input: bytes, signature: bytes) -> bool:
+        """
+        This function checks the signature of the header and payload segments
+
+        :param signing_input:
+        :param signature:
+        :return:
+        """
+        if self._hmac is not None:
+            return hmac.compare_digest(self._sign(signing_input), signature)
+
+        verified: bool = self._public_key.verify(signing_input, signature)
+        return verified
+
+    def sign(self, claims: Dict[str, Any]) -> str:
+        """
+        This function encodes and signs the claims as a compact JWT
+
+        :param claims:
+        :return: the token
+        """
+        signing_input = self._header_segment + b64url(orjson.dumps(claims))
+        return (signing_input + b"." + b64url(self._sign(signing_input))).decode()
+
+
+class JWTVerifier:
+    """
+    This class verifies JWTs against a set of preloaded keys
+
+    The token is split once; its header segment selects the key by kid
+    and the algorithm is pinned to that key, so a token cannot pick a
+    weaker one. Known header segments are remembered, so the header is
+    only decoded for the first token of each key.
+    """
+
+    MAX_HEADERS = 1024
+
+    def __init__(
+        self,
+        keys: Dict[str, JWTSigner],
+        issuer: Optional[str] = None,
+        audience: Optional[str] = None,
+    ) -> None:
+        self._keys = keys
+        self.issuer = issuer
+        self.audience = audience
+        self._headers: Dict[str, JWTSigner] = {}
+
+    def _key_for(self, header_segment: str) -> Optional[JWTSigner]:
+        """
+        This function finds the key a token header refers to
+
+        :param header_segment:
+        :return: the key or None if the header names none of ours
+        """
+        key = self._headers.get(header_segment)
+        if key is not None:
+            return key
+
+        try:
+            header = orjson.loads(b64url_decode(header_segment))
+        except ValueError:
+            return None
+        if not isinstance(header, dict):
+            return None
+
+        key = self._keys.get(header.get("kid", ""))
+        if key is None or header.get("alg") != key.algorithm:
+            return None
+
+        if len(self._headers) < self.MAX_HEADERS:
+            self._headers[header_segment] = key
+        return key
+
+    def _audience_matches(self, aud: Any) -> bool:
+        """
+        This function checks the aud claim against the expected audience
+
+        :param aud:
+        :return:
+        """
+        if self.audience is None or aud == self.audience:
+            return True
+
+        return isinstance(aud, list) and self.audience in aud
+
+    def _claims(self, payload: Any, kid: str) -> Optional[Claims]:
+        """
+        This function validates the payload and builds the claims
+
+        :param payload:
+        :param kid: the kid of the key that verified the token, its realm
+        :return: the claims or None if the payload is not acceptable
+        """
+        if not isinstance(payload, dict) or not isinstance(payload.get("sub"), str):
+            return None
+
+        if payload.get("token_use") == ID_TOKEN_USE:
+            return None
+
+        if self.issuer is not None and payload.get("iss") != self.issuer:
+            return None
+
+        if not self._audience_matches(payload.get("aud")):
+            return None
+
+        exp, nbf = payload.get("exp"), payload.get("nbf")
+        if not isinstance(exp, (int, float, type(None))) or not isinstance(
+            nbf, (int, float, type(None))
+        ):
+            return None
+
+        scope = payload.get("scope")
+        return Claims(
+            sub=payload["sub"],
+            realm=kid or DEFAULT_REALM,
+            scopes=parse_scopes(scope) if isinstance(scope, str) else frozenset(),
+            exp=exp,
+            nbf=nbf,
+            uid=payload.get("uid"),
+            email=payload.get("email"),
+            disabled=payload.get("disabled"),
+            stamp=payload.get("stamp"),
+        )
+
+    def decode(self, token: str) -> Optional[Claims]:
+        """
+        This function verifies the signature, issuer and audience of a token
+
+        The time window is left to Claims.is_current so that decoded claims
+        can be cached.
+
+        :param token:
+        :return: the claims or None if the token is invalid
+        """
+        signing_input, _, signature = token.rpartition(".")
+        header_segment, _, payload_segment = signing_input.partition(".")
+        if not payload_segment:
+            return None
+
+        key = self._key_for(header_segment)
+        if key is None:
+            return None
+
+        try:
+            if not key.verify_signature(
+                signing_input.encode(), b64url_decode(signature)
+            ):
+                return None
+            payload = orjson.loads(b64url_decode(payload_segment))
+        except ValueError:
+            return None
+
+        return self._claims(payload, key.kid)
+
+    def verify(self, token: str, now: float, leeway: float = 0) -> Optional[Claims]:
+        """
+        This function fully validates a token
+
+        :param token:
+        :param now: the current unix time
+        :param leeway: seconds of clock skew to tolerate
+        :return: the claims or None if the token is invalid or not current
+        """
+        claims = self.decode(token)
+        if claims is None or not claims.is_current(now, leeway):
+            return None
+
+        return claims
+
+
+@lru_cache(maxsize=1024)
+def get_signer(key: str, algorithm: str, kid: str = "") -> JWTSigner:
+    """
+    This function returns the signer of a key, built once per process
+
+    :param key:
+    :param algorithm:
+    :param kid:
+    :return:
+    """
+    return JWTSigner(key, algorithm, kid)
+
+
+@lru_cache(maxsize=16)
+def get_verifier(
+    key: str,
+    algorithm: str,
+    issuer: Optional[str] = None,
+    audience: Optional[str] = None,
+) -> JWTVerifier:
+    """
+    This function returns the verifier of a key and of the keys of the
+    other realms, built once per process
+
+    :param key:
+    :param algorithm:
+    :param issuer:
+    :param audience:
+    :return:
+    """
+    keys = {"": get_signer(key, algorithm)}
+    for realm in REALMS:
+        kid = realm_kid(realm)
+        if kid:
+            keys[kid] = get_signer(realm_key(realm), algorithm, kid)
+    return JWTVerifier(keys, issuer, audience)
@@ -3,20 +3,24 @@ This module contains utility functions for the application
 """
 
 import os
+import time
 from datetime import UTC, datetime, timedelta
 from typing import Any, Dict, Optional
 
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
 from passlib.context import CryptContext
-from schemas.user import UserCreate
 
+from app.conf import JWT_BACKEND
 from app.models.user import DBUser
+from app.schemas.user import UserCreate
+from app.scopes import SCOPES
 from app.services.user import UserService
+from app.tokens import get_signer
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", scopes=SCOPES)
 
 
 def find_root_directory() -> Optional[str]:
@@ -50,6 +54,7 @@ def create_access_token(
     secret_key: str,
     algorithm: str,
     expires_delta: Optional[timedelta] = None,
+    kid: str = "",
 ) -> str:
     """
     This function creates an access token
@@ -58,14 +63,26 @@ def create_access_token(
     :param secret_key:
     :param algorithm:
     :param expires_delta:
+    :param kid: the key id put in the header, the realm of the key
     :return:
     """
-    to_encode = data.copy()
-    now = datetime.now(UTC)
-    expire = now + expires_delta if expires_delta else now + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    access_token: str = jwt.encode(to_encode, secret_key, algorithm=algorithm)
-    return access_token
+    if JWT_BACKEND == "jose":
+        to_encode = data.copy()
+        now = datetime.now(UTC)
+        expire = now + expires_delta if expires_delta else now + timedelta(minutes=15)
+        to_encode.update({"exp": expire})
+        access_token: str = jwt.encode(
+            to_encode,
+            secret_key,
+            algorithm=algorithm,
+            headers={"kid": kid} if kid else None,
+        )
+        return access_token
+
+    lifetime = expires_delta.total_seconds() if expires_delta else 15 * 60
+    return get_signer(secret_key, algorithm, kid).sign(
+        {**data, "exp": int(time.time() + lifetime)}
+    )
 
 
 def get_user(service: UserService, username: str) -> Optional[DBUser]:
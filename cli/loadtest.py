@@ -0,0 +1,421 @@
+"""
+This script load tests the server with a configurable mix of OAuth traffic
+
+It seeds users and clients, optionally starts a local server against a
+fresh SQLite file (or any DATABASE_URL, e.g. a local Postgres), replays
+the mix for a fixed duration and reports throughput, latency percentiles
+and error rates per endpoint.
+"""
+
+import asyncio
+import json
+import os
+import random
+import secrets
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+import click
+import httpx
+
+DEFAULT_MIX = "token=30,me=45,clients=20,register=5"
+PASSWORD = "loadtest-password"
+SCOPES = ["read:users", "read:clients"]
+
+
+@dataclass
+class Stats:
+    """
+    The latencies and failures recorded for one kind of request
+    """
+
+    latencies: List[float] = field(default_factory=list)
+    errors: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+
+    def record(self, seconds: float, error: Optional[str]) -> None:
+        """
+        Record one request
+
+        :param seconds: The latency of the request.
+        :param error: The status code or exception name if it failed.
+        """
+        self.latencies.append(seconds)
+        if error is not None:
+            self.errors[error] += 1
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    """
+    This function parses a traffic mix such as "token=30,me=70"
+
+    :param mix: Comma separated name=weight pairs.
+    :return: The weight of each request kind.
+    """
+    weights: Dict[str, int] = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in REQUESTS:
+            raise click.BadParameter(f"Unknown request kind: {name}")
+        weights[name.strip()] = int(weight or 1)
+    return weights
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """
+    This function returns a percentile of already sorted values
+
+    :param sorted_values: The values in ascending order.
+    :param fraction: The percentile as a fraction, e.g. 0.99.
+    :return: The value, 0 when there are none.
+    """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+class VirtualUser:
+    """
+    This class issues the requests of one simulated caller
+    """
+
+    def __init__(self, client: httpx.AsyncClient, username: str) -> None:
+        self.client = client
+        self.username = username
+        self.token: Optional[str] = None
+
+    async def token_request(self) -> httpx.Response:
+        """Log in with the password grant."""
+        response = await self.client.post(
+            "/token",
+            data={
+                "username": self.username,
+                "password": PASSWORD,
+                "scope": " ".join(SCOPES),
+            },
+        )
+        if response.status_code == 200:
+            self.token = response.json()["access_token"]
+        return response
+
+    async def _authorized(self) -> Dict[str, str]:
+        if self.token is None:
+            await self.token_request()
+        return {"Authorization": f"Bearer {self.token}"}
+
+    async def me_request(self) -> httpx.Response:
+        """Read the current user."""
+        return await self.client.get("/users/me", headers=await self._authorized())
+
+    async def clients_request(self) -> httpx.Response:
+        """List the clients."""
+        return await self.client.get("/clients", headers=await self._authorized())
+
+    async def register_request(self) -> httpx.Response:
+        """Register a new user."""
+        name = f"lt-{secrets.token_hex(8)}"
+        return await self.client.post(
+            "/register",
+            json={"username": name, "email": f"{name}@example.com", "password": "x"},
+        )
+
+
+REQUESTS = {
+    "token": VirtualUser.token_request,
+    "me": VirtualUser.me_request,
+    "clients": VirtualUser.clients_request,
+    "register": VirtualUser.register_request,
+}
+
+
+async def run_user(
+    user: VirtualUser, weights: Dict[str, int], deadline: float, stats: Dict[str, Stats]
+) -> None:
+    """
+    This function replays the mix for one virtual user until the deadline
+
+    :param user: The virtual user.
+    :param weights: The weight of each request kind.
+    :param deadline: The perf_counter value to stop at.
+    :param stats: The stats to record into, by request kind.
+    """
+    kinds, kind_weights = list(weights), list(weights.values())
+    while time.perf_counter() < deadline:
+        kind = random.choices(kinds, kind_weights)[0]
+        start = time.perf_counter()
+        error: Optional[str] = None
+        try:
+            response = await REQUESTS[kind](user)
+            if response.status_code >= 400:
+                error = str(response.status_code)
+        except httpx.HTTPError as err:
+            error = type(err).__name__
+        stats[kind].record(time.perf_counter() - start, error)
+
+
+async def run_load(
+    base_url: str,
+    usernames: List[str],
+    weights: Dict[str, int],
+    concurrency: int,
+    duration: float,
+) -> Dict[str, Stats]:
+    """
+    This function runs the virtual users concurrently
+
+    :param base_url: The server to load.
+    :param usernames: The seeded users to log in as.
+    :param weights: The weight of each request kind.
+    :param concurrency: The number of virtual users.
+    :param duration: Seconds to run for.
+    :return: The stats by request kind.
+    """
+    stats: Dict[str, Stats] = defaultdict(Stats)
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(
+        base_url=base_url, limits=limits, timeout=30
+    ) as client:
+        users = [
+            VirtualUser(client, usernames[index % len(usernames)])
+            for index in range(concurrency)
+        ]
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(
+            *(run_user(user, weights, deadline, stats) for user in users)
+        )
+    return stats
+
+
+def build_report(stats: Dict[str, Stats], duration: float) -> Dict[str, Any]:
+    """
+    This function summarizes the stats
+
+    :param stats: The stats by request kind.
+    :param duration: Seconds the load ran for.
+    :return: Throughput, latency percentiles in ms and error rates.
+    """
+    report: Dict[str, Any] = {"duration_seconds": duration, "requests": {}}
+    total = errors = 0
+    for kind, kind_stats in sorted(stats.items()):
+        latencies = sorted(kind_stats.latencies)
+        kind_errors = sum(kind_stats.errors.values())
+        total += len(latencies)
+        errors += kind_errors
+        report["requests"][kind] = {
+            "count": len(latencies),
+            "rps": len(latencies) / duration,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p90_ms": percentile(latencies, 0.90) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+            "error_rate": kind_errors / len(latencies) if latencies else 0.0,
+            "errors": dict(kind_stats.errors),
+        }
+    report["total"] = {
+        "count": total,
+        "rps": total / duration,
+        "error_rate": errors / total if total else 0.0,
+    }
+    return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    """
+    This function prints the report as a table
+
+    :param report: The report built by build_report.
+    """
+    print(
+        f"{'request':<10}{'count':>8}{'rps':>9}{'p50 ms':>9}"
+        f"{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}{'errors':>8}"
+    )
+    for kind, row in report["requests"].items():
+        print(
+            f"{kind:<10}{row['count']:>8}{row['rps']:>9.1f}{row['p50_ms']:>9.1f}"
+            f"{row['p90_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['max_ms']:>9.1f}"
+            f"{row['error_rate']:>8.1%}"
+        )
+    total = report["total"]
+    print(
+        f"{'total':<10}{total['count']:>8}{total['rps']:>9.1f}"
+        f"{'':>36}{total['error_rate']:>8.1%}"
+    )
+
+
+def seed(database_url: str, users: int, clients: int) -> List[str]:
+    """
+    This function creates the users and clients the load logs in with
+
+    :param database_url: The database of the server.
+    :param users: The number of users.
+    :param clients: The number of clients.
+    :return: The usernames.
+    """
+    # pylint: disable=import-outside-toplevel
+    from sqlmodel import Session, SQLModel, col, create_engine, select
+
+    from app.models.client import DBClient
+    from app.models.user import DBUser
+    from app.security import get_password_hash
+
+    engine = create_engine(database_url)
+    SQLModel.metadata.create_all(engine)
+    usernames = [f"loadtest-{index}" for index in range(users)]
+    # One bcrypt hash for everyone, hashing per user would dominate seeding
+    hashed_password = get_password_hash(PASSWORD)
+    with Session(engine) as session:
+        existing = set(
+            session.exec(
+                select(DBUser.username).where(
+                    col(DBUser.username).startswith("loadtest-")
+                )
+            ).all()
+        )
+        session.add_all(
+            DBUser(
+                username=name,
+                email=f"{name}@example.com",
+                hashed_password=hashed_password,
+                scopes=SCOPES,
+            )
+            for name in usernames
+            if name not in existing
+        )
+        session.add_all(
+            DBClient(
+                client_id=f"loadtest-{secrets.token_hex(6)}",
+                client_secret=secrets.token_urlsafe(16),
+                redirect_uris=["https://example.com/callback"],
+                grant_types=["authorization_code"],
+                response_types=["code"],
+                scope=SCOPES,
+            )
+            for _ in range(clients)
+        )
+        session.commit()
+    engine.dispose()
+    return usernames
+
+
+@contextmanager
+def local_server(database_url: str, port: int, workers: int) -> Iterator[str]:
+    """
+    This function runs uvicorn in a subprocess for the duration of the test
+
+    :param database_url: The database the server uses.
+    :param port: The port to listen on.
+    :param workers: The number of uvicorn workers.
+    :return: The base URL of the server.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {
+        **os.environ,
+        # The application also imports some modules relative to app/
+        "PYTHONPATH": os.pathsep.join([root, os.path.join(root, "app")]),
+        "DATABASE_URL": database_url,
+        "SECRET_KEY": os.environ.get("SECRET_KEY", secrets.token_urlsafe(32)),
+        "ALGORITHM": os.environ.get("ALGORITHM", "HS256"),
+    }
+    command = [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "app.main:app",
+        "--port",
+        str(port),
+        "--workers",
+        str(workers),
+        "--log-level",
+        "warning",
+    ]
+    base_url = f"http://127.0.0.1:{port}"
+    with subprocess.Popen(command, env=env) as process:
+        try:
+            wait_until_ready(base_url)
+            yield base_url
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+
+def wait_until_ready(base_url: str, timeout: float = 30) -> None:
+    """
+    This function waits for the readiness probe of the server
+
+    :param base_url: The server.
+    :param timeout: Seconds to wait.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/health/ready").status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise click.ClickException(f"Server at {base_url} did not become ready")
+
+
+@click.command()
+@click.option("--base-url", help="Load an already running server instead.")
+@click.option(
+    "--database-url", help="Database to seed, default a temporary SQLite file."
+)
+@click.option("--mix", default=DEFAULT_MIX, show_default=True, help="Request weights.")
+@click.option("--duration", default=30.0, show_default=True, help="Seconds to run.")
+@click.option("--concurrency", default=10, show_default=True, help="Virtual users.")
+@click.option("--users", default=200, show_default=True, help="Users to seed.")
+@click.option("--clients", default=50, show_default=True, help="Clients to seed.")
+@click.option("--workers", default=1, show_default=True, help="uvicorn workers.")
+@click.option("--port", default=8765, show_default=True)
+@click.option("--report", "report_path", help="Write the report as JSON here.")
+def load_test(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    base_url: Optional[str],
+    database_url: Optional[str],
+    mix: str,
+    duration: float,
+    concurrency: int,
+    users: int,
+    clients: int,
+    workers: int,
+    port: int,
+    report_path: Optional[str],
+) -> None:
+    """
+    This function seeds the database, replays the traffic mix and reports
+
+    Against an already running server (--base-url), pass the
+    --database-url it uses so the seeded users can log in.
+    """
+    weights = parse_mix(mix)
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = database_url or f"sqlite:///{directory}/loadtest.db"
+        usernames = seed(database_url, users, clients)
+
+        if base_url:
+            stats = asyncio.run(
+                run_load(base_url, usernames, weights, concurrency, duration)
+            )
+        else:
+            with local_server(database_url, port, workers) as local_url:
+                stats = asyncio.run(
+                    run_load(local_url, usernames, weights, concurrency, duration)
+                )
+
+    report = build_report(stats, duration)
+    print_report(report)
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"Report written to {report_path}")
+
+
+if __name__ == "__main__":
+    load_test()  # pylint: disable=no-value-for-parameter
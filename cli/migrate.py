@@ -0,0 +1,26 @@
+"""
+This script upgrades the database schema from the command line
+"""
+
+import click
+
+from app.dependencies import get_engine
+from app.migrations import upgrade_schema
+
+
+@click.command()
+def migrate():
+    """
+    This function brings the tables of DATABASE_URL up to the current models
+
+    Workers do the same at startup; running it first keeps the ALTERs out
+    of a rolling deploy.
+    """
+    changes = upgrade_schema(get_engine())
+    for change in changes:
+        print(change)
+    print(f"Schema is current ({len(changes)} changes made)")
+
+
+if __name__ == "__main__":
+    migrate()
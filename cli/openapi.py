@@ -0,0 +1,34 @@
+"""
+This script exports the OpenAPI schema of the application to a file
+"""
+
+import click
+import orjson
+
+
+@click.command()
+@click.option(
+    "--output",
+    "-o",
+    default="openapi.json",
+    show_default=True,
+    help="File to write the schema to.",
+)
+def export_openapi(output):
+    """
+    This function writes the OpenAPI schema, for production workers to serve
+    with OPENAPI_FILE instead of generating it
+
+    :param output: The file to write
+    """
+    # Importing the application connects to the database, so only do it here
+    from app.main import app  # pylint: disable=import-outside-toplevel
+
+    schema = app.openapi()
+    with open(output, "wb") as file:
+        file.write(orjson.dumps(schema, option=orjson.OPT_INDENT_2))
+    print(f"OpenAPI schema written to {output} ({len(schema['paths'])} paths)")
+
+
+if __name__ == "__main__":
+    export_openapi()  # pylint: disable=no-value-for-parameter
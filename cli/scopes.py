@@ -0,0 +1,37 @@
+"""
+This script assigns OAuth2 scopes to a user from the command line
+"""
+
+import click
+from sqlmodel import Session
+
+from app.dependencies import get_engine
+from app.repositories.user import UserRepository
+from app.schemas.user import UserUpdate
+from app.scopes import SCOPES
+from app.services.user import UserService
+
+
+@click.command()
+@click.argument("username")
+@click.argument("scopes", nargs=-1)
+def grant_scopes(username, scopes):
+    """
+    This function replaces the scopes held by a user
+
+    :param username: The user to update
+    :param scopes: The scopes to assign, e.g. read:users write:users
+    """
+    unknown = set(scopes) - set(SCOPES)
+    if unknown:
+        raise click.BadParameter(f"Unknown scopes: {', '.join(sorted(unknown))}")
+
+    with Session(get_engine()) as session:
+        # Going through the service drops the user from the shared caches
+        service = UserService(UserRepository(session))
+        user = service.read_by_username(username)
+        if user is None:
+            raise click.ClickException(f"User {username} not found")
+
+        service.patch(user.id, UserUpdate(scopes=list(scopes)))
+    print(f"Scopes for {username}: {' '.join(scopes) or '(none)'}")
@@ -99,6 +99,49 @@ def coverage(c):
     c.run("coverage lcov -o ./coverage/lcov.info")
 
 
+@task(aliases=["b"], help={"count": "Tokens issued per backend."})
+def benchmark(c: Context, count: int = 20000):
+    """Measure access token issuance throughput per core."""
+    c.run(f"python -m cli.tokenbench --count {count}")
+
+
+@task(
+    aliases=["lt"],
+    help={
+        "duration": "Seconds to run.",
+        "concurrency": "Virtual users.",
+        "mix": "Request weights, e.g. token=30,me=45,clients=20,register=5.",
+        "workers": "uvicorn workers of the local server.",
+        "report": "Write the JSON report to this file.",
+    },
+)
+def loadtest(
+    c: Context,
+    duration: int = 30,
+    concurrency: int = 10,
+    mix: str = "",
+    workers: int = 1,
+    report: str = "loadtest-report.json",
+):
+    """Start a local server, replay an OAuth traffic mix and report capacity."""
+    options = f"--duration {duration} --concurrency {concurrency} --workers {workers}"
+    if mix:
+        options += f" --mix {mix}"
+    c.run(f"python -m cli.loadtest {options} --report {report}")
+
+
+@task(aliases=["oa"], help={"output": "File to write the schema to."})
+def openapi(c: Context, output: str = "openapi.json"):
+    """Export the OpenAPI schema served in production mode."""
+    c.run(f"python -m cli.openapi --output {output}")
+
+
+@task(aliases=["m"])
+def migrate(c: Context):
+    """Bring the database schema up to the current models."""
+    c.run("python -m cli.migrate")
+
+
 @task(aliases=["cc"])
 def check_complexity(c: Context, max_complexity: int = 12) -> None:
     """
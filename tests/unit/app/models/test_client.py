@@ -0,0 +1,51 @@
+"""
+This module contains the unit tests for the client models.
+"""
+
+from app.models.client import ClientSnapshot, DBClient
+
+
+def test_client_snapshot_from_client():
+    """
+    Test that a snapshot copies the client and answers its policy checks.
+    """
+    # Arrange
+    client = DBClient(
+        id=1,
+        client_id="abc",
+        client_secret="secret",
+        redirect_uris=["https://example.com/cb", "https://example.com/cb"],
+        grant_types=["authorization_code"],
+        response_types=["code"],
+        scope=["openid", "profile"],
+        version=3,
+    )
+
+    # Act
+    policy = ClientSnapshot.from_client(client)
+
+    # Assert
+    assert policy.version == 3
+    assert policy.redirect_uris == frozenset({"https://example.com/cb"})
+    assert not hasattr(policy, "client_secret")
+    assert policy.allows_redirect_uri("https://example.com/cb")
+    assert not policy.allows_redirect_uri("https://example.com/cb/")
+    assert policy.allows_response_type("code")
+    assert not policy.allows_grant_type("password")
+    assert policy.allows_scopes(["openid"])
+    assert not policy.allows_scopes(["openid", "admin"])
+
+
+def test_client_snapshot_empty_lists():
+    """
+    Test that a client without registered values allows nothing.
+    """
+    # Arrange
+    client = DBClient(id=1, client_id="abc", client_secret="secret")
+
+    # Act
+    policy = ClientSnapshot.from_client(client)
+
+    # Assert
+    assert not policy.allows_redirect_uri("https://example.com/cb")
+    assert policy.allows_scopes([])
@@ -0,0 +1,53 @@
+"""
+This module contains the unit tests for the user models.
+"""
+
+import dataclasses
+
+import pytest
+
+from app.models.user import DBUser, UserSnapshot
+
+
+def test_user_snapshot_from_user():
+    """
+    Test that a snapshot copies the public fields but not the password hash.
+    """
+    # Arrange
+    user = DBUser(
+        id=1,
+        username="alice",
+        email="alice@example.com",
+        hashed_password="hash",
+        scopes=["read:users"],
+        version=2,
+        security_stamp=3,
+    )
+
+    # Act
+    snapshot = UserSnapshot.from_user(user)
+
+    # Assert
+    assert snapshot == UserSnapshot(
+        id=1,
+        username="alice",
+        email="alice@example.com",
+        disabled=False,
+        scopes=("read:users",),
+        version=2,
+        security_stamp=3,
+    )
+    assert not hasattr(snapshot, "hashed_password")
+    assert not hasattr(snapshot, "__dict__")
+
+
+def test_user_snapshot_is_frozen():
+    """
+    Test that a snapshot cannot be changed once taken.
+    """
+    # Arrange
+    snapshot = UserSnapshot(id=1, username="alice", email="alice@example.com")
+
+    # Act & Assert
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        snapshot.disabled = True  # type: ignore[misc]
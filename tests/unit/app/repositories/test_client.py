@@ -5,32 +5,39 @@ This module contains the unit tests for the ClientRepository class.
 # tests/unit/app/repositories/test_client.py
 
 import pytest
-
+from pydantic import ValidationError
+from sqlmodel import Session
+
+from app.exceptions import (
+    MissingFieldsError,
+    RowExistsError,
+    VersionConflictError,
+)
 from app.models.client import DBClient
 from app.repositories.client import ClientRepository
-from app.schemas.client import Client
+from app.schemas.client import Client, ClientUpdate
 
 
 @pytest.fixture
 def mock_session(mocker):
     """
-    Fixture to mock the SQLModel Session.
+    Fixture to mock the request scoped SQLModel Session.
 
     :param mocker: The pytest-mock mocker fixture.
     :return: Mocked Session.
     """
-    return mocker.patch("app.repositories.client.Session", autospec=True)
+    return mocker.MagicMock(spec=Session)
 
 
 @pytest.fixture
-def client_repository(mock_session, mock_engine):
+def client_repository(mock_session):
     """
-    Fixture to create a ClientRepository instance with a mocked engine.
+    Fixture to create a ClientRepository instance with a mocked session.
 
     :param mock_session: The mocked Session fixture.
     :return: ClientRepository instance.
     """
-    return ClientRepository(mock_engine)
+    return ClientRepository(mock_session)
 
 
 def test_read(client_repository, mock_session):
@@ -41,7 +48,7 @@ def test_read(client_repository, mock_session):
     :param mock_session: The mocked Session fixture.
     """
     # Arrange
-    mock_session_instance = mock_session.return_value.__enter__.return_value
+    mock_session_instance = mock_session
     mock_session_instance.get.return_value = DBClient(id=1, client_name="testclient")
 
     # Act
@@ -52,6 +59,26 @@ def test_read(client_repository, mock_session):
     assert client.client_name == "testclient"
 
 
+def test_read_by_client_id(client_repository, mock_session):
+    """
+    Test the read_by_client_id method of ClientRepository.
+
+    :param client_repository: The ClientRepository instance.
+    :param mock_session: The mocked Session fixture.
+    """
+    # Arrange
+    mock_session.exec.return_value.first.return_value = DBClient(
+        id=1, client_id="123abc"
+    )
+
+    # Act
+    client = client_repository.read_by_client_id("123abc")
+
+    # Assert
+    assert client.id == 1
+    assert client.client_id == "123abc"
+
+
 def test_read_all(client_repository, mock_session):
     """
     Test the read_all method of ClientRepository.
@@ -60,7 +87,7 @@ def test_read_all(client_repository, mock_session):
     :param mock_session: The mocked Session fixture.
     """
     # Arrange
-    mock_session.return_value.__enter__.return_value.exec.return_value.all.return_value = [
+    mock_session.exec.return_value.all.return_value = [
         DBClient(id=1, client_name="testclient")
     ]
 
@@ -89,8 +116,8 @@ def test_create(client_repository, mock_session):
         response_types=["code"],
         scope=["openid", "profile"],
     )
-    mock_session.return_value.__enter__.return_value.commit.return_value = None
-    mock_session.return_value.__enter__.return_value.refresh.return_value = None
+    mock_session.commit.return_value = None
+    mock_session.refresh.return_value = None
 
     # Act
     created_client = client_repository.create(client_data)
@@ -116,17 +143,20 @@ def test_update(client_repository, mock_session):
         response_types=["code"],
         scope=["openid", "profile"],
     )
-    mock_session.return_value.__enter__.return_value.get.return_value = DBClient(
-        id=1, client_name="testclient"
+    mock_session_instance = mock_session
+    mock_session_instance.exec.return_value.scalar_one_or_none.return_value = DBClient(
+        id=1, client_name="testclient", version=2
     )
-    mock_session.return_value.__enter__.return_value.commit.return_value = None
-    mock_session.return_value.__enter__.return_value.refresh.return_value = None
 
     # Act
     updated_client = client_repository.update(1, client_data)
 
     # Assert
     assert updated_client.client_name == "testclient"
+    assert updated_client.version == 2
+    mock_session_instance.exec.assert_called_once()
+    mock_session_instance.get.assert_not_called()
+    mock_session_instance.refresh.assert_not_called()
 
 
 def test_update_no_client(client_repository, mock_session):
@@ -147,9 +177,9 @@ def test_update_no_client(client_repository, mock_session):
         response_types=["code"],
         scope=["openid", "profile"],
     )
-    mock_session.return_value.__enter__.return_value.get.return_value = None
-    mock_session.return_value.__enter__.return_value.commit.return_value = None
-    mock_session.return_value.__enter__.return_value.refresh.return_value = None
+    mock_session_instance = mock_session
+    mock_session_instance.exec.return_value.scalar_one_or_none.return_value = None
+    mock_session_instance.get.return_value = None
 
     # Act
     updated_client = client_repository.update(1, client_data)
@@ -162,6 +192,109 @@ def test_update_no_client(client_repository, mock_session):
     ), "Client client_name should be newclient"
 
 
+def test_update_id_of_another_realm(client_repository, mock_session):
+    """
+    Test that an upsert does not insert over the id of another realm's client.
+
+    :param client_repository:
+    :param mock_session:
+    """
+    # Arrange
+    mock_session.exec.return_value.scalar_one_or_none.return_value = None
+    mock_session.get.return_value = DBClient(id=1, tenant_id="other")
+
+    # Act & Assert
+    with pytest.raises(RowExistsError):
+        client_repository.update(1, ClientUpdate(client_id="a", client_secret="s"))
+    mock_session.add.assert_not_called()
+
+
+def test_update_new_client_needs_secret(client_repository, mock_session):
+    """
+    Test that an upsert creating a client without a secret is refused.
+
+    :param client_repository:
+    :param mock_session:
+    """
+    # Arrange
+    mock_session.exec.return_value.scalar_one_or_none.return_value = None
+    mock_session.get.return_value = None
+
+    # Act & Assert
+    with pytest.raises(MissingFieldsError) as excinfo:
+        client_repository.update(1, ClientUpdate(client_id="a"))
+    assert excinfo.value.fields == ["client_secret"]
+
+
+def test_update_rejects_explicit_null():
+    """
+    Test that the client ID and secret may be left out but not sent as null.
+    """
+    # Act & Assert
+    with pytest.raises(ValidationError):
+        ClientUpdate.model_validate({"client_secret": None})
+
+
+def test_patch(client_repository, mock_session):
+    """
+    Test the patch method of ClientRepository only sends the fields that were set.
+
+    :param client_repository: The ClientRepository instance.
+    :param mock_session: The mocked Session fixture.
+    """
+    # Arrange
+    client_data = ClientUpdate(client_name="renamed")
+    mock_session_instance = mock_session
+    mock_session_instance.exec.return_value.scalar_one_or_none.return_value = DBClient(
+        id=1, client_name="renamed", version=2
+    )
+
+    # Act
+    patched_client = client_repository.patch(1, client_data)
+
+    # Assert
+    assert patched_client.client_name == "renamed"
+    params = mock_session_instance.exec.call_args.args[0].compile().params
+    assert "client_name" in params
+    assert "client_secret" not in params
+
+
+def test_patch_no_client(client_repository, mock_session):
+    """
+    Test the patch method of ClientRepository when the client does not exist.
+
+    :param client_repository: The ClientRepository instance.
+    :param mock_session: The mocked Session fixture.
+    """
+    # Arrange
+    mock_session_instance = mock_session
+    mock_session_instance.exec.return_value.scalar_one_or_none.return_value = None
+
+    # Act
+    patched_client = client_repository.patch(1, ClientUpdate(client_name="x"))
+
+    # Assert
+    assert patched_client is None
+    mock_session_instance.add.assert_not_called()
+
+
+def test_patch_version_conflict(client_repository, mock_session):
+    """
+    Test the patch method of ClientRepository with a stale version.
+
+    :param client_repository: The ClientRepository instance.
+    :param mock_session: The mocked Session fixture.
+    """
+    # Arrange
+    mock_session_instance = mock_session
+    mock_session_instance.exec.return_value.scalar_one_or_none.return_value = None
+    mock_session_instance.get.return_value = DBClient(id=1, version=3)
+
+    # Act & Assert
+    with pytest.raises(VersionConflictError):
+        client_repository.patch(1, ClientUpdate(client_name="x", version=2))
+
+
 def test_delete(client_repository, mock_session):
     """
     Test the delete method of ClientRepository.
@@ -170,10 +303,8 @@ def test_delete(client_repository, mock_session):
     :param mock_session: The mocked Session fixture.
     """
     # Arrange
-    mock_session.return_value.__enter__.return_value.get.return_value = DBClient(
-        id=1, client_name="testclient"
-    )
-    mock_session.return_value.__enter__.return_value.commit.return_value = None
+    mock_session.get.return_value = DBClient(id=1, client_name="testclient")
+    mock_session.commit.return_value = None
 
     # Act
     result = client_repository.delete(1)
@@ -191,9 +322,9 @@ def test_delete_no_client(client_repository, mock_session):
     :return:
     """
     # Arrange
-    mock_session.return_value.__enter__.return_value.get.return_value = None
-    mock_session.return_value.__enter__.return_value.commit.return_value = None
-    mock_session.return_value.__enter__.return_value.refresh.return_value = None
+    mock_session.get.return_value = None
+    mock_session.commit.return_value = None
+    mock_session.refresh.return_value = None
 
     # Act
     result = client_repository.delete(1)
@@ -5,9 +5,16 @@ This module contains the unit tests for the UserRepository class.
 # tests/unit/app/repositories/test_user.py
 
 import pytest
+from pydantic import ValidationError
 from schemas.user import UserCreate, UserUpdate
+from sqlmodel import Session
 from utils import verify_password
 
+from app.exceptions import (
+    MissingFieldsError,
+    RowExistsError,
+    VersionConflictError,
+)
 from app.models.user import DBUser
 from app.repositories.user import UserRepository
 from app.security import get_password_hash
@@ -18,23 +25,23 @@ from app.security import get_password_hash
 @pytest.fixture
 def mock_session(mocker):
     """
-    Fixture to mock the SQLModel Session.
+    Fixture to mock the request scoped SQLModel Session.
 
     :param mocker: The pytest-mock mocker fixture.
     :return: Mocked Session.
     """
-    return mocker.patch("app.repositories.user.Session", autospec=True)
+    return mocker.MagicMock(spec=Session)
 
 
 @pytest.fixture
-def user_repository(mock_engine):
+def user_repository(mock_session):
     """
-    Fixture to create a UserRepository instance with a mocked engine.
+    Fixture to create a UserRepository instance with a mocked session.
 
-    :param mock_engine: The mocked engine fixture.
+    :param mock_session: The mocked Session fixture.
     :return: UserRepository instance.
     """
-    return UserRepository(mock_engine)
+    return UserRepository(mock_session)
 
 
 def test_read(user_repository, mock_session):
@@ -45,7 +52,7 @@ def test_read(user_repository, mock_session):
     :param mock_session: The mocked Session fixture.
     """
     # Arrange
-    mock_session_instance = mock_session.return_value.__enter__.return_value
+    mock_session_instance = mock_session
     mock_session_instance.get.return_value = DBUser(id=1, username="testuser")
 
     # Act
@@ -56,6 +63,41 @@ def test_read(user_repository, mock_session):
     assert user.username == "testuser"
 
 
+def test_read_hides_other_realms(mock_session):
+    """
+    Test that a repository does not return the users of another realm.
+
+    :param mock_session: The mocked Session fixture.
+    """
+    # Arrange
+    mock_session.get.return_value = DBUser(id=1, username="testuser")
+    repository = UserRepository(mock_session, realm="acme")
+
+    # Act
+    user = repository.read(1)
+
+    # Assert
+    assert user is None
+
+
+def test_read_by_username_filters_by_realm(mock_session):
+    """
+    Test that lookups by username lead with the realm.
+
+    :param mock_session: The mocked Session fixture.
+    """
+    # Arrange
+    repository = UserRepository(mock_session, realm="acme")
+
+    # Act
+    repository.read_by_username("testuser")
+
+    # Assert
+    statement = mock_session.exec.call_args.args[0]
+    assert "users.tenant_id = :tenant_id_1" in str(statement)
+    assert statement.compile().params["tenant_id_1"] == "acme"
+
+
 def test_read_by_username(user_repository, mock_session):
     """
     Test the read_by_username method of UserRepository.
@@ -64,7 +106,7 @@ def test_read_by_username(user_repository, mock_session):
     :param mock_session: The mocked Session fixture.
     """
     # Arrange
-    mock_session.return_value.__enter__.return_value.exec.return_value.first.return_value = DBUser(
+    mock_session.exec.return_value.first.return_value = DBUser(
         id=1, username="testuser"
     )
 
@@ -84,7 +126,7 @@ def test_read_by_email(user_repository, mock_session):
     :param mock_session: The mocked Session fixture.
     """
     # Arrange
-    mock_session.return_value.__enter__.return_value.exec.return_value.first.return_value = DBUser(
+    mock_session.exec.return_value.first.return_value = DBUser(
         id=1, email="test@example.com"
     )
 
@@ -104,7 +146,7 @@ def test_read_all(user_repository, mock_session):
     :param mock_session: The mocked Session fixture.
     """
     # Arrange
-    mock_session.return_value.__enter__.return_value.exec.return_value.all.return_value = [
+    mock_session.exec.return_value.all.return_value = [
         DBUser(id=1, username="testuser")
     ]
 
@@ -127,8 +169,8 @@ def test_create(user_repository, mock_session):
     user_create = UserCreate(
         username="testuser", email="test@example.com", password="testpassword"
     )
-    mock_session.return_value.__enter__.return_value.commit.return_value = None
-    mock_session.return_value.__enter__.return_value.refresh.return_value = None
+    mock_session.commit.return_value = None
+    mock_session.refresh.return_value = None
 
     # Act
     created_user = user_repository.create(user_create)
@@ -136,6 +178,7 @@ def test_create(user_repository, mock_session):
     # Assert
     assert created_user.username == "testuser"
     assert created_user.email == "test@example.com"
+    assert created_user.hashed_password == "testpassword"
 
 
 def test_update(user_repository, mock_session):
@@ -149,11 +192,10 @@ def test_update(user_repository, mock_session):
     user_update = UserUpdate(
         username="updateduser", email="updated@example.com", password="hashed"
     )
-    mock_session.return_value.__enter__.return_value.get.return_value = DBUser(
-        id=1, username="testuser"
+    mock_session_instance = mock_session
+    mock_session_instance.exec.return_value.scalar_one_or_none.return_value = DBUser(
+        id=1, username="updateduser", email="updated@example.com", version=2
     )
-    mock_session.return_value.__enter__.return_value.commit.return_value = None
-    mock_session.return_value.__enter__.return_value.refresh.return_value = None
 
     # Act
     updated_user = user_repository.update(1, user_update)
@@ -161,6 +203,10 @@ def test_update(user_repository, mock_session):
     # Assert
     assert updated_user.username == "updateduser"
     assert updated_user.email == "updated@example.com"
+    statement = mock_session_instance.exec.call_args.args[0]
+    assert "hashed_password" in statement.compile().params
+    assert "password" not in statement.compile().params
+    mock_session_instance.get.assert_not_called()
 
 
 def test_update_no_user(user_repository, mock_session):
@@ -176,9 +222,9 @@ def test_update_no_user(user_repository, mock_session):
         username="newuser", email="newuser@example.com", password="hashed"
     )
     expected_password_hash = get_password_hash(user_update.password)
-    mock_session.return_value.__enter__.return_value.get.return_value = None
-    mock_session.return_value.__enter__.return_value.commit.return_value = None
-    mock_session.return_value.__enter__.return_value.refresh.return_value = None
+    mock_session_instance = mock_session
+    mock_session_instance.exec.return_value.scalar_one_or_none.return_value = None
+    mock_session_instance.get.return_value = None
 
     # Act
     updated_user = user_repository.update(1, user_update)
@@ -195,6 +241,95 @@ def test_update_no_user(user_repository, mock_session):
     ), "Password should match"
 
 
+def test_update_id_of_another_realm(user_repository, mock_session):
+    """
+    Test that an upsert does not insert over the id of another realm's user.
+
+    :param user_repository:
+    :param mock_session:
+    :return:
+    """
+    # Arrange
+    mock_session.exec.return_value.scalar_one_or_none.return_value = None
+    mock_session.get.return_value = DBUser(id=1, tenant_id="other")
+
+    # Act & Assert
+    with pytest.raises(RowExistsError):
+        user_repository.update(1, UserUpdate(username="new", email="n@example.com"))
+    mock_session.add.assert_not_called()
+
+
+def test_update_new_user_needs_username_and_email(user_repository, mock_session):
+    """
+    Test that an upsert creating a user without an email is refused.
+
+    :param user_repository:
+    :param mock_session:
+    :return:
+    """
+    # Arrange
+    mock_session.exec.return_value.scalar_one_or_none.return_value = None
+    mock_session.get.return_value = None
+
+    # Act & Assert
+    with pytest.raises(MissingFieldsError) as excinfo:
+        user_repository.update(1, UserUpdate(username="new"))
+    assert excinfo.value.fields == ["email"]
+
+
+def test_update_rejects_explicit_null():
+    """
+    Test that a field which cannot be null may be left out but not sent as null.
+    """
+    # Act & Assert
+    assert UserUpdate.model_validate({}).model_dump(exclude_unset=True) == {}
+    with pytest.raises(ValidationError):
+        UserUpdate.model_validate({"username": None})
+    with pytest.raises(ValidationError):
+        UserUpdate.model_validate({"disabled": None})
+
+
+def test_patch(user_repository, mock_session):
+    """
+    Test the patch method of UserRepository only sends the fields that were set.
+
+    :param user_repository: The UserRepository instance.
+    :param mock_session: The mocked Session fixture.
+    """
+    # Arrange
+    mock_session_instance = mock_session
+    mock_session_instance.exec.return_value.scalar_one_or_none.return_value = DBUser(
+        id=1, username="testuser", disabled=True, version=2
+    )
+
+    # Act
+    patched_user = user_repository.patch(1, UserUpdate(disabled=True))
+
+    # Assert
+    assert patched_user.disabled is True
+    params = mock_session_instance.exec.call_args.args[0].compile().params
+    assert "disabled" in params
+    assert "username" not in params
+    assert "hashed_password" not in params
+
+
+def test_patch_version_conflict(user_repository, mock_session):
+    """
+    Test the patch method of UserRepository with a stale version.
+
+    :param user_repository: The UserRepository instance.
+    :param mock_session: The mocked Session fixture.
+    """
+    # Arrange
+    mock_session_instance = mock_session
+    mock_session_instance.exec.return_value.scalar_one_or_none.return_value = None
+    mock_session_instance.get.return_value = DBUser(id=1, version=5)
+
+    # Act & Assert
+    with pytest.raises(VersionConflictError):
+        user_repository.patch(1, UserUpdate(disabled=True, version=4))
+
+
 def test_delete(user_repository, mock_session):
     """
     Test the delete method of UserRepository.
@@ -203,10 +338,8 @@ def test_delete(user_repository, mock_session):
     :param mock_session: The mocked Session fixture.
     """
     # Arrange
-    mock_session.return_value.__enter__.return_value.get.return_value = DBUser(
-        id=1, username="testuser"
-    )
-    mock_session.return_value.__enter__.return_value.commit.return_value = None
+    mock_session.get.return_value = DBUser(id=1, username="testuser")
+    mock_session.commit.return_value = None
 
     # Act
     result = user_repository.delete(1)
@@ -224,12 +357,75 @@ def test_delete_no_user(user_repository, mock_session):
     :return:
     """
     # Arrange
-    mock_session.return_value.__enter__.return_value.get.return_value = None
-    mock_session.return_value.__enter__.return_value.commit.return_value = None
-    mock_session.return_value.__enter__.return_value.refresh.return_value = None
+    mock_session.get.return_value = None
+    mock_session.commit.return_value = None
+    mock_session.refresh.return_value = None
 
     # Act
     result = user_repository.delete(1)
 
     # Assert
     assert result is False, "Result should be False"
+
+
+def test_patch_bumps_security_stamp(user_repository, mock_session):
+    """
+    Test that disabling a user bumps its security stamp.
+
+    :param user_repository: The UserRepository instance.
+    :param mock_session: The mocked Session fixture.
+    """
+    # Arrange
+    mock_session.exec.return_value.scalar_one_or_none.return_value = DBUser(
+        id=1, username="testuser", disabled=True, security_stamp=2
+    )
+
+    # Act
+    user_repository.patch(1, UserUpdate(disabled=True))
+
+    # Assert
+    statement = mock_session.exec.call_args.args[0]
+    assert "security_stamp" in str(statement).split("RETURNING")[0]
+
+
+def test_patch_keeps_security_stamp(user_repository, mock_session):
+    """
+    Test that a change that does not affect tokens keeps the security stamp.
+
+    :param user_repository: The UserRepository instance.
+    :param mock_session: The mocked Session fixture.
+    """
+    # Arrange
+    mock_session.exec.return_value.scalar_one_or_none.return_value = DBUser(
+        id=1, username="renamed"
+    )
+
+    # Act
+    user_repository.patch(1, UserUpdate(username="renamed"))
+
+    # Assert
+    statement = mock_session.exec.call_args.args[0]
+    assert "security_stamp" not in str(statement).split("RETURNING")[0]
+
+
+@pytest.mark.parametrize(
+    "pending, committed",
+    [(False, True), (True, False)],
+    ids=["clean session", "pending changes"],
+)
+def test_release_connection(user_repository, mock_session, pending, committed):
+    """
+    Test that the read transaction is ended, but never one with pending changes.
+    """
+    # Arrange
+    mock_session.new = (
+        [DBUser(username="new", email="new@example.com")] if pending else []
+    )
+    mock_session.dirty = []
+    mock_session.deleted = []
+
+    # Act
+    user_repository.release_connection()
+
+    # Assert
+    assert mock_session.commit.called is committed
@@ -0,0 +1,277 @@
+"""
+This module contains tests for the in-process service caches.
+"""
+
+import pytest
+
+from app.models.client import ClientSnapshot
+from app.models.user import UserSnapshot
+from app.services.cache import (
+    CachePartitions,
+    RedisCacheBackend,
+    SnapshotCache,
+    build_cache,
+)
+
+
+def test_snapshot_cache_get_put():
+    """
+    Test that a cached snapshot is returned by key.
+    """
+    # Arrange
+    cache: SnapshotCache[str] = SnapshotCache()
+
+    # Act
+    cache.put("alice", 1, "snapshot")
+
+    # Assert
+    assert cache.get("alice") == "snapshot"
+    assert cache.get("bob") is None
+
+
+def test_snapshot_cache_invalidate_by_uid():
+    """
+    Test that a snapshot is dropped by the primary key of its row.
+    """
+    # Arrange
+    cache: SnapshotCache[str] = SnapshotCache()
+    cache.put("alice", 1, "snapshot")
+
+    # Act
+    cache.invalidate(1)
+
+    # Assert
+    assert cache.get("alice") is None
+    assert len(cache) == 0
+
+
+def test_snapshot_cache_rekeys_renamed_row():
+    """
+    Test that caching a row under a new key drops the old key.
+    """
+    # Arrange
+    cache: SnapshotCache[str] = SnapshotCache()
+    cache.put("alice", 1, "old")
+
+    # Act
+    cache.put("alicia", 1, "new")
+
+    # Assert
+    assert cache.get("alice") is None
+    assert cache.get("alicia") == "new"
+
+
+def test_snapshot_cache_evicts_least_recently_used():
+    """
+    Test that the least recently used snapshot is evicted beyond maxsize.
+    """
+    # Arrange
+    cache: SnapshotCache[str] = SnapshotCache(maxsize=2)
+    cache.put("alice", 1, "a")
+    cache.put("bob", 2, "b")
+    cache.get("alice")
+
+    # Act
+    cache.put("carol", 3, "c")
+
+    # Assert
+    assert cache.get("bob") is None
+    assert cache.get("alice") == "a"
+    assert cache.get("carol") == "c"
+
+
+def test_snapshot_cache_ttl_zero_disables():
+    """
+    Test that a zero ttl turns the cache off.
+    """
+    # Arrange
+    cache: SnapshotCache[str] = SnapshotCache(ttl=0)
+
+    # Act
+    cache.put("alice", 1, "snapshot")
+
+    # Assert
+    assert cache.get("alice") is None
+    assert len(cache) == 0
+
+
+class FakeRedis:
+    """
+    A minimal in-memory stand-in for the redis client commands the cache uses
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.messages = []
+        self.down = False
+
+    def _check(self):
+        if self.down:
+            raise ConnectionError("down")
+
+    def get(self, name):
+        self._check()
+        return self.data.get(name)
+
+    def set(self, name, value, ex=None):  # pylint: disable=unused-argument
+        self._check()
+        self.data[name] = value.encode() if isinstance(value, str) else value
+
+    def delete(self, name):
+        self._check()
+        self.data.pop(name, None)
+
+    def publish(self, channel, message):
+        self._check()
+        self.messages.append(
+            {"type": "message", "channel": channel, "data": message.encode()}
+        )
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        return []
+
+    def scan_iter(self, match):
+        self._check()
+        prefix = match.rstrip("*")
+        return [name for name in list(self.data) if name.startswith(prefix)]
+
+    def pubsub(
+        self, ignore_subscribe_messages=False
+    ):  # pylint: disable=unused-argument
+        return self
+
+    def subscribe(self, channel):  # pylint: disable=unused-argument
+        self._check()
+
+    def listen(self):
+        while self.messages:
+            yield self.messages.pop(0)
+
+
+@pytest.fixture
+def fake_redis():
+    """
+    Fixture providing a fake server shared by two workers.
+    """
+    return FakeRedis()
+
+
+def test_redis_cache_shares_snapshots(fake_redis):
+    """
+    Test that a snapshot cached by one worker is served to another.
+    """
+    # Arrange
+    worker_a = RedisCacheBackend(fake_redis, "users", UserSnapshot)
+    worker_b = RedisCacheBackend(fake_redis, "users", UserSnapshot)
+    snapshot = UserSnapshot(
+        id=1, username="alice", email="alice@example.com", scopes=("read:users",)
+    )
+
+    # Act
+    worker_a.put("alice", 1, snapshot)
+
+    # Assert
+    assert worker_b.get("alice") == snapshot
+
+
+def test_redis_cache_keeps_client_frozensets(fake_redis):
+    """
+    Test that the frozensets of a client snapshot survive the round trip.
+    """
+    # Arrange
+    worker_a = RedisCacheBackend(fake_redis, "clients", ClientSnapshot)
+    worker_b = RedisCacheBackend(fake_redis, "clients", ClientSnapshot)
+    snapshot = ClientSnapshot(
+        id=1,
+        client_id="web",
+        version=1,
+        redirect_uris=frozenset({"https://example.com/cb"}),
+        scope=frozenset({"openid", "profile"}),
+        contacts=("ops@example.com",),
+    )
+
+    # Act
+    worker_a.put("web", 1, snapshot)
+
+    # Assert
+    assert worker_b.get("web") == snapshot
+    assert isinstance(worker_b.get("web").scope, frozenset)
+
+
+def test_redis_cache_invalidation_reaches_other_workers(fake_redis):
+    """
+    Test that a write drops the snapshot from the server and every near cache.
+    """
+    # Arrange
+    worker_a = RedisCacheBackend(fake_redis, "users", UserSnapshot)
+    worker_b = RedisCacheBackend(fake_redis, "users", UserSnapshot)
+    worker_a.put("alice", 1, UserSnapshot(id=1, username="alice", email="a@b.c"))
+    worker_b.get("alice")
+
+    # Act
+    worker_a.invalidate(1)
+    worker_b.listen_once()
+
+    # Assert
+    assert worker_b.local.get("alice") is None
+    assert worker_b.get("alice") is None
+    assert not fake_redis.data
+
+
+def test_redis_cache_reads_through_when_down(fake_redis):
+    """
+    Test that an unreachable server behaves like a cache miss.
+    """
+    # Arrange
+    backend = RedisCacheBackend(fake_redis, "users", UserSnapshot)
+    fake_redis.down = True
+
+    # Act
+    backend.put("alice", 1, UserSnapshot(id=1, username="alice", email="a@b.c"))
+    backend.local.clear()
+
+    # Assert
+    assert backend.get("alice") is None
+
+
+def test_build_cache_defaults_to_memory():
+    """
+    Test that the in-process cache is used unless redis is configured.
+    """
+    # Act & Assert
+    assert isinstance(build_cache("users", UserSnapshot), SnapshotCache)
+
+
+def test_partitions_are_sized_per_realm():
+    """
+    Test that filling one realm's cache does not evict another realm's entries.
+    """
+    # Arrange
+    partitions = CachePartitions(lambda realm: SnapshotCache(maxsize=1))
+    partitions.for_realm("acme").put("alice", 1, "alice")
+
+    # Act
+    partitions.for_realm("globex").put("bob", 2, "bob")
+    partitions.for_realm("globex").put("carol", 3, "carol")
+
+    # Assert
+    assert partitions.for_realm("acme").get("alice") == "alice"
+    assert partitions.for_realm("globex").get("bob") is None
+
+
+def test_partitions_invalidate_every_realm():
+    """
+    Test that an invalidation reaches the partition holding the row.
+    """
+    # Arrange
+    partitions = CachePartitions(lambda realm: SnapshotCache())
+    partitions.for_realm("acme").put("alice", 1, "alice")
+
+    # Act
+    partitions.invalidate(1)
+
+    # Assert
+    assert partitions.for_realm("acme").get("alice") is None
@@ -2,12 +2,21 @@
 This module contains tests for the client service.
 """
 
+import orjson
 import pytest
 
+from app.events import (
+    ClientChanged,
+    ClientDeleted,
+    ClientSecretRotated,
+    event_bus,
+)
 from app.models.client import DBClient
+from app.realms import DEFAULT_REALM
 from app.repositories.client import ClientRepository
 from app.schemas.client import ClientCreate, ClientUpdate
-from app.services.client import ClientService
+from app.services.cache import SnapshotCache
+from app.services.client import ClientService, client_caches, metadata_caches
 
 
 @pytest.fixture
@@ -29,7 +38,7 @@ def client_service(mock_repository: ClientRepository) -> ClientService:
     :param mock_repository:
     :return:
     """
-    return ClientService(mock_repository)
+    return ClientService(mock_repository, SnapshotCache())
 
 
 @pytest.fixture
@@ -171,6 +180,27 @@ def test_update(mock_repository, client_update, client_service, mock_db_client)
     mock_repository.update.assert_called_once_with(1, client_update)
 
 
+def test_patch(mock_repository, client_update, client_service, mock_db_client) -> None:
+    """
+    This function tests the patch method of the client service.
+
+    :param mock_repository:
+    :param client_update:
+    :param client_service:
+    :param mock_db_client:
+    :return:
+    """
+    # Arrange
+    mock_repository.patch.return_value = mock_db_client
+
+    # Act
+    result = client_service.patch(1, client_update)
+
+    # Assert
+    assert result == mock_db_client
+    mock_repository.patch.assert_called_once_with(1, client_update)
+
+
 def test_delete(mock_repository, client_service) -> None:
     """
     This function tests the delete method of the client service.
@@ -188,3 +218,194 @@ def test_delete(mock_repository, client_service) -> None:
     # Assert
     assert result is True
     mock_repository.delete.assert_called_once_with(1)
+
+
+def test_read_snapshot_caches(mock_repository, client_service, test_db_client) -> None:
+    """
+    This function tests that read_snapshot snapshots a client once and then serves it from cache.
+
+    :param mock_repository:
+    :param client_service:
+    :param test_db_client:
+    :return:
+    """
+    # Arrange
+    test_db_client.id = 1
+    mock_repository.read_by_client_id.return_value = test_db_client
+
+    # Act
+    first = client_service.read_snapshot("newclient")
+    second = client_service.read_snapshot("newclient")
+
+    # Assert
+    assert first is second
+    assert first.allows_redirect_uri("https://example.com/callback")
+    assert first.allows_grant_type("authorization_code")
+    mock_repository.read_by_client_id.assert_called_once_with("newclient")
+
+
+def test_read_snapshot_unknown_client(mock_repository, client_service) -> None:
+    """
+    This function tests read_snapshot for a client that does not exist.
+
+    :param mock_repository:
+    :param client_service:
+    :return:
+    """
+    # Arrange
+    mock_repository.read_by_client_id.return_value = None
+
+    # Act
+    result = client_service.read_snapshot("missing")
+
+    # Assert
+    assert result is None
+
+
+def test_read_secret(mock_repository, client_service, test_db_client) -> None:
+    """
+    This function tests that read_secret reads the secret from the repository
+    every time and never caches it.
+
+    :param mock_repository:
+    :param client_service:
+    :param test_db_client:
+    :return:
+    """
+    # Arrange
+    mock_repository.read_by_client_id.return_value = test_db_client
+
+    # Act
+    first = client_service.read_secret("newclient")
+    second = client_service.read_secret("newclient")
+
+    # Assert
+    assert first == second == test_db_client.client_secret
+    assert mock_repository.read_by_client_id.call_count == 2
+
+
+@pytest.mark.parametrize(
+    "change", [ClientChanged(1), ClientSecretRotated(1), ClientDeleted(1)]
+)
+def test_change_invalidates_snapshot(change, mock_repository, test_db_client) -> None:
+    """
+    This function tests that a committed change drops the cached snapshot.
+
+    :param change:
+    :param mock_repository:
+    :param test_db_client:
+    :return:
+    """
+    # Arrange
+    client_caches.clear()
+    mock_repository.realm = DEFAULT_REALM
+    client_service = ClientService(mock_repository)
+    test_db_client.id = 1
+    mock_repository.read_by_client_id.return_value = test_db_client
+    client_service.read_snapshot("newclient")
+
+    # Act
+    event_bus.publish(change)
+
+    # Assert
+    assert client_caches.for_realm(DEFAULT_REALM).get("newclient") is None
+
+
+def test_read_metadata_caches_the_document(mock_repository, test_db_client) -> None:
+    """
+    This function tests that the public metadata is read once and never
+    includes the secret.
+
+    :param mock_repository:
+    :param test_db_client:
+    :return:
+    """
+    # Arrange
+    client_service = ClientService(mock_repository, SnapshotCache(), SnapshotCache())
+    test_db_client.id = 1
+    mock_repository.read.return_value = test_db_client
+
+    # Act
+    first = client_service.read_metadata(1)
+    second = client_service.read_metadata(1)
+
+    # Assert
+    assert first is second
+    mock_repository.read.assert_called_once_with(1)
+    metadata = orjson.loads(first.body)
+    assert metadata["client_name"] == "New Client"
+    assert metadata["version"] == 1
+    assert "client_secret" not in metadata
+    assert "redirect_uris" not in metadata
+
+
+def test_read_metadata_expires_with_max_age(
+    mocker, mock_repository, test_db_client
+) -> None:
+    """
+    This function tests that cached metadata is kept no longer than
+    CLIENT_METADATA_MAX_AGE_SECONDS, so a change made on another worker is
+    served once the document has expired.
+
+    :param mocker:
+    :param mock_repository:
+    :param test_db_client:
+    :return:
+    """
+    # Arrange
+    settings = mocker.patch("app.services.client.get_settings").return_value
+    settings.client_metadata_max_age_seconds = 60
+    clock = mocker.patch("app.services.cache.time.monotonic", return_value=1000.0)
+    client_service = ClientService(mock_repository, SnapshotCache(), SnapshotCache())
+    test_db_client.id = 1
+    mock_repository.read.return_value = test_db_client
+    client_service.read_metadata(1)
+
+    # Act
+    clock.return_value = 1061.0
+    client_service.read_metadata(1)
+
+    # Assert
+    assert mock_repository.read.call_count == 2
+
+
+def test_read_metadata_not_found(mock_repository) -> None:
+    """
+    This function tests that an unknown client has no metadata.
+
+    :param mock_repository:
+    :return:
+    """
+    # Arrange
+    client_service = ClientService(mock_repository, SnapshotCache(), SnapshotCache())
+    mock_repository.read.return_value = None
+
+    # Act & Assert
+    assert client_service.read_metadata(1) is None
+
+
+def test_change_invalidates_metadata(mock_repository, test_db_client) -> None:
+    """
+    This function tests that a committed change drops the cached metadata,
+    and the next read gets a new ETag with the new version.
+
+    :param mock_repository:
+    :param test_db_client:
+    :return:
+    """
+    # Arrange
+    metadata_caches.clear()
+    mock_repository.realm = DEFAULT_REALM
+    client_service = ClientService(mock_repository)
+    test_db_client.id = 1
+    mock_repository.read.return_value = test_db_client
+    before = client_service.read_metadata(1)
+    test_db_client.version = 2
+
+    # Act
+    event_bus.publish(ClientChanged(1))
+    after = client_service.read_metadata(1)
+
+    # Assert
+    assert after.etag != before.etag
+    assert mock_repository.read.call_count == 2
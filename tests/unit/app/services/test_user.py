@@ -4,10 +4,23 @@ This module contains tests for the user service.
 
 import pytest
 
+from app.events import (
+    EventBus,
+    PasswordChanged,
+    UserChanged,
+    UserDisabled,
+    event_bus,
+    invalidate_on,
+)
 from app.models.user import DBUser
 from app.repositories.user import UserRepository
 from app.schemas.user import UserCreate, UserUpdate
-from app.services.user import UserService
+from app.services.cache import SnapshotCache
+from app.services.user import (
+    SecurityStampCache,
+    UserService,
+    security_stamp_cache,
+)
 
 
 @pytest.fixture
@@ -258,3 +271,117 @@ def test_delete(uid, expected_result, mock_repository, user_service):
     # Assert
     assert result is expected_result
     mock_repository.delete.assert_called_once_with(uid)
+
+
+def test_patch(mock_repository, user_service, user_update, test_db_user):
+    """
+    This function tests the patch method of the user service.
+
+    :param mock_repository:
+    :param user_service:
+    :param user_update:
+    :param test_db_user:
+    :return:
+    """
+    # Arrange
+    mock_repository.patch.return_value = test_db_user
+
+    # Act
+    result = user_service.patch(1, user_update)
+
+    # Assert
+    assert result == test_db_user
+    mock_repository.patch.assert_called_once_with(1, user_update)
+
+
+def test_read_security_stamp_is_cached(mock_repository):
+    """
+    Test that the security stamp is only loaded once while it is fresh.
+
+    :param mock_repository:
+    """
+    # Arrange
+    service = UserService(mock_repository, stamp_cache=SecurityStampCache(ttl=60))
+    mock_repository.read_security_stamp.return_value = 3
+
+    # Act
+    first = service.read_security_stamp(1)
+    second = service.read_security_stamp(1)
+
+    # Assert
+    assert first == second == 3
+    mock_repository.read_security_stamp.assert_called_once_with(1)
+
+
+def test_password_change_drops_security_stamp(mock_repository):
+    """
+    Test that a committed password change drops the cached security stamp.
+
+    :param mock_repository:
+    """
+    # Arrange
+    security_stamp_cache.put(1, 3)
+
+    # Act
+    event_bus.publish(PasswordChanged(1))
+
+    # Assert
+    assert security_stamp_cache.get(1) is None
+
+
+def test_security_stamp_cache_expires():
+    """
+    Test that a cached security stamp is dropped once its ttl passed.
+    """
+    # Arrange
+    stamp_cache = SecurityStampCache(ttl=0)
+
+    # Act
+    stamp_cache.put(1, 3)
+
+    # Assert
+    assert stamp_cache.get(1) is None
+
+
+def test_security_stamp_cache_is_bounded():
+    """
+    Test that the least recently used stamps are evicted beyond maxsize.
+    """
+    # Arrange
+    stamp_cache = SecurityStampCache(ttl=60, maxsize=2)
+
+    # Act
+    for user_id in (1, 2, 3):
+        stamp_cache.put(user_id, 7)
+
+    # Assert
+    assert len(stamp_cache) == 2
+    assert stamp_cache.get(1) is None
+    assert stamp_cache.get(3) == 7
+
+
+def test_read_snapshot_is_cached(mock_repository, test_db_user):
+    """
+    Test that a user snapshot is served from the cache until the user changes.
+
+    :param mock_repository:
+    :param test_db_user:
+    """
+    # Arrange
+    cache = SnapshotCache(ttl=60)
+    bus = EventBus()
+    invalidate_on(UserChanged, cache, bus=bus)
+    test_db_user.id = 1
+    service = UserService(mock_repository, cache=cache)
+    mock_repository.read_by_username.return_value = test_db_user
+
+    # Act
+    first = service.read_snapshot("newuser")
+    second = service.read_snapshot("newuser")
+    bus.publish(UserDisabled(1))
+    third = service.read_snapshot("newuser")
+
+    # Assert
+    assert first is second
+    assert third is not first
+    assert mock_repository.read_by_username.call_count == 2
@@ -0,0 +1,135 @@
+"""
+This module contains the unit tests for the authorization code stores.
+"""
+
+import time
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, create_engine
+
+from app.models.code import AuthorizationCode
+from app.stores.codes import (
+    DatabaseAuthorizationCodeStore,
+    InMemoryAuthorizationCodeStore,
+)
+
+
+def make_code(code="abc", expires_in=60.0):
+    """
+    Build an authorization code expiring in the given number of seconds
+
+    :param code:
+    :param expires_in:
+    :return:
+    """
+    return AuthorizationCode(
+        code=code,
+        client_id="client",
+        redirect_uri="https://example.com/cb",
+        username="testuser",
+        scopes=("openid", "profile"),
+        code_challenge="challenge",
+        code_challenge_method="S256",
+        expires_at=time.time() + expires_in,
+    )
+
+
+@pytest.fixture
+def sqlite_engine():
+    """
+    Fixture providing an in-memory SQLite engine with the tables created.
+
+    :return:
+    """
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture(params=["memory", "database"])
+def code_store(request, sqlite_engine):
+    """
+    Fixture providing each authorization code store implementation.
+
+    :param request:
+    :param sqlite_engine:
+    :return:
+    """
+    if request.param == "memory":
+        return InMemoryAuthorizationCodeStore()
+    return DatabaseAuthorizationCodeStore(sqlite_engine)
+
+
+def test_consume_is_single_use(code_store):
+    """
+    Test that a code can only be consumed once.
+    """
+    # Arrange
+    code_store.save(make_code())
+
+    # Act
+    first = code_store.consume("abc")
+    second = code_store.consume("abc")
+
+    # Assert
+    assert first is not None
+    assert first.username == "testuser"
+    assert first.scopes == ("openid", "profile")
+    assert second is None
+
+
+def test_consume_expired(code_store):
+    """
+    Test that an expired code is never returned.
+    """
+    # Arrange
+    code_store.save(make_code(expires_in=-1))
+
+    # Act
+    result = code_store.consume("abc")
+
+    # Assert
+    assert result is None
+
+
+def test_consume_unknown(code_store):
+    """
+    Test consuming a code that was never issued.
+    """
+    assert code_store.consume("missing") is None
+
+
+def test_sweep_removes_expired(code_store):
+    """
+    Test that sweep removes expired codes and keeps live ones.
+    """
+    # Arrange
+    code_store.save(make_code("old", expires_in=-1))
+    code_store.save(make_code("new"))
+
+    # Act
+    removed = code_store.sweep()
+
+    # Assert
+    assert removed == 1
+    assert code_store.consume("new") is not None
+
+
+def test_save_sweeps_periodically():
+    """
+    Test that the in-memory store sweeps on save once the interval elapsed.
+    """
+    # Arrange
+    store = InMemoryAuthorizationCodeStore(sweep_interval=0)
+    store.save(make_code("old", expires_in=-1))
+
+    # Act
+    store.save(make_code("new"))
+
+    # Assert
+    assert len(store) == 1
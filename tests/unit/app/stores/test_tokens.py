@@ -0,0 +1,155 @@
+"""
+This module contains the unit tests for the opaque access token store.
+"""
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app.models.token import DBAccessToken
+from app.realms import DEFAULT_REALM
+from app.stores.tokens import OpaqueTokenStore, hash_handle
+
+
+@pytest.fixture
+def sqlite_engine():
+    """
+    Fixture providing an in-memory SQLite engine with the tables created.
+
+    :return:
+    """
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+CLAIMS = {"sub": "testuser", "scope": "read:users openid"}
+
+
+def test_issue_stores_only_the_hash(sqlite_engine):
+    """
+    Test that the table holds the hashed handle and never the handle.
+    """
+    # Arrange
+    store = OpaqueTokenStore(sqlite_engine)
+
+    # Act
+    handle = store.issue(CLAIMS, 60)
+
+    # Assert
+    with Session(sqlite_engine) as session:
+        row = session.exec(select(DBAccessToken)).one()
+    assert "." not in handle
+    assert row.token_hash == hash_handle(handle)
+    assert row.sub == "testuser"
+
+
+def test_lookup_hits_memory_without_a_query(sqlite_engine, mocker):
+    """
+    Test that a token issued by this worker is validated from memory.
+    """
+    # Arrange
+    store = OpaqueTokenStore(sqlite_engine)
+    handle = store.issue(CLAIMS, 60)
+    load = mocker.spy(store, "_load")
+
+    # Act
+    claims = store.lookup(handle)
+
+    # Assert
+    assert claims.sub == "testuser"
+    assert claims.scopes == frozenset({"read:users", "openid"})
+    load.assert_not_called()
+
+
+def test_lookup_falls_back_to_the_table(sqlite_engine):
+    """
+    Test that another worker finds the token in the table and keeps it.
+    """
+    # Arrange
+    handle = OpaqueTokenStore(sqlite_engine).issue(CLAIMS, 60)
+    other = OpaqueTokenStore(sqlite_engine)
+
+    # Act
+    claims = other.lookup(handle)
+
+    # Assert
+    assert claims.sub == "testuser"
+    assert len(other) == 1
+
+
+def test_lookup_rejects_unknown_and_expired_tokens(sqlite_engine):
+    """
+    Test that unknown and expired tokens have no claims.
+    """
+    # Arrange
+    store = OpaqueTokenStore(sqlite_engine)
+    expired = store.issue(CLAIMS, -1)
+
+    # Act / Assert
+    assert store.lookup("unknown") is None
+    assert store.lookup(expired) is None
+
+
+def test_hot_tier_is_bounded(sqlite_engine):
+    """
+    Test that the least recently used tokens leave the hot tier first.
+    """
+    # Arrange
+    store = OpaqueTokenStore(sqlite_engine, maxsize=2)
+    first = store.issue(CLAIMS, 60)
+    store.issue(CLAIMS, 60)
+
+    # Act
+    store.lookup(first)
+    store.issue(CLAIMS, 60)
+
+    # Assert
+    assert len(store) == 2
+    # pylint: disable-next=protected-access
+    assert hash_handle(first) in store._hot(DEFAULT_REALM)
+
+
+def test_hot_tier_is_partitioned_by_realm(sqlite_engine):
+    """
+    Test that tokens of one realm do not evict the tokens of another, and
+    that a token presented to another realm is not kept there.
+    """
+    # Arrange
+    store = OpaqueTokenStore(sqlite_engine, maxsize=1)
+    default = store.issue(CLAIMS, 60)
+    acme = store.issue({**CLAIMS, "realm": "acme"}, 60)
+
+    # Act
+    claims = store.lookup(default, "acme")
+
+    # Assert
+    assert claims.realm == DEFAULT_REALM
+    assert len(store) == 2
+    assert store.lookup(default).realm == DEFAULT_REALM
+    assert store.lookup(acme, "acme").realm == "acme"
+    # pylint: disable-next=protected-access
+    assert hash_handle(default) not in store._hot("acme")
+
+
+def test_evict_expired_keeps_the_table(sqlite_engine):
+    """
+    Test that evict_expired only drops expired tokens from the hot tier.
+    """
+    # Arrange
+    store = OpaqueTokenStore(sqlite_engine)
+    store.issue(CLAIMS, -1)
+    store.issue(CLAIMS, 60)
+
+    # Act
+    evicted = store.evict_expired()
+
+    # Assert
+    assert evicted == 1
+    assert len(store) == 1
+    with Session(sqlite_engine) as session:
+        assert len(session.exec(select(DBAccessToken)).all()) == 2
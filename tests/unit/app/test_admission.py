@@ -0,0 +1,94 @@
+"""
+This module contains unit tests for request shedding in app.admission.
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.admission import AdmissionController, AdmissionMiddleware, parse_routes
+
+ROUTES = ["GET /users", "/debug/*"]
+
+
+def test_parse_routes():
+    """
+    Test that a route names an optional method and a path or a prefix.
+    """
+    # Act & Assert
+    assert parse_routes(ROUTES) == [("GET", "/users", False), (None, "/debug/", True)]
+
+
+@pytest.mark.parametrize(
+    "method, path, expected",
+    [
+        ("GET", "/users", True),
+        ("GET", "/users/me", False),
+        ("POST", "/users", False),
+        ("POST", "/debug/profile", True),
+        ("POST", "/token", False),
+    ],
+)
+def test_is_low_priority(method, path, expected):
+    """
+    Test that only the listed routes may be shed.
+    """
+    # Arrange
+    controller = AdmissionController(ROUTES, 0.1, lambda: 0.0)
+
+    # Act & Assert
+    assert controller.is_low_priority(method, path) is expected
+
+
+def test_should_shed_only_under_pressure(mocker):
+    """
+    Test that low priority requests are shed once the waits pass the threshold.
+    """
+    # Arrange
+    pressure = mocker.Mock(return_value=0.05)
+    controller = AdmissionController(ROUTES, 0.1, pressure)
+
+    # Act
+    calm = controller.should_shed("GET", "/users")
+    pressure.return_value = 0.5
+    busy = controller.should_shed("GET", "/users")
+    login = controller.should_shed("POST", "/token")
+
+    # Assert
+    assert (calm, busy, login) == (False, True, False)
+    assert controller.shed == 1
+
+
+def test_should_shed_disabled(mocker):
+    """
+    Test that a threshold of 0 never sheds and never looks at the pool.
+    """
+    # Arrange
+    pressure = mocker.Mock(return_value=10.0)
+    controller = AdmissionController(ROUTES, 0, pressure)
+
+    # Act & Assert
+    assert controller.should_shed("GET", "/users") is False
+    pressure.assert_not_called()
+
+
+def test_middleware_answers_503_with_retry_after():
+    """
+    Test that a shed request gets 503 and Retry-After while others pass.
+    """
+    # Arrange
+    app = FastAPI()
+    app.get("/users")(lambda: [])
+    app.get("/users/me")(lambda: {})
+    controller = AdmissionController(ROUTES, 0.1, lambda: 1.0, retry_after=7)
+    app.add_middleware(AdmissionMiddleware, controller=controller)
+    client = TestClient(app)
+
+    # Act
+    shed = client.get("/users")
+    kept = client.get("/users/me")
+
+    # Assert
+    assert shed.status_code == 503
+    assert shed.headers["retry-after"] == "7"
+    assert kept.status_code == 200
@@ -0,0 +1,160 @@
+"""
+This module contains unit tests for the audit log in app.audit.
+"""
+
+import orjson
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app.audit import (
+    FAILURE,
+    AuditLog,
+    AuditSink,
+    DatabaseAuditSink,
+    JSONLinesAuditSink,
+)
+from app.models.audit import DBAuditEvent
+
+
+class ListSink(AuditSink):
+    """
+    A sink remembering the batches it was given
+    """
+
+    def __init__(self):
+        self.batches = []
+
+    def write(self, events):
+        self.batches.append(list(events))
+
+
+@pytest.fixture
+def sqlite_engine():
+    """
+    Fixture providing an in-memory SQLite engine with the tables created.
+
+    :return:
+    """
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def test_record_only_queues():
+    """
+    Test that recording an event does not touch the sink.
+    """
+    # Arrange
+    sink = ListSink()
+    audit = AuditLog(sink)
+
+    # Act
+    audit.record("token", actor="testuser", target="client")
+
+    # Assert
+    assert len(audit) == 1
+    assert not sink.batches
+
+
+def test_flush_writes_in_batches():
+    """
+    Test that flush drains the queue batch_size events at a time, in order.
+    """
+    # Arrange
+    sink = ListSink()
+    audit = AuditLog(sink, batch_size=2)
+    for index in range(5):
+        audit.record("token", actor=f"user{index}")
+
+    # Act
+    written = audit.flush()
+
+    # Assert
+    assert written == 5
+    assert [len(batch) for batch in sink.batches] == [2, 2, 1]
+    assert sink.batches[0][0].actor == "user0"
+    assert len(audit) == 0
+
+
+def test_record_drops_when_full():
+    """
+    Test that events past maxsize are dropped and counted.
+    """
+    # Arrange
+    audit = AuditLog(ListSink(), maxsize=2)
+
+    # Act
+    for _ in range(3):
+        audit.record("token")
+
+    # Assert
+    assert audit.metrics() == {
+        "queued": 2,
+        "recorded": 2,
+        "dropped": 1,
+        "written": 0,
+        "failed": 0,
+    }
+
+
+def test_flush_counts_failed_batches(mocker):
+    """
+    Test that a batch the sink rejects is counted and does not stay queued.
+    """
+    # Arrange
+    sink = mocker.Mock(AuditSink)
+    sink.write.side_effect = OSError("disk full")
+    audit = AuditLog(sink)
+    audit.record("token", FAILURE)
+
+    # Act
+    written = audit.flush()
+
+    # Assert
+    assert written == 0
+    assert audit.failed == 1
+    assert len(audit) == 0
+
+
+def test_database_sink(sqlite_engine):
+    """
+    Test that the database sink inserts the events.
+    """
+    # Arrange
+    audit = AuditLog(DatabaseAuditSink(sqlite_engine))
+    audit.record("user.delete", actor="admin", target="2")
+
+    # Act
+    audit.flush()
+
+    # Assert
+    with Session(sqlite_engine) as session:
+        row = session.exec(select(DBAuditEvent)).one()
+    assert row.action == "user.delete"
+    assert row.outcome == "success"
+    assert row.actor == "admin"
+
+
+def test_jsonl_sink_rotates(tmp_path):
+    """
+    Test that the JSON lines sink rotates the file once it is full.
+    """
+    # Arrange
+    path = tmp_path / "audit.jsonl"
+    audit = AuditLog(JSONLinesAuditSink(str(path), max_bytes=1, backups=2))
+
+    # Act
+    audit.record("token", actor="first")
+    audit.flush()
+    audit.record("token", actor="second")
+    audit.flush()
+
+    # Assert
+    assert orjson.loads(path.read_bytes())["actor"] == "second"
+    rotated = (tmp_path / "audit.jsonl.1").read_bytes()
+    assert orjson.loads(rotated)["actor"] == "first"
@@ -0,0 +1,124 @@
+"""
+This module contains unit tests for the settings in app.conf.
+"""
+
+from datetime import timedelta
+
+import pytest
+from pydantic import ValidationError
+
+from app import conf
+from app.conf import Settings, get_settings, reload_settings
+from app.exceptions import ConfigurationError
+
+
+def test_settings_parse_lists(monkeypatch):
+    """
+    Test that comma separated values become lists and dicts.
+    """
+    # Arrange
+    monkeypatch.setenv("REALMS", "default, acme,,globex")
+    monkeypatch.setenv("REALM_SECRET_KEYS", "acme:key-1,globex:key:2")
+
+    # Act
+    settings = Settings(_env_file=None)
+
+    # Assert
+    assert settings.realms == ["default", "acme", "globex"]
+    assert settings.realm_secret_keys == {"acme": "key-1", "globex": "key:2"}
+
+
+@pytest.mark.parametrize(
+    "name, value",
+    [
+        ("ALGORITHM", "none"),
+        ("ACCESS_TOKEN_EXPIRE_MINUTES", "soon"),
+        ("TOKEN_FORMAT", "paseto"),
+        ("SWEEP_BATCH_SIZE", "0"),
+    ],
+)
+def test_settings_reject_invalid_values(monkeypatch, name, value):
+    """
+    Test that a bad setting fails when the settings are loaded.
+    """
+    # Arrange
+    monkeypatch.setenv(name, value)
+
+    # Act & Assert
+    with pytest.raises(ValidationError):
+        Settings(_env_file=None)
+
+
+def test_settings_derived_values():
+    """
+    Test that the token lifetime is derived once from the minutes.
+    """
+    # Act
+    settings = Settings(_env_file=None, access_token_expire_minutes=5)
+
+    # Assert
+    assert settings.access_token_expires == timedelta(minutes=5)
+    assert settings.access_token_expires is settings.access_token_expires
+
+
+@pytest.mark.parametrize(
+    "database_url, pooled",
+    [
+        ("sqlite:///:memory:", False),
+        ("sqlite://", False),
+        ("sqlite:///./app.db", True),
+        ("postgresql://user:password@db/app", True),
+    ],
+)
+def test_engine_options(database_url, pooled):
+    """
+    Test that pool sizes are only passed to engines that take them.
+    """
+    # Act
+    options = Settings(_env_file=None, database_url=database_url).engine_options
+
+    # Assert
+    assert ("pool_size" in options) is pooled
+
+
+def test_check_names_missing_settings():
+    """
+    Test that check lists every setting a server cannot run without.
+    """
+    # Arrange
+    settings = Settings(_env_file=None, secret_key="", database_url="")
+
+    # Act & Assert
+    with pytest.raises(ConfigurationError, match="SECRET_KEY, DATABASE_URL"):
+        settings.check()
+
+
+def test_reload_applies_only_reloadable_settings(monkeypatch, mocker):
+    """
+    Test that SIGHUP reloads token lifetimes but not structural settings.
+    """
+    # Arrange
+    mocker.patch.object(conf, "_settings", Settings(_env_file=None))
+    monkeypatch.setenv("ACCESS_TOKEN_EXPIRE_MINUTES", "5")
+    monkeypatch.setenv("TOKEN_FORMAT", "opaque")
+
+    # Act
+    settings = reload_settings()
+
+    # Assert
+    assert settings is get_settings()
+    assert settings.access_token_expires == timedelta(minutes=5)
+    assert settings.token_format == "jwt"
+
+
+def test_reload_keeps_settings_when_invalid(monkeypatch, mocker):
+    """
+    Test that an invalid edit leaves the running settings untouched.
+    """
+    # Arrange
+    current = Settings(_env_file=None)
+    mocker.patch.object(conf, "_settings", current)
+    monkeypatch.setenv("ACCESS_TOKEN_EXPIRE_MINUTES", "-1")
+
+    # Act & Assert
+    assert reload_settings() is current
@@ -1,33 +1,57 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import AsyncMock
 
 import pytest
-from fastapi import HTTPException, status
-from jose import JWTError
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, status
+from fastapi.security import SecurityScopes
+from fastapi.testclient import TestClient
+from sqlalchemy import text
 from sqlalchemy.engine import Engine
-from sqlmodel import Session, create_engine
+from sqlmodel import Session, SQLModel, create_engine, select
 
+from app.admission import AdmissionController, AdmissionMiddleware
 from app.dependencies import (
     get_client_repository,
     get_client_service,
     get_current_active_user,
     get_current_user,
     get_engine,
+    get_lane_engine,
+    get_realm,
+    get_request_engine,
     get_session,
+    get_token_cache,
+    get_token_store,
     get_user_repository,
     get_user_service,
+    pool_pressure,
+    use_primary,
+    verify_token,
 )
-from app.models.token import TokenData
-from app.models.user import DBUser
+from app.lanes import Lane, LaneMiddleware, LaneRegistry, LaneRoute
+from app.models.token import Claims
+from app.models.user import DBUser, UserSnapshot
+from app.realms import DEFAULT_REALM
+from app.replicas import ReplicaSet, RoutingSession
 from app.repositories.client import ClientRepository
 from app.repositories.user import UserRepository
+from app.services.cache import SnapshotCache
 from app.services.client import ClientService
 from app.services.user import UserService
+from app.stores.tokens import OpaqueTokenStore
+from app.tokens import get_signer
 from app.utils import get_user, oauth2_scheme
 
 
 @pytest.fixture
-def mock_jwt(mocker):
-    return mocker.patch("app.dependencies.jwt")
+def issue_token(mocker):
+    """
+    Fixture signing tokens with the key the dependencies verify against.
+    """
+    mocker.patch("app.dependencies.SECRET_KEY", "secret")
+    mocker.patch("app.dependencies.ALGORITHM", "HS256")
+    return get_signer("secret", "HS256").sign
 
 
 @pytest.fixture
@@ -47,7 +71,7 @@ def mock_engine(mocker):
 
 @pytest.fixture
 def mock_session(mocker):
-    return mocker.patch("app.dependencies.Session")
+    return mocker.patch("app.dependencies.RoutingSession")
 
 
 @pytest.fixture
@@ -149,6 +173,39 @@ def test_get_session(mock_session, mock_engine):
     # Assert
     assert session == "session"
     mock_session.assert_called_once()
+    assert mock_session.call_args.kwargs == {"expire_on_commit": False}
+
+
+def test_use_primary(mocker):
+    """
+    Test that use_primary pins a routing session to the primary.
+    """
+    # Arrange
+    replica = create_engine("sqlite://")
+    session = RoutingSession(create_engine("sqlite://"), ReplicaSet([replica]))
+
+    # Act
+    use_primary(session=session)
+
+    # Assert
+    assert session.get_bind(clause=select(DBUser)) is session.primary
+
+
+def test_get_engine_is_cached(mock_engine):
+    """
+    Test that get_engine builds the engine, and its pool, only once.
+    """
+    # Arrange
+    get_engine.cache_clear()
+
+    # Act
+    first = get_engine()
+    second = get_engine()
+
+    # Assert
+    assert first is second
+    mock_engine.assert_called_once()
+    get_engine.cache_clear()
 
 
 # def test_get_engine(mock_engine):
@@ -171,10 +228,10 @@ def test_get_client_repository(mock_engine):
     Test get_client_repository function.
     """
     # Arrange
-    engine = "engine"
+    session = "session"
 
     # Act
-    client_repository = get_client_repository(engine_obj=engine)
+    client_repository = get_client_repository(session=session)
 
     # Assert
     assert isinstance(client_repository, ClientRepository)
@@ -185,10 +242,10 @@ def test_get_user_repository(mock_engine):
     Test get_user_repository function.
     """
     # Arrange
-    engine = "engine"
+    session = "session"
 
     # Act
-    user_repository = get_user_repository(engine_obj=engine)
+    user_repository = get_user_repository(session=session)
 
     # Assert
     assert isinstance(user_repository, UserRepository)
@@ -199,7 +256,7 @@ def test_get_client_service():
     Test get_client_service function.
     """
     # Arrange
-    client_repository = ClientRepository("engine")
+    client_repository = ClientRepository("session")
 
     # Act
     client_service = get_client_service(client_repository=client_repository)
@@ -213,10 +270,424 @@ def test_get_user_service():
     Test get_user_service function.
     """
     # Arrange
-    user_repository = UserRepository("engine")
+    user_repository = UserRepository("session")
 
     # Act
     user_service = get_user_service(user_repository=user_repository)
 
     # Assert
     assert isinstance(user_service, UserService)
+
+
+@pytest.fixture
+def clear_token_cache():
+    """
+    Fixture clearing the verified token cache around a test.
+    """
+    get_token_cache.cache_clear()
+    yield
+    get_token_cache.cache_clear()
+
+
+def test_verify_token_parses_scopes(issue_token, clear_token_cache):
+    """
+    Test that verify_token extracts the username and scopes once per token.
+    """
+    # Arrange
+    token = issue_token(
+        {"sub": "testuser", "scope": "read:users write:users", "exp": 4102444800}
+    )
+
+    # Act
+    first = verify_token(token)
+    second = verify_token(token)
+
+    # Assert
+    assert first is second
+    assert first.sub == "testuser"
+    assert first.scopes == frozenset({"read:users", "write:users"})
+    assert first.exp == 4102444800
+
+
+def test_verify_token_invalid(issue_token, clear_token_cache):
+    """
+    Test that verify_token rejects a token signed with another key.
+    """
+    # Arrange
+    token = get_signer("other", "HS256").sign({"sub": "testuser"})
+
+    # Act & Assert
+    assert verify_token(token) is None
+
+
+def test_verify_token_caches_per_realm(issue_token, clear_token_cache):
+    """
+    Test that every realm has its own verified token cache.
+    """
+    # Arrange
+    token = issue_token({"sub": "testuser", "exp": 4102444800})
+
+    # Act
+    verify_token(token, "acme")
+
+    # Assert
+    assert get_token_cache("acme").cache_info().currsize == 1
+    assert get_token_cache(DEFAULT_REALM).cache_info().currsize == 0
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_missing_scope(issue_token, mocker, clear_token_cache):
+    """
+    Test that get_current_user rejects a token without the required scopes.
+    """
+    # Arrange
+    token = issue_token({"sub": "testuser", "scope": "read:users"})
+    service = mocker.Mock(UserService)
+
+    # Act & Assert
+    with pytest.raises(HTTPException) as exc_info:
+        await get_current_user(
+            SecurityScopes(scopes=["write:users"]),
+            token=token,
+            service=service,
+            realm=DEFAULT_REALM,
+        )
+    assert exc_info.value.status_code == status.HTTP_403_FORBIDDEN
+    service.read_by_username.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_with_scope(issue_token, mocker, clear_token_cache):
+    """
+    Test that get_current_user returns the user when the scopes are granted.
+    """
+    # Arrange
+    token = issue_token({"sub": "testuser", "scope": "read:users"})
+    service = mocker.Mock(UserService)
+    service.read_snapshot.return_value = UserSnapshot(
+        id=1, username="testuser", email="testuser@example.com"
+    )
+
+    # Act
+    user = await get_current_user(
+        SecurityScopes(scopes=["read:users"]),
+        token=token,
+        service=service,
+        realm=DEFAULT_REALM,
+    )
+
+    # Assert
+    assert user.username == "testuser"
+    service.read_snapshot.assert_called_once_with("testuser")
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_expired(issue_token, mocker, clear_token_cache):
+    """
+    Test that a cached token is rejected once it has expired.
+    """
+    # Arrange
+    token = issue_token({"sub": "testuser", "exp": 1})
+    service = mocker.Mock(UserService)
+
+    # Act & Assert
+    with pytest.raises(HTTPException) as exc_info:
+        await get_current_user(
+            SecurityScopes(), token=token, service=service, realm=DEFAULT_REALM
+        )
+    assert exc_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+STATELESS_CLAIMS = {
+    "sub": "testuser",
+    "scope": "read:users",
+    "uid": 1,
+    "email": "testuser@example.com",
+    "disabled": False,
+    "stamp": 3,
+}
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_stateless(issue_token, mocker, clear_token_cache):
+    """
+    Test that a stateless token rebuilds the user from its claims.
+    """
+    # Arrange
+    mocker.patch("app.dependencies.STATELESS_TOKENS", True)
+    token = issue_token(STATELESS_CLAIMS)
+    service = mocker.Mock(UserService)
+    service.read_security_stamp.return_value = 3
+
+    # Act
+    user = await get_current_user(
+        SecurityScopes(), token=token, service=service, realm=DEFAULT_REALM
+    )
+
+    # Assert
+    assert user.id == 1
+    assert user.username == "testuser"
+    assert user.email == "testuser@example.com"
+    assert user.scopes == ("read:users",)
+    service.read_snapshot.assert_not_called()
+    service.read_security_stamp.assert_called_once_with(1)
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_stateless_revoked(
+    issue_token, mocker, clear_token_cache
+):
+    """
+    Test that a stateless token is rejected once the security stamp moved on.
+    """
+    # Arrange
+    mocker.patch("app.dependencies.STATELESS_TOKENS", True)
+    token = issue_token(STATELESS_CLAIMS)
+    service = mocker.Mock(UserService)
+    service.read_security_stamp.return_value = 4
+
+    # Act & Assert
+    with pytest.raises(HTTPException) as exc_info:
+        await get_current_user(
+            SecurityScopes(), token=token, service=service, realm=DEFAULT_REALM
+        )
+    assert exc_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_opaque(mocker):
+    """
+    Test that a token without dots is looked up in the opaque token store.
+    """
+    # Arrange
+    token_store = mocker.Mock(OpaqueTokenStore)
+    token_store.lookup.return_value = Claims(
+        sub="testuser", scopes=frozenset({"read:users"})
+    )
+    service = mocker.Mock(UserService)
+    service.read_snapshot.return_value = UserSnapshot(
+        id=1, username="testuser", email="testuser@example.com"
+    )
+
+    # Act
+    user = await get_current_user(
+        SecurityScopes(scopes=["read:users"]),
+        token="handle",
+        service=service,
+        token_store=token_store,
+        realm=DEFAULT_REALM,
+    )
+
+    # Assert
+    assert user.username == "testuser"
+    token_store.lookup.assert_called_once_with("handle", DEFAULT_REALM)
+
+
+def test_get_current_user_runs_in_the_lane(mocker):
+    """
+    Test that the user is looked up on the threads of the request's lane,
+    not on the event loop.
+    """
+    # Arrange
+    threads = []
+    token_store = mocker.Mock(OpaqueTokenStore)
+    token_store.lookup.return_value = Claims(sub="testuser")
+    service = mocker.Mock(UserService)
+
+    def read_snapshot(sub):
+        threads.append(threading.current_thread().name)
+        return UserSnapshot(id=1, username=sub, email=f"{sub}@example.com")
+
+    service.read_snapshot.side_effect = read_snapshot
+    registry = LaneRegistry()
+    registry.register(Lane("auth", 1), ["/users/me"])
+    app = FastAPI()
+
+    @app.get("/users/me")
+    async def read_users_me(user: UserSnapshot = Depends(get_current_user)):
+        return {"username": user.username}
+
+    app.dependency_overrides[get_user_service] = lambda: service
+    app.dependency_overrides[get_token_store] = lambda: token_store
+    app.add_middleware(LaneMiddleware, registry=registry)
+    client = TestClient(app)
+
+    # Act
+    try:
+        response = client.get("/users/me", headers={"Authorization": "Bearer handle"})
+    finally:
+        registry.shutdown()
+
+    # Assert
+    assert response.json() == {"username": "testuser"}
+    assert threads[0].startswith("lane-auth")
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_opaque_unknown(mocker):
+    """
+    Test that an unknown opaque token is rejected.
+    """
+    # Arrange
+    token_store = mocker.Mock(OpaqueTokenStore)
+    token_store.lookup.return_value = None
+
+    # Act & Assert
+    with pytest.raises(HTTPException) as exc_info:
+        await get_current_user(
+            SecurityScopes(),
+            token="handle",
+            service=mocker.Mock(UserService),
+            token_store=token_store,
+            realm=DEFAULT_REALM,
+        )
+    assert exc_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_rejects_other_realms(mocker):
+    """
+    Test that a token is only accepted in the realm it was issued for.
+    """
+    # Arrange
+    token_store = mocker.Mock(OpaqueTokenStore)
+    token_store.lookup.return_value = Claims(sub="testuser", realm="acme")
+
+    # Act & Assert
+    with pytest.raises(HTTPException) as exc_info:
+        await get_current_user(
+            SecurityScopes(),
+            token="handle",
+            service=mocker.Mock(UserService),
+            token_store=token_store,
+            realm="globex",
+        )
+    assert exc_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_get_realm(mocker):
+    """
+    Test that X-Realm selects a configured realm and defaults when absent.
+    """
+    # Arrange
+    mocker.patch("app.realms.REALMS", ["default", "acme"])
+
+    # Act / Assert
+    assert get_realm(None) == DEFAULT_REALM
+    assert get_realm("acme") == "acme"
+    with pytest.raises(HTTPException) as exc_info:
+        get_realm("initech")
+    assert exc_info.value.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.fixture
+def pooled_database(mocker, tmp_path):
+    """
+    Fixture pointing the engines at a database with sized pools.
+    """
+    mocker.patch("app.dependencies.DATABASE_URL", f"sqlite:///{tmp_path / 'pool.db'}")
+    settings = mocker.patch("app.dependencies.get_settings").return_value
+    settings.engine_options = {"pool_size": 4, "max_overflow": 0, "pool_timeout": 0.2}
+    get_engine.cache_clear()
+    get_lane_engine.cache_clear()
+    yield
+    get_engine().dispose()
+    get_engine.cache_clear()
+    get_lane_engine.cache_clear()
+
+
+def test_lane_pool_pressure_sheds_low_priority(mocker, pooled_database):
+    """
+    Test that logins waiting on the auth lane partition make admission
+    shed low priority requests, while the primary pool sits idle.
+    """
+    # Arrange
+    registry = LaneRegistry()
+    registry.register(Lane("auth", 1, pool_size=1), ["POST /token"])
+    mocker.patch("app.dependencies.lanes", registry)
+    router = APIRouter(route_class=LaneRoute)
+
+    @router.post("/token")
+    def login():
+        with get_request_engine().connect() as connection:
+            connection.execute(text("SELECT 1"))
+        return {}
+
+    @router.get("/users")
+    def read_users():
+        return []
+
+    app = FastAPI()
+    app.include_router(router)
+    app.add_middleware(LaneMiddleware, registry=registry)
+    controller = AdmissionController(["GET /users"], 0.1, pool_pressure)
+    app.add_middleware(AdmissionMiddleware, controller=controller)
+    client = TestClient(app, raise_server_exceptions=False)
+    before = client.get("/users")
+    held = get_lane_engine("auth", 1).connect()
+
+    # Act
+    try:
+        login_response = client.post("/token")
+        shed = client.get("/users")
+    finally:
+        held.close()
+        registry.shutdown()
+
+    # Assert
+    assert before.status_code == 200
+    assert login_response.status_code == 500
+    assert shed.status_code == 503
+    assert controller.shed == 1
+
+
+def test_concurrent_requests_do_not_starve_the_lane(mocker, pooled_database):
+    """
+    Test that more concurrent requests than the lane has threads and
+    connections all succeed: the user lookup must give its connection back
+    before the request waits for a lane thread to run the endpoint.
+    """
+    # Arrange
+    SQLModel.metadata.create_all(get_engine())
+    with Session(get_engine()) as session:
+        session.add(DBUser(username="testuser", email="testuser@example.com"))
+        session.commit()
+    registry = LaneRegistry()
+    registry.register(Lane("admin", 2, pool_size=1), ["/users*"])
+    token_store = mocker.Mock(OpaqueTokenStore)
+    token_store.lookup.return_value = Claims(sub="testuser")
+    router = APIRouter(route_class=LaneRoute)
+
+    @router.get("/users")
+    def read_users(
+        user: UserSnapshot = Depends(get_current_user),
+        service: UserService = Depends(get_user_service),
+    ):
+        return [db_user.username for db_user in service.read_all()]
+
+    def uncached_user_service(repository=Depends(get_user_repository)):
+        return UserService(repository, cache=SnapshotCache(maxsize=0))
+
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_user_service] = uncached_user_service
+    app.dependency_overrides[get_token_store] = lambda: token_store
+    app.add_middleware(LaneMiddleware, registry=registry)
+
+    # Act
+    try:
+        with TestClient(app, raise_server_exceptions=False) as client:
+            with ThreadPoolExecutor(6) as executor:
+                responses = list(
+                    executor.map(
+                        lambda _: client.get(
+                            "/users", headers={"Authorization": "Bearer handle"}
+                        ),
+                        range(6),
+                    )
+                )
+    finally:
+        registry.shutdown()
+
+    # Assert
+    assert [response.status_code for response in responses] == [200] * 6
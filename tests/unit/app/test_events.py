@@ -0,0 +1,148 @@
+"""
+This module contains unit tests for the change event bus.
+"""
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine
+
+from app import events
+from app.events import (
+    ChangeFeedPoller,
+    ClientDeleted,
+    EventBus,
+    PasswordChanged,
+    UserChanged,
+    UserDisabled,
+    event_bus,
+)
+from app.models.event import DBChangeEvent
+from app.models.user import DBUser
+from app.repositories.user import UserRepository
+from app.schemas.user import UserUpdate
+
+
+@pytest.fixture
+def engine():
+    """
+    Fixture providing an in-memory database with the tables created.
+    """
+    db_engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(db_engine)
+    return db_engine
+
+
+@pytest.fixture
+def received():
+    """
+    Fixture collecting the user events published on the global bus.
+    """
+    changes = []
+    handler = event_bus.subscribe(UserChanged, changes.append)
+    yield changes
+    event_bus.unsubscribe(UserChanged, handler)
+
+
+def test_publish_reaches_base_class_subscribers():
+    """
+    Test that subscribers of a base class receive derived events only.
+    """
+    # Arrange
+    bus = EventBus()
+    user_changes, client_changes = [], []
+    bus.subscribe(UserChanged, user_changes.append)
+    bus.subscribe(ClientDeleted, client_changes.append)
+
+    # Act
+    bus.publish(UserDisabled(1))
+
+    # Assert
+    assert user_changes == [UserDisabled(1)]
+    assert not client_changes
+
+
+def test_failing_subscriber_does_not_stop_others():
+    """
+    Test that one failing subscriber does not keep the event from the rest.
+    """
+    # Arrange
+    bus = EventBus()
+    changes = []
+
+    def fail(change):
+        raise RuntimeError(change)
+
+    bus.subscribe(UserChanged, fail)
+    bus.subscribe(UserChanged, changes.append)
+
+    # Act
+    bus.publish(UserChanged(1))
+
+    # Assert
+    assert changes == [UserChanged(1)]
+
+
+def test_events_are_published_after_commit(engine, received):
+    """
+    Test that a repository write is published once it commits.
+    """
+    # Arrange
+    with Session(engine) as session:
+        session.add(DBUser(id=1, username="alice", email="a@example.com"))
+        session.commit()
+    received.clear()
+
+    # Act
+    with Session(engine) as session:
+        UserRepository(session).patch(1, UserUpdate(password="new", disabled=True))
+
+    # Assert
+    assert received == [PasswordChanged(1), UserDisabled(1)]
+
+
+def test_events_are_dropped_on_rollback(engine, received):
+    """
+    Test that nothing is published for a write that rolls back.
+    """
+    # Arrange
+    with Session(engine) as session:
+        session.add(DBUser(id=1, username="alice", email="a@example.com"))
+        session.flush()
+        event_bus.emit(session, UserChanged(1))
+
+        # Act
+        session.rollback()
+        session.commit()
+
+    # Assert
+    assert not received
+
+
+def test_change_feed_publishes_other_origins(engine, mocker):
+    """
+    Test that the poller publishes rows written by other processes only.
+    """
+    # Arrange
+    bus = EventBus()
+    changes = []
+    bus.subscribe(UserChanged, changes.append)
+    poller = ChangeFeedPoller(engine, bus)
+    poller.poll()
+    mocker.patch("app.events.CHANGE_FEED", True)
+    with Session(engine) as session:
+        event_bus.emit(session, UserDisabled(1))
+        session.add(
+            DBChangeEvent(kind="PasswordChanged", uid=2, origin="other", created_at=0)
+        )
+        session.commit()
+
+    # Act
+    published = poller.poll()
+
+    # Assert
+    assert published == 1
+    assert changes == [PasswordChanged(2)]
+    assert poller.last_id == 2
+    assert events.ORIGIN != "other"
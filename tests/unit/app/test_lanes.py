@@ -0,0 +1,142 @@
+"""
+This module contains unit tests for the priority lanes in app.lanes.
+"""
+
+import asyncio
+import threading
+
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app.exceptions import LaneFullError
+from app.lanes import (
+    Lane,
+    LaneMiddleware,
+    LaneRegistry,
+    LaneRoute,
+    current_lane,
+)
+
+
+def test_run_uses_the_lane_threads():
+    """
+    Test that a call runs on a thread of the lane and sees the request lane.
+    """
+    # Arrange
+    lane = Lane("auth", workers=1)
+    current_lane.set(lane)
+
+    def work():
+        return threading.current_thread().name, current_lane.get()
+
+    # Act
+    name, seen = asyncio.run(lane.run(work))
+
+    # Assert
+    assert name.startswith("lane-auth")
+    assert seen is lane
+    assert lane.metrics()["completed"] == 1
+    lane.shutdown()
+
+
+def test_run_rejects_when_full():
+    """
+    Test that calls past max_pending fail instead of queueing.
+    """
+    # Arrange
+    lane = Lane("admin", workers=1, max_pending=1)
+    release = threading.Event()
+
+    async def scenario():
+        first = asyncio.ensure_future(lane.run(release.wait))
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(LaneFullError):
+                await lane.run(lambda: None)
+        finally:
+            release.set()
+        await first
+
+    # Act
+    asyncio.run(scenario())
+
+    # Assert
+    assert lane.metrics()["rejected"] == 1
+    assert lane.metrics()["pending"] == 0
+    lane.shutdown()
+
+
+def test_lane_for_first_registered_wins():
+    """
+    Test that a request goes to the first lane whose routes match.
+    """
+    # Arrange
+    registry = LaneRegistry()
+    auth = registry.register(Lane("auth", 1), ["POST /token", "GET /users/me"])
+    admin = registry.register(Lane("admin", 1), ["/users*"])
+
+    # Act & Assert
+    assert registry.lane_for("GET", "/users/me") is auth
+    assert registry.lane_for("GET", "/users") is admin
+    assert registry.lane_for("POST", "/token") is auth
+    assert registry.lane_for("GET", "/health/pool") is None
+
+
+def test_lane_route_runs_endpoints_in_their_lane():
+    """
+    Test that endpoints of a LaneRoute router run on the threads of their lane.
+    """
+    # Arrange
+    registry = LaneRegistry()
+    registry.register(Lane("admin", 1), ["/admin*"])
+    router = APIRouter(route_class=LaneRoute)
+
+    @router.get("/admin/{item}")
+    def read_admin(item: int):
+        return {"item": item, "thread": threading.current_thread().name}
+
+    @router.get("/open")
+    def read_open():
+        return {"thread": threading.current_thread().name}
+
+    app = FastAPI()
+    app.include_router(router)
+    app.add_middleware(LaneMiddleware, registry=registry)
+    client = TestClient(app)
+
+    # Act
+    admin = client.get("/admin/3").json()
+    other = client.get("/open").json()
+
+    # Assert
+    assert admin["item"] == 3
+    assert admin["thread"].startswith("lane-admin")
+    assert not other["thread"].startswith("lane-")
+    registry.shutdown()
+
+
+def test_lane_route_answers_503_when_full(mocker):
+    """
+    Test that a full lane answers 503 with Retry-After.
+    """
+    # Arrange
+    registry = LaneRegistry()
+    lane = registry.register(Lane("admin", 1), ["/admin"])
+    mocker.patch.object(lane, "run", side_effect=LaneFullError("admin"))
+    router = APIRouter(route_class=LaneRoute)
+
+    @router.get("/admin")
+    def read_admin():
+        return {}
+
+    app = FastAPI()
+    app.include_router(router)
+    app.add_middleware(LaneMiddleware, registry=registry)
+
+    # Act
+    response = TestClient(app).get("/admin")
+
+    # Assert
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
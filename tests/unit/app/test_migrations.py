@@ -0,0 +1,148 @@
+"""
+This module contains unit tests for the schema upgrade in app.migrations.
+"""
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlmodel import Session, select
+
+from app.migrations import upgrade_schema
+from app.models.client import DBClient
+from app.models.user import DBUser
+from app.realms import DEFAULT_REALM
+
+# The users and clients tables as the first release created them
+BASELINE = [
+    """
+    CREATE TABLE users (
+        id INTEGER NOT NULL PRIMARY KEY,
+        username VARCHAR NOT NULL,
+        email VARCHAR NOT NULL,
+        disabled BOOLEAN,
+        hashed_password VARCHAR
+    )
+    """,
+    """
+    CREATE TABLE clients (
+        id INTEGER NOT NULL PRIMARY KEY,
+        client_id VARCHAR NOT NULL,
+        client_secret VARCHAR NOT NULL,
+        redirect_uris TEXT,
+        grant_types TEXT,
+        response_types TEXT,
+        client_name VARCHAR,
+        client_uri VARCHAR,
+        logo_uri VARCHAR,
+        scope TEXT,
+        contacts TEXT,
+        tos_uri VARCHAR,
+        policy_uri VARCHAR
+    )
+    """,
+    "INSERT INTO users (username, email, disabled) VALUES ('old', 'old@example.com', 0)",
+    """
+    INSERT INTO clients (client_id, client_secret, redirect_uris, scope, contacts)
+    VALUES ('app', 'secret', 'https://a.example/cb https://b.example/cb',
+            'read:users openid', '["ops@example.com"]')
+    """,
+]
+
+
+@pytest.fixture
+def baseline_engine(tmp_path):
+    """
+    Fixture providing a database created with the baseline schema.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    with engine.begin() as connection:
+        for statement in BASELINE:
+            connection.execute(text(statement))
+    yield engine
+    engine.dispose()
+
+
+def test_upgrade_adds_missing_columns(baseline_engine):
+    """
+    Test that the columns added since the baseline are added with their
+    defaults, so existing rows load.
+    """
+    # Act
+    changes = upgrade_schema(baseline_engine)
+
+    # Assert
+    assert "users.version: added" in changes
+    assert "users.security_stamp: added" in changes
+    assert "clients.tenant_id: added" in changes
+    with Session(baseline_engine) as session:
+        user = session.exec(select(DBUser)).one()
+    assert user.version == 1
+    assert user.security_stamp == 1
+    assert user.tenant_id == DEFAULT_REALM
+    assert user.scopes is None
+
+
+def test_upgrade_converts_client_lists_to_json(baseline_engine):
+    """
+    Test that client lists stored as text become JSON arrays, and JSON
+    arrays are kept.
+    """
+    # Act
+    upgrade_schema(baseline_engine)
+
+    # Assert
+    with Session(baseline_engine) as session:
+        client = session.exec(select(DBClient)).one()
+    assert client.redirect_uris == ["https://a.example/cb", "https://b.example/cb"]
+    assert client.scope == ["read:users", "openid"]
+    assert client.contacts == ["ops@example.com"]
+    assert client.grant_types is None
+    assert client.version == 1
+
+
+def test_upgrade_creates_tables_and_indexes(baseline_engine):
+    """
+    Test that the tables added since the baseline are created and the realm
+    indexes are built on the existing tables.
+    """
+    # Act
+    changes = upgrade_schema(baseline_engine)
+
+    # Assert
+    inspector = inspect(baseline_engine)
+    assert "authorization_codes: created" in changes
+    assert "access_tokens" in inspector.get_table_names()
+    assert "ix_users_tenant_username" in {
+        index["name"] for index in inspector.get_indexes("users")
+    }
+
+
+def test_upgrade_converts_each_column_once(baseline_engine):
+    """
+    Test that a conversion is recorded, so later startups do not scan the
+    clients table again.
+    """
+    # Arrange
+    upgrade_schema(baseline_engine)
+    with baseline_engine.begin() as connection:
+        connection.execute(text("UPDATE clients SET grant_types = 'not scanned'"))
+
+    # Act
+    upgrade_schema(baseline_engine)
+
+    # Assert
+    with baseline_engine.connect() as connection:
+        names = connection.execute(text("SELECT name FROM schema_migrations")).all()
+        grant_types = connection.execute(text("SELECT grant_types FROM clients"))
+        assert grant_types.scalar() == "not scanned"
+    assert ("clients.scope:json",) in names
+
+
+def test_upgrade_leaves_a_current_database_alone(baseline_engine):
+    """
+    Test that a second upgrade finds nothing to do.
+    """
+    # Arrange
+    upgrade_schema(baseline_engine)
+
+    # Act & Assert
+    assert not upgrade_schema(baseline_engine)
@@ -0,0 +1,73 @@
+"""
+This module contains unit tests for the OpenID Connect metadata in app.oidc.
+"""
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from app.models.user import UserSnapshot
+from app.oidc import discovery_metadata, id_token_claims, public_keys
+
+
+def test_discovery_metadata():
+    """
+    Test that every endpoint hangs off the issuer.
+    """
+    # Act
+    metadata = discovery_metadata("https://auth.example.com", "RS256")
+
+    # Assert
+    assert metadata["issuer"] == "https://auth.example.com"
+    assert metadata["jwks_uri"] == "https://auth.example.com/.well-known/jwks.json"
+    assert metadata["id_token_signing_alg_values_supported"] == ["RS256"]
+    assert "openid" in metadata["scopes_supported"]
+
+
+def test_public_keys_never_publish_hmac_keys():
+    """
+    Test that symmetric keys are kept out of the JWKS.
+    """
+    # Act & Assert
+    assert not public_keys("HS256", ["default", "acme"])
+
+
+def test_public_keys_publish_the_public_rsa_key(mocker):
+    """
+    Test that an RSA key is published without its private part, once per key.
+    """
+    # Arrange
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    mocker.patch("app.oidc.realm_key", return_value=pem)
+
+    # Act
+    keys = public_keys("RS256", ["default"])
+
+    # Assert
+    assert len(keys) == 1
+    assert keys[0]["kty"] == "RSA"
+    assert keys[0]["use"] == "sig"
+    assert "d" not in keys[0]
+
+
+def test_id_token_claims():
+    """
+    Test that an ID token names the client as audience and echoes the nonce.
+    """
+    # Arrange
+    user = UserSnapshot(id=1, username="testuser", email="test@example.com")
+
+    # Act
+    claims = id_token_claims("testuser", "client", "acme", "n-0S6", user)
+
+    # Assert
+    assert claims["sub"] == "testuser"
+    assert claims["aud"] == "client"
+    assert claims["nonce"] == "n-0S6"
+    assert claims["realm"] == "acme"
+    assert claims["email"] == "test@example.com"
+    assert claims["token_use"] == "id"
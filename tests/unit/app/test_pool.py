@@ -0,0 +1,97 @@
+"""
+This module contains unit tests for the pool monitoring in app.pool.
+"""
+
+import pytest
+from sqlalchemy import create_engine, exc
+
+from app.pool import MonitoredQueuePool, PoolMonitor, queue_pool_metrics
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """
+    Fixture providing an engine with a single monitored connection.
+
+    :return:
+    """
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=MonitoredQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    yield engine
+    engine.dispose()
+
+
+def test_monitor_records_waits(mocker):
+    """
+    Test that a finished checkout counts and sets the pressure.
+    """
+    # Arrange
+    clock = mocker.patch("app.pool.time.monotonic", return_value=100.0)
+    monitor = PoolMonitor(window=5)
+
+    # Act
+    waiter = monitor.started()
+    clock.return_value = 100.5
+    wait = monitor.finished(waiter)
+
+    # Assert
+    assert wait == 0.5
+    assert monitor.pressure() == 0.5
+    assert monitor.metrics()["wait_ms_max"] == 500.0
+    clock.return_value = 106.0
+    assert monitor.pressure() == 0.0
+
+
+def test_monitor_pressure_counts_current_waiters(mocker):
+    """
+    Test that a checkout still waiting raises the pressure as time passes.
+    """
+    # Arrange
+    clock = mocker.patch("app.pool.time.monotonic", return_value=10.0)
+    monitor = PoolMonitor()
+    monitor.started()
+
+    # Act
+    clock.return_value = 12.0
+
+    # Assert
+    assert monitor.waiting == 1
+    assert monitor.pressure() == 2.0
+
+
+def test_pool_counts_checkouts_and_timeouts(engine):
+    """
+    Test that the pool reports connections in use and checkouts that timed out.
+    """
+    # Arrange
+    held = engine.connect()
+
+    # Act
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    metrics = queue_pool_metrics(engine.pool)
+    held.close()
+
+    # Assert
+    assert metrics["pool"] == "MonitoredQueuePool"
+    assert metrics["in_use"] == 1
+    assert metrics["checkouts"] == 2
+    assert metrics["timeouts"] == 1
+    assert metrics["waiting"] == 0
+    assert metrics["wait_ms_max"] >= 50
+
+
+def test_recreated_pool_keeps_the_monitor(engine):
+    """
+    Test that the monitor survives the pool being recreated.
+    """
+    # Act
+    pool = engine.pool.recreate()
+
+    # Assert
+    assert pool.monitor is engine.pool.monitor
@@ -0,0 +1,76 @@
+"""
+This module contains unit tests for the sampling profiler in app.profiler.
+"""
+
+import sys
+import threading
+from collections import Counter
+
+import pytest
+
+from app.exceptions import ProfilerBusyError
+from app.profiler import StackSampler, collapse_stack, format_collapsed
+
+
+def test_collapse_stack_is_root_first():
+    """
+    Test that a collapsed stack starts at the root and ends at the frame.
+    """
+    # Arrange
+    frame = sys._getframe()  # pylint: disable=protected-access
+
+    # Act
+    stack = collapse_stack(frame, "MainThread")
+
+    # Assert
+    labels = stack.split(";")
+    assert labels[0] == "MainThread"
+    assert labels[-1] == f"{__name__}:test_collapse_stack_is_root_first"
+
+
+def test_sample_sees_other_threads():
+    """
+    Test that sample records the stacks of other threads but not its own.
+    """
+    # Arrange
+    stop = threading.Event()
+    worker = threading.Thread(target=stop.wait, name="busy-worker")
+    worker.start()
+
+    # Act
+    try:
+        stacks = StackSampler().sample(0.05, 0.005)
+    finally:
+        stop.set()
+        worker.join()
+
+    # Assert
+    assert any(stack.startswith("busy-worker;") for stack in stacks)
+    assert not any("StackSampler._sample" in stack for stack in stacks)
+
+
+def test_sample_rejects_concurrent_profiles():
+    """
+    Test that a second profile fails while one is running.
+    """
+    # Arrange
+    sampler = StackSampler()
+    sampler._lock.acquire()  # pylint: disable=protected-access,consider-using-with
+
+    # Act / Assert
+    with pytest.raises(ProfilerBusyError):
+        sampler.sample(0.01, 0.005)
+
+
+def test_format_collapsed_orders_by_count():
+    """
+    Test that format_collapsed writes one line per stack, most seen first.
+    """
+    # Arrange
+    stacks = Counter({"main;a": 1, "main;b": 3})
+
+    # Act
+    result = format_collapsed(stacks)
+
+    # Assert
+    assert result == "main;b 3\nmain;a 1\n"
@@ -0,0 +1,60 @@
+"""
+This module contains unit tests for the realm helpers in app.realms.
+"""
+
+import pytest
+
+from app.realms import DEFAULT_REALM, is_realm, realm_key, realm_kid
+
+
+@pytest.fixture
+def realm_settings(mocker):
+    """
+    Fixture configuring two realms signing with HS256.
+    """
+    mocker.patch("app.realms.SECRET_KEY", "master")
+    mocker.patch("app.realms.ALGORITHM", "HS256")
+    mocker.patch("app.realms.REALMS", ["default", "acme", "globex"])
+    mocker.patch("app.realms.REALM_SECRET_KEYS", {"globex": "globex-key"})
+    realm_key.cache_clear()
+    yield
+    realm_key.cache_clear()
+
+
+def test_default_realm_uses_the_secret_key(realm_settings):
+    """
+    Test that the default realm keeps SECRET_KEY and an empty kid.
+    """
+    # Act / Assert
+    assert realm_key(DEFAULT_REALM) == "master"
+    assert realm_kid(DEFAULT_REALM) == ""
+
+
+def test_realm_keys_are_derived_per_realm(realm_settings):
+    """
+    Test that a realm without a configured key gets its own derived key.
+    """
+    # Act
+    key = realm_key("acme")
+
+    # Assert
+    assert key not in ("master", realm_key(DEFAULT_REALM))
+    assert realm_kid("acme") == "acme"
+
+
+def test_configured_realm_key_wins(realm_settings):
+    """
+    Test that a key from REALM_SECRET_KEYS is used as is.
+    """
+    # Act / Assert
+    assert realm_key("globex") == "globex-key"
+
+
+def test_is_realm(realm_settings):
+    """
+    Test that only configured realms are served.
+    """
+    # Act / Assert
+    assert is_realm("acme")
+    assert is_realm(DEFAULT_REALM)
+    assert not is_realm("initech")
@@ -0,0 +1,181 @@
+"""
+This module contains unit tests for the replica routing in app.replicas.
+"""
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, create_engine, select
+
+from app.models.user import DBUser
+from app.replicas import ReplicaSet, RoutingSession
+
+
+def make_engine(*usernames):
+    """
+    Create an in-memory database holding the given users
+
+    :param usernames:
+    :return:
+    """
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(engine)
+    with RoutingSession(engine, ReplicaSet([])) as session:
+        for username in usernames:
+            session.add(DBUser(username=username, email=f"{username}@example.com"))
+        session.commit()
+    return engine
+
+
+@pytest.fixture
+def primary():
+    """
+    Fixture providing the primary database.
+    """
+    return make_engine("primary")
+
+
+@pytest.fixture
+def replica():
+    """
+    Fixture providing a replica database with different contents.
+    """
+    return make_engine("replica")
+
+
+def usernames(session):
+    """
+    Read every username visible to the session
+
+    :param session:
+    :return:
+    """
+    return [user.username for user in session.exec(select(DBUser)).all()]
+
+
+def test_reads_go_to_replica(primary, replica):
+    """
+    Test that plain reads are served by the replica.
+    """
+    with RoutingSession(primary, ReplicaSet([replica])) as session:
+        assert usernames(session) == ["replica"]
+
+
+def test_reads_after_write_go_to_primary(primary, replica):
+    """
+    Test that a session reads its own writes once it has written.
+    """
+    with RoutingSession(primary, ReplicaSet([replica])) as session:
+        # Act
+        session.add(DBUser(username="new", email="new@example.com"))
+        session.flush()
+
+        # Assert
+        assert usernames(session) == ["primary", "new"]
+
+
+def test_no_replicas_uses_primary(primary):
+    """
+    Test that a session without replicas always reads from the primary.
+    """
+    with RoutingSession(primary, ReplicaSet([])) as session:
+        assert usernames(session) == ["primary"]
+
+
+def test_pick_round_robin(primary, replica):
+    """
+    Test that replicas are picked in turn.
+    """
+    # Arrange
+    replicas = ReplicaSet([primary, replica])
+
+    # Act
+    picks = {replicas.pick() for _ in range(4)}
+
+    # Assert
+    assert picks == {primary, replica}
+
+
+def test_pick_skips_down_replica(primary, replica):
+    """
+    Test that a replica marked down is skipped until it may be retried.
+    """
+    # Arrange
+    replicas = ReplicaSet([primary, replica], retry_after=60)
+
+    # Act
+    replicas.mark_down(primary)
+
+    # Assert
+    assert {replicas.pick() for _ in range(4)} == {replica}
+
+
+def test_all_replicas_down_falls_back_to_primary(primary, replica):
+    """
+    Test that reads fall back to the primary when every replica is down.
+    """
+    # Arrange
+    replicas = ReplicaSet([replica], retry_after=60)
+    replicas.mark_down(replica)
+
+    # Act & Assert
+    with RoutingSession(primary, replicas) as session:
+        assert usernames(session) == ["primary"]
+
+
+def test_connection_failure_marks_replica_down():
+    """
+    Test that a replica failing to connect is taken out of rotation.
+    """
+    # Arrange
+    broken = create_engine("sqlite:////nonexistent/directory/replica.db")
+    replicas = ReplicaSet([broken], retry_after=60)
+
+    # Act
+    with pytest.raises(OperationalError):
+        with broken.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+    # Assert
+    assert replicas.pick() is None
+
+
+def test_session_reads_from_one_replica(primary, replica):
+    """
+    Test that a session keeps reading from the replica it picked first.
+    """
+    # Arrange
+    other = make_engine("other")
+    statement = select(DBUser)
+
+    # Act
+    with RoutingSession(primary, ReplicaSet([replica, other])) as session:
+        binds = {session.get_bind(clause=statement) for _ in range(4)}
+
+    # Assert
+    assert len(binds) == 1
+
+
+def test_failing_replica_falls_back_to_primary(primary):
+    """
+    Test that a read the replica fails is retried on the primary, and the
+    replica is taken out of rotation.
+    """
+    # Arrange
+    broken = create_engine("sqlite:////nonexistent/directory/replica.db")
+    replicas = ReplicaSet([broken], retry_after=60)
+
+    # Act
+    with RoutingSession(primary, replicas) as session:
+        names = usernames(session)
+        user = session.get(DBUser, 1)
+
+    # Assert
+    assert names == ["primary"]
+    assert user.username == "primary"
+    assert replicas.pick() is None
@@ -0,0 +1,140 @@
+"""
+This module contains unit tests for the response helpers in app.responses.
+"""
+
+import orjson
+import pytest
+
+from app.models.client import DBClient
+from app.models.user import DBUser
+from app.responses import (
+    Document,
+    ORJSONResponse,
+    project,
+    project_all,
+    serve_document,
+)
+from app.schemas.client import ClientDisplay
+from app.schemas.user import UserDisplay
+
+
+def test_project_drops_private_fields():
+    """
+    Test that project only copies the fields of the display schema.
+    """
+    # Arrange
+    user = DBUser(
+        id=1, username="testuser", email="t@example.com", hashed_password="hash"
+    )
+
+    # Act
+    result = project(user, UserDisplay)
+
+    # Assert
+    assert result["username"] == "testuser"
+    assert "hashed_password" not in result
+
+
+def test_project_all_drops_client_secret():
+    """
+    Test that project_all never exposes client secrets.
+    """
+    # Arrange
+    clients = [
+        DBClient(id=1, client_id="a", client_secret="s1", scope=["openid"]),
+        DBClient(id=2, client_id="b", client_secret="s2"),
+    ]
+
+    # Act
+    result = project_all(clients, ClientDisplay)
+
+    # Assert
+    assert [client["client_id"] for client in result] == ["a", "b"]
+    assert all("client_secret" not in client for client in result)
+    assert result[0]["scope"] == ["openid"]
+
+
+def test_orjson_response_render():
+    """
+    Test that ORJSONResponse renders compact JSON bytes.
+    """
+    # Act
+    response = ORJSONResponse({"a": [1, 2]})
+
+    # Assert
+    assert response.body == b'{"a":[1,2]}'
+    assert response.media_type == "application/json"
+
+
+def test_document_etag_follows_the_body():
+    """
+    Test that the ETag changes with the body and only with it.
+    """
+    # Act
+    first = Document.from_content({"issuer": "a"})
+    same = Document.from_content({"issuer": "a"})
+    other = Document.from_content({"issuer": "b"})
+
+    # Assert
+    assert orjson.loads(first.body) == {"issuer": "a"}
+    assert first.etag == same.etag
+    assert first.etag != other.etag
+
+
+@pytest.mark.parametrize(
+    "if_none_match, expected",
+    [
+        (None, False),
+        ('"other"', False),
+        ("{etag}", True),
+        ('"other", W/{etag}', True),
+        ("*", True),
+    ],
+)
+def test_document_matches(if_none_match, expected):
+    """
+    Test that If-None-Match matches the ETag, in lists, weak or as "*".
+    """
+    # Arrange
+    document = Document.from_content({"issuer": "a"})
+    if if_none_match:
+        if_none_match = if_none_match.format(etag=document.etag)
+
+    # Act & Assert
+    assert document.matches(if_none_match) is expected
+
+
+def test_document_from_file_keeps_the_bytes(tmp_path):
+    """
+    Test that a prebuilt file is served byte for byte.
+    """
+    # Arrange
+    path = tmp_path / "openapi.json"
+    path.write_bytes(b'{"openapi": "3.1.0"}')
+
+    # Act
+    document = Document.from_file(str(path))
+
+    # Assert
+    assert document.body == b'{"openapi": "3.1.0"}'
+    assert document == Document.from_bytes(document.body)
+
+
+def test_serve_document_not_modified():
+    """
+    Test that a client holding the document gets a 304 without a body.
+    """
+    # Arrange
+    document = Document.from_content({"issuer": "a"})
+
+    # Act
+    fresh = serve_document(document, None, 60)
+    cached = serve_document(document, document.etag, 60)
+
+    # Assert
+    assert fresh.status_code == 200
+    assert fresh.body == document.body
+    assert fresh.headers["cache-control"] == "public, max-age=60"
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == document.etag
+    assert not cached.body
@@ -0,0 +1,175 @@
+"""
+This module contains unit tests for the background scheduler in app.scheduler.
+"""
+
+import asyncio
+import time
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app.models.code import DBAuthorizationCode
+from app.models.event import DBChangeEvent
+from app.scheduler import ExpiredRowPurger, Scheduler
+
+
+@pytest.fixture
+def sqlite_engine():
+    """
+    Fixture providing an in-memory SQLite engine with the tables created.
+
+    :return:
+    """
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def add_codes(engine, count, expires_at):
+    """
+    Insert authorization codes expiring at the given time
+
+    :param engine:
+    :param count:
+    :param expires_at:
+    """
+    with Session(engine) as session:
+        for _ in range(count):
+            session.add(
+                DBAuthorizationCode(
+                    code_hash=f"{expires_at}-{time.perf_counter_ns()}",
+                    client_id="client",
+                    redirect_uri="https://example.com/cb",
+                    username="testuser",
+                    code_challenge="challenge",
+                    code_challenge_method="S256",
+                    expires_at=expires_at,
+                )
+            )
+        session.commit()
+
+
+def test_purger_deletes_expired_rows_in_batches(sqlite_engine, mocker):
+    """
+    Test that the purger deletes only expired rows, one batch at a time.
+    """
+    # Arrange
+    add_codes(sqlite_engine, 5, time.time() - 10)
+    add_codes(sqlite_engine, 2, time.time() + 60)
+    purger = ExpiredRowPurger(
+        sqlite_engine, DBAuthorizationCode, "code_hash", "expires_at", batch_size=2
+    )
+    purge_batch = mocker.spy(purger, "_purge_batch")
+
+    # Act
+    purged = purger()
+
+    # Assert
+    assert purged == 5
+    assert purge_batch.call_count == 3
+    assert purger.lag == 0.0
+    with Session(sqlite_engine) as session:
+        assert len(session.exec(select(DBAuthorizationCode)).all()) == 2
+
+
+def test_purger_reports_lag_when_a_run_is_capped(sqlite_engine):
+    """
+    Test that rows left behind by max_batches show up as lag.
+    """
+    # Arrange
+    add_codes(sqlite_engine, 5, time.time() - 10)
+    purger = ExpiredRowPurger(
+        sqlite_engine,
+        DBAuthorizationCode,
+        "code_hash",
+        "expires_at",
+        batch_size=2,
+        pause=0,
+        max_batches=1,
+    )
+
+    # Act
+    purged = purger()
+
+    # Assert
+    assert purged == 2
+    assert purger.lag >= 10
+
+
+def test_purger_applies_the_cutoff(sqlite_engine):
+    """
+    Test that a cutoff in the past keeps rows younger than the retention.
+    """
+    # Arrange
+    with Session(sqlite_engine) as session:
+        session.add(
+            DBChangeEvent(kind="UserChanged", uid=1, origin="a", created_at=100)
+        )
+        session.add(
+            DBChangeEvent(kind="UserChanged", uid=2, origin="a", created_at=time.time())
+        )
+        session.commit()
+    purger = ExpiredRowPurger(
+        sqlite_engine,
+        DBChangeEvent,
+        "id",
+        "created_at",
+        cutoff=lambda: time.time() - 3600,
+    )
+
+    # Act
+    purged = purger()
+
+    # Assert
+    assert purged == 1
+
+
+def test_job_records_metrics():
+    """
+    Test that a job counts its runs, results and failures.
+    """
+    # Arrange
+    scheduler = Scheduler()
+    results = iter([3, ValueError("boom")])
+
+    def target():
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    job = scheduler.every(60, "job", target)
+
+    # Act
+    job.run_once()
+    job.run_once()
+
+    # Assert
+    metrics = scheduler.metrics()["job"]
+    assert metrics["runs"] == 2
+    assert metrics["failures"] == 1
+    assert metrics["total"] == 3
+    assert metrics["last_result"] == 3
+
+
+@pytest.mark.asyncio
+async def test_scheduler_runs_jobs_until_stopped():
+    """
+    Test that started jobs run in the background and stop with the scheduler.
+    """
+    # Arrange
+    scheduler = Scheduler()
+    scheduler.every(0.01, "job", lambda: 1)
+
+    # Act
+    scheduler.start()
+    await asyncio.sleep(0.05)
+    await scheduler.stop()
+
+    # Assert
+    assert scheduler.metrics()["job"]["runs"] >= 2
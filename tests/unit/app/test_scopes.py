@@ -0,0 +1,80 @@
+"""
+This module contains unit tests for the scope helpers in app.scopes.
+"""
+
+import pytest
+
+from app.scopes import (
+    ADMIN,
+    READ_USERS,
+    WRITE_USERS,
+    format_scopes,
+    grant_scopes,
+    parse_scopes,
+)
+
+
+def test_parse_scopes():
+    """
+    Test that a scope string is parsed into a frozenset once and reused.
+    """
+    # Act
+    first = parse_scopes("read:users write:users")
+    second = parse_scopes("read:users write:users")
+
+    # Assert
+    assert first == frozenset({READ_USERS, WRITE_USERS})
+    assert first is second
+
+
+def test_parse_scopes_empty():
+    """
+    Test that an empty scope string yields no scopes.
+    """
+    assert parse_scopes("") == frozenset()
+
+
+def test_format_scopes():
+    """
+    Test that scopes are formatted in a canonical order without duplicates.
+    """
+    assert format_scopes(["write:users", "read:users", "read:users"]) == (
+        "read:users write:users"
+    )
+
+
+@pytest.mark.parametrize(
+    "requested, held, expected",
+    [
+        ([], [READ_USERS], {}),
+        ([READ_USERS, WRITE_USERS], [READ_USERS], {READ_USERS}),
+        (["openid", WRITE_USERS], [], {"openid"}),
+    ],
+    ids=["nothing requested", "privileged not held", "consent scope"],
+)
+def test_grant_scopes(requested, held, expected):
+    """
+    Test the scopes granted to a token for a user.
+    """
+    assert grant_scopes(requested, held) == frozenset(expected)
+
+
+@pytest.mark.parametrize(
+    "requested, expected",
+    [
+        ([], {READ_USERS, "openid"}),
+        ([READ_USERS, WRITE_USERS, "profile"], {READ_USERS}),
+    ],
+    ids=["nothing requested", "not registered"],
+)
+def test_grant_scopes_for_client(requested, expected):
+    """
+    Test that a client never gets scopes it did not register, even when
+    it asks for nothing and the user holds more.
+    """
+    # Arrange
+    held = [READ_USERS, WRITE_USERS, ADMIN]
+    registered = [READ_USERS, "openid"]
+
+    # Act & Assert
+    assert grant_scopes(requested, held, registered) == frozenset(expected)
@@ -1,7 +1,7 @@
 import pytest
 from utils import verify_password
 
-from app.security import get_password_hash
+from app.security import get_password_hash, verify_code_challenge
 
 
 @pytest.fixture
@@ -21,3 +21,25 @@ def test_get_password_hash(mock_pwd_context):
 
     # Assert
     mock_pwd_context.hash.assert_called_once_with("plain_password")
+
+
+@pytest.mark.parametrize(
+    "verifier, challenge, method, expected",
+    [
+        (
+            "dBjftJeZ4CVP-mB92K27uhbUJU1p1r_wW1gFWFOEjXk",
+            "E9Melhoa2OwvFrEMTJguCHaoeK1t8URWbuGJSstw-cM",
+            "S256",
+            True,
+        ),
+        ("dBjftJeZ4CVP-mB92K27uhbUJU1p1r_wW1gFWFOEjXk", "wrong", "S256", False),
+        ("verifier", "verifier", "plain", False),
+        ("verifier", "verifier", "unknown", False),
+    ],
+    ids=["S256 match", "S256 mismatch", "plain refused", "unknown method"],
+)
+def test_verify_code_challenge(verifier, challenge, method, expected):
+    """
+    Test the verify_code_challenge function against the RFC 7636 example.
+    """
+    assert verify_code_challenge(verifier, challenge, method) is expected
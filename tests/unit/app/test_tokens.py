@@ -0,0 +1,254 @@
+"""
+This module contains unit tests for the JWT signer in app.tokens.
+"""
+
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from jose import jwk, jwt
+
+from app.models.token import Claims
+from app.tokens import JWTVerifier, b64url, get_signer
+
+
+@pytest.mark.parametrize("algorithm", ["HS256", "HS384", "HS512"])
+def test_sign_matches_jose(algorithm):
+    """
+    Test that signed tokens verify with jose for every HMAC algorithm.
+    """
+    # Arrange
+    signer = get_signer("secret", algorithm)
+
+    # Act
+    token = signer.sign({"sub": "user", "exp": 4102444800})
+
+    # Assert
+    assert jwt.decode(token, "secret", algorithms=[algorithm]) == {
+        "sub": "user",
+        "exp": 4102444800,
+    }
+
+
+def test_sign_reuses_hmac_context():
+    """
+    Test that signing twice does not disturb the cached HMAC context.
+    """
+    # Arrange
+    signer = get_signer("secret", "HS256")
+
+    # Act
+    first = signer.sign({"sub": "user"})
+    second = signer.sign({"sub": "user"})
+
+    # Assert
+    assert first == second
+
+
+def test_get_signer_is_cached():
+    """
+    Test that a signer is built once per key and algorithm.
+    """
+    # Act & Assert
+    assert get_signer("secret", "HS256") is get_signer("secret", "HS256")
+    assert get_signer("secret", "HS256") is not get_signer("other", "HS256")
+
+
+def test_sign_with_kid():
+    """
+    Test that the key id ends up in the token header.
+    """
+    # Act
+    token = get_signer("secret", "HS256", kid="key-1").sign({"sub": "user"})
+
+    # Assert
+    assert jwt.get_unverified_header(token)["kid"] == "key-1"
+
+
+@pytest.fixture
+def verifier():
+    """
+    Fixture building a verifier that expects an issuer and an audience.
+    """
+    return JWTVerifier(
+        {"": get_signer("secret", "HS256")}, issuer="issuer", audience="api"
+    )
+
+
+def test_verify_valid_token(verifier):
+    """
+    Test that a valid token yields its claims.
+    """
+    # Arrange
+    token = get_signer("secret", "HS256").sign(
+        {"sub": "user", "iss": "issuer", "aud": ["api"], "scope": "read:users"}
+    )
+
+    # Act
+    claims = verifier.verify(token, now=time.time())
+
+    # Assert
+    assert claims == Claims(sub="user", scopes=frozenset({"read:users"}))
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {"sub": "user", "iss": "other", "aud": "api"},
+        {"sub": "user", "iss": "issuer", "aud": "other"},
+        {"sub": "user", "iss": "issuer", "aud": "api", "exp": 1},
+        {"sub": "user", "iss": "issuer", "aud": "api", "nbf": 4102444800},
+        {"sub": "user", "iss": "issuer", "aud": "api", "exp": "never"},
+        {"iss": "issuer", "aud": "api"},
+    ],
+)
+def test_verify_rejects_claims(verifier, payload):
+    """
+    Test that issuer, audience, time window and subject are enforced.
+    """
+    # Arrange
+    token = get_signer("secret", "HS256").sign(payload)
+
+    # Act & Assert
+    assert verifier.verify(token, now=time.time()) is None
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        "",
+        "not-a-token",
+        "a.b.c",
+        jwt.encode({"sub": "user"}, "secret", algorithm="HS512"),
+        jwt.encode({"sub": "user"}, "other", algorithm="HS256"),
+        jwt.encode({"sub": "user"}, "secret", algorithm="HS256", headers={"kid": "x"}),
+    ],
+)
+def test_verify_rejects_tokens(token):
+    """
+    Test that malformed tokens, foreign keys and other algorithms are rejected.
+    """
+    # Arrange
+    verifier = JWTVerifier({"": get_signer("secret", "HS256")})
+
+    # Act & Assert
+    assert verifier.decode(token) is None
+
+
+def test_verify_tampered_payload():
+    """
+    Test that changing the payload invalidates the signature.
+    """
+    # Arrange
+    verifier = JWTVerifier({"": get_signer("secret", "HS256")})
+    header, _, signature = (
+        get_signer("secret", "HS256").sign({"sub": "user"}).split(".")
+    )
+    payload = b64url(b'{"sub":"admin"}').decode()
+
+    # Act & Assert
+    assert verifier.decode(f"{header}.{payload}.{signature}") is None
+
+
+def test_verify_dispatches_by_kid():
+    """
+    Test that the kid in the header selects the key.
+    """
+    # Arrange
+    verifier = JWTVerifier(
+        {"one": get_signer("first", "HS256"), "two": get_signer("second", "HS384")}
+    )
+    token = get_signer("second", "HS384", kid="two").sign({"sub": "user"})
+
+    # Act
+    claims = verifier.decode(token)
+
+    # Assert
+    assert claims is not None and claims.sub == "user"
+
+
+def test_verify_takes_the_realm_from_the_key():
+    """
+    Test that the realm of the claims is the kid of the verifying key,
+    whatever the payload says.
+    """
+    # Arrange
+    verifier = JWTVerifier(
+        {"": get_signer("secret", "HS256"), "acme": get_signer("acme", "HS256", "acme")}
+    )
+    token = get_signer("acme", "HS256", "acme").sign(
+        {"sub": "user", "realm": "default"}
+    )
+
+    # Act
+    claims = verifier.decode(token)
+
+    # Assert
+    assert claims is not None and claims.realm == "acme"
+
+
+def test_verify_rejects_a_realm_signing_for_another():
+    """
+    Test that a token naming another realm's kid fails with this realm's key.
+    """
+    # Arrange
+    verifier = JWTVerifier(
+        {
+            "acme": get_signer("acme", "HS256", "acme"),
+            "globex": get_signer("globex", "HS256", "globex"),
+        }
+    )
+    token = get_signer("acme", "HS256", "globex").sign({"sub": "user"})
+
+    # Act / Assert
+    assert verifier.decode(token) is None
+
+
+def test_verify_rejects_id_tokens(verifier):
+    """
+    Test that an ID token is not accepted as an access token.
+    """
+    # Arrange
+    token = get_signer("secret", "HS256").sign(
+        {"sub": "user", "iss": "issuer", "aud": "api", "token_use": "id"}
+    )
+
+    # Act & Assert
+    assert verifier.decode(token) is None
+
+
+@pytest.mark.parametrize(
+    "algorithm, private_key",
+    [
+        ("RS256", rsa.generate_private_key(public_exponent=65537, key_size=2048)),
+        ("ES256", ec.generate_private_key(ec.SECP256R1())),
+    ],
+    ids=["RS256", "ES256"],
+)
+def test_asymmetric_round_trip(algorithm, private_key):
+    """
+    Test that RSA and EC tokens verify, with our verifier and with jose
+    holding only the public key, and that a tampered token does not.
+    """
+    # Arrange
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    signer = get_signer(pem, algorithm)
+    verifier = JWTVerifier({"": signer})
+    public_jwk = jwk.construct(pem, algorithm).public_key().to_dict()
+
+    # Act
+    token = signer.sign({"sub": "user", "scope": "read:users"})
+    header, _, signature = token.rpartition(".")
+    tampered = header + "." + signature[::-1]
+
+    # Assert
+    assert verifier.decode(token) == Claims(
+        sub="user", scopes=frozenset({"read:users"})
+    )
+    assert jwt.decode(token, public_jwk, algorithms=[algorithm])["sub"] == "user"
+    assert verifier.decode(tampered) is None
@@ -2,9 +2,11 @@
 This module contains unit tests for the utility functions in app.utils.
 """
 
+import time
 from datetime import UTC, datetime, timedelta
 
 import pytest
+from jose import jwt
 
 from app.utils import (
     authenticate_user,
@@ -44,11 +46,12 @@ def test_verify_password(mock_pwd_context):
     mock_pwd_context.verify.assert_called_once_with("plain_password", "hashed_password")
 
 
-def test_create_access_token(mock_jwt, mock_datetime):
+def test_create_access_token(mock_jwt, mock_datetime, mocker):
     """
     Test the create_access_token function with expiration.
     """
     # Arrange
+    mocker.patch("app.utils.JWT_BACKEND", "jose")
     mock_datetime.now.return_value = datetime(2023, 1, 1, tzinfo=UTC)
     mock_jwt.encode.return_value = "token"
     data = {"sub": "user"}
@@ -65,11 +68,12 @@ def test_create_access_token(mock_jwt, mock_datetime):
     mock_datetime.now.assert_called_once()
 
 
-def test_create_access_token_no_expiration(mock_jwt, mock_datetime):
+def test_create_access_token_no_expiration(mock_jwt, mock_datetime, mocker):
     """
     Test the create_access_token function without expiration.
     """
     # Arrange
+    mocker.patch("app.utils.JWT_BACKEND", "jose")
     mock_datetime.now.return_value = datetime(2023, 1, 1, tzinfo=UTC)
     mock_jwt.encode.return_value = "token"
     data = {"sub": "user"}
@@ -85,6 +89,23 @@ def test_create_access_token_no_expiration(mock_jwt, mock_datetime):
     mock_datetime.now.assert_called_once()
 
 
+def test_create_access_token_builtin_signer():
+    """
+    Test that the cached signer issues tokens jose can verify.
+    """
+    # Arrange
+    data = {"sub": "user", "scope": "read:users"}
+
+    # Act
+    token = create_access_token(data, "secret", "HS256", timedelta(minutes=30))
+
+    # Assert
+    claims = jwt.decode(token, "secret", algorithms=["HS256"])
+    assert claims["sub"] == "user"
+    assert claims["scope"] == "read:users"
+    assert 29 * 60 < claims["exp"] - time.time() <= 30 * 60
+
+
 # def test_get_user():
 #     """
 #     Test the get_user function.